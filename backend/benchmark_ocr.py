@@ -0,0 +1,196 @@
+"""
+MediLens OCR Benchmark - latency, throughput and memory of the /ocr pipeline
+Runs the pipeline over data/sample_prescriptions and writes a JSON report,
+so preprocessing and matching changes can be compared between commits
+
+Usage:
+    python benchmark_ocr.py --profile balanced --pool-sizes 1,2,4 --output ocr_benchmark.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+from ocr_pipeline import (
+    OCRPool, OCRError, PROFILES, DEFAULT_PROFILE, OCR_MODES,
+    run_pipeline, run_pipeline_words, prepare_regions, ocr_regions, merge_regions, engine_name
+)
+
+CORPUS = Path(__file__).parent / "data" / "sample_prescriptions"
+if not CORPUS.exists():
+    CORPUS = Path(__file__).parent.parent / "data" / "sample_prescriptions"
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp", ".webp"}
+STAGES = ["decode", "resize", "analyze", "threshold", "denoise", "detect", "tesseract", "match", "total"]
+
+
+def benchmark_image(contents: bytes, profile: str, mode: str) -> Dict:
+    """One image through the pipeline inside a pool worker; OCR failures are recorded with the stages that ran"""
+    started = time.perf_counter()
+    result = {"error": None, "text": "", "report": {}}
+    try:
+        if mode == "regions":
+            prepared = prepare_regions(contents, profile)
+            result["report"] = report = prepared["preprocessing"]
+            if "regions" in prepared:
+                ocr_started = time.perf_counter()
+                regions = prepared["regions"]
+                prepared["text"] = merge_regions(regions, ocr_regions(regions))
+                report["ocr_ms"] = round((time.perf_counter() - ocr_started) * 1000, 1)
+            result["text"] = prepared["text"]
+        else:
+            pipeline = run_pipeline_words if mode == "words" else run_pipeline
+            output = pipeline(contents, profile)
+            result.update(text=output["text"], report=output["preprocessing"])
+    except OCRError as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        if e.report is not None:
+            result["report"] = e.report
+    result["worker_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def percentiles(values: List[float]) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    array = np.asarray(values, dtype=np.float64)
+    return {
+        "count": len(values),
+        "mean": round(float(array.mean()), 2),
+        "p50": round(float(np.percentile(array, 50)), 2),
+        "p95": round(float(np.percentile(array, 95)), 2),
+        "p99": round(float(np.percentile(array, 99)), 2),
+        "max": round(float(array.max()), 2)
+    }
+
+
+def peak_rss_mb(who: int) -> float:
+    """Peak resident set size in MB (ru_maxrss is KB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(who).ru_maxrss
+    return round(peak / (2**20 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_corpus(images: Dict[str, bytes], workers: int, profile: str, mode: str):
+    """All images through a pool of `workers` processes; returns (results by name, wall seconds, engine)"""
+    pool = OCRPool(workers, queue_size=len(images), timeout=3600)
+    pool.start()
+    try:
+        # Start every worker before timing, so process start-up is not measured
+        engines = await asyncio.gather(*(pool.run(engine_name) for _ in range(workers)))
+        started = time.perf_counter()
+        outputs = await asyncio.gather(*(pool.run(benchmark_image, contents, profile, mode) for contents in images.values()))
+        wall = time.perf_counter() - started
+    finally:
+        pool.executor.shutdown(wait=True)
+    return dict(zip(images, outputs)), wall, engines[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the /ocr pipeline over a folder of prescriptions")
+    parser.add_argument("--corpus", type=Path, default=CORPUS)
+    parser.add_argument("--profile", default=DEFAULT_PROFILE, choices=sorted(PROFILES))
+    parser.add_argument("--mode", default="page", choices=OCR_MODES)
+    parser.add_argument("--pool-sizes", default="1,2,4", help="Comma-separated worker counts for the throughput runs")
+    parser.add_argument("--limit", type=int, default=None, help="Only the first N images")
+    parser.add_argument("--no-match", action="store_true", help="Skip loading the drug database and extract_medicine_names")
+    parser.add_argument("--output", type=Path, default=Path("ocr_benchmark.json"))
+    args = parser.parse_args()
+
+    paths = sorted(p for p in args.corpus.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)[:args.limit]
+    images = {p.name: p.read_bytes() for p in paths}
+    pool_sizes = [int(size) for size in args.pool_sizes.split(",")]
+    print(f"📂 {len(images)} images from {args.corpus}, profile '{args.profile}', mode '{args.mode}'")
+
+    # Stage latencies come from the first run; later runs only measure throughput
+    throughput = []
+    results = None
+    engine = None
+    for workers in pool_sizes:
+        run_results, wall, engine = asyncio.run(run_corpus(images, workers, args.profile, args.mode))
+        results = results or run_results
+        throughput.append({
+            "workers": workers,
+            "wall_s": round(wall, 2),
+            "images_per_s": round(len(images) / wall, 2) if wall else None
+        })
+        print(f"⏱️ {workers} worker(s): {len(images)} images in {wall:.1f} s ({len(images) / wall:.2f} img/s)")
+
+    match_ms = {}
+    if not args.no_match:
+        import main as api
+        with contextlib.redirect_stdout(io.StringIO()):
+            api.load_data()
+            for name, result in results.items():
+                if result["error"] is None:
+                    started = time.perf_counter()
+                    result["medicines"] = api.extract_medicine_names(api.clean_ocr_text(result["text"]))
+                    match_ms[name] = (time.perf_counter() - started) * 1000
+
+    stage_values = {stage: [] for stage in STAGES}
+    per_image = []
+    for name, result in results.items():
+        report = result["report"]
+        stages = {stage: report[f"{stage}_ms"] for stage in STAGES if f"{stage}_ms" in report}
+        if "ocr_ms" in report:
+            stages["tesseract"] = report["ocr_ms"]
+        if name in match_ms:
+            stages["match"] = round(match_ms[name], 2)
+        stages["total"] = round(result["worker_ms"] + match_ms.get(name, 0.0), 1)
+        for stage, value in stages.items():
+            stage_values[stage].append(value)
+        per_image.append({
+            "image": name,
+            "bytes": len(images[name]),
+            "error": result["error"],
+            "stages_ms": stages,
+            "preprocessing": {k: v for k, v in report.items() if not k.endswith("_ms")},
+            "detected_medicines": result.get("medicines")
+        })
+
+    summary = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": {
+            "corpus": str(args.corpus), "images": len(images), "profile": args.profile,
+            "mode": args.mode, "engine": engine, "match": not args.no_match
+        },
+        "failed": sum(result["error"] is not None for result in results.values()),
+        "stages_ms": {stage: percentiles(values) for stage, values in stage_values.items()},
+        "throughput": throughput,
+        "peak_rss_mb": {"benchmark_process": peak_rss_mb(resource.RUSAGE_SELF), "largest_worker": peak_rss_mb(resource.RUSAGE_CHILDREN)},
+        "per_image": per_image
+    }
+    args.output.write_text(json.dumps(summary, indent=2))
+
+    for stage, stats in summary["stages_ms"].items():
+        if stats:
+            print(f"   {stage:<10} p50 {stats['p50']:>9.1f} ms   p95 {stats['p95']:>9.1f} ms   p99 {stats['p99']:>9.1f} ms")
+    if summary["failed"]:
+        print(f"⚠️ {summary['failed']} image(s) failed; first error: {next(r['error'] for r in results.values() if r['error'])}")
+    print(f"🧠 Peak RSS: {summary['peak_rss_mb']}")
+    print(f"💾 Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
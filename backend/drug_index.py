@@ -0,0 +1,391 @@
+"""
+MediLens Drug Index - precomputed lookup structures over the drug database
+Built once by load_data() so request handlers never rescan drugs_df
+"""
+
+from bisect import bisect_left
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+from drug_store import TextColumn, TextLookup
+
+# Sorts after every character that can follow a prefix, closes prefix ranges
+PREFIX_SENTINEL = "\U0010ffff"
+SCAN_CHUNK = 1 << 18  # Bytes of the value buffer compared per step by SubstringIndex._scan
+
+
+def normalize_name(name: str) -> str:
+    """Normalize a medicine name for exact and prefix lookups"""
+    return str(name).lower()
+
+
+def _group_rows(values: pd.Series, key_func, sort_keys: bool = False):
+    """
+    Group row ids by key_func(value), skipping missing values
+
+    Returns (keys, offsets, rows): the row ids of keys[i] are
+    rows[offsets[i]:offsets[i + 1]], in table order.
+    """
+    groups = {}
+    for row, value in enumerate(values.tolist()):
+        if isinstance(value, str):
+            groups.setdefault(key_func(value), []).append(row)
+
+    keys = sorted(groups) if sort_keys else list(groups)
+    counts = np.fromiter((len(groups[key]) for key in keys), dtype=np.int64, count=len(keys))
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    rows = np.fromiter(
+        (row for key in keys for row in groups[key]),
+        dtype=np.int32,
+        count=int(offsets[-1])
+    )
+    return keys, offsets, rows
+
+
+def _flatten(lists: List[List[int]]):
+    """(offsets, values) of lists of ints: lists[i] is values[offsets[i]:offsets[i + 1]]"""
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    np.cumsum([len(values) for values in lists], out=offsets[1:])
+    values = np.fromiter((value for values in lists for value in values), dtype=np.int32, count=int(offsets[-1]))
+    return offsets, values
+
+
+def _first_rows(rows: np.ndarray, limit: Optional[int]) -> np.ndarray:
+    """Return row ids in table order, optionally truncated to the first `limit`"""
+    rows = np.sort(rows)
+    return rows if limit is None else rows[:limit]
+
+
+class BrandIndex:
+    """
+    Exact and prefix lookups over brand names
+
+    Unique normalized names are kept sorted in one TextColumn. The row ids of
+    each name live in one flat array, sliced by per-key offsets, so an exact
+    name is one binary search and a prefix a contiguous key range found with two.
+    """
+
+    def __init__(self, names: pd.Series):
+        keys, self.offsets, self.rows = _group_rows(names, normalize_name, sort_keys=True)
+        self.keys = TextColumn.from_strings(keys)
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Arrays from_arrays() restores the index from, for the database snapshot"""
+        return {**self.keys.arrays("keys"), "offsets": self.offsets, "rows": self.rows}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "BrandIndex":
+        index = cls.__new__(cls)
+        index.keys = TextColumn.from_arrays(arrays, "keys")
+        index.offsets, index.rows = arrays["offsets"], arrays["rows"]
+        return index
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def exact(self, query: str, limit: Optional[int] = None) -> np.ndarray:
+        """Row ids whose brand name equals query (case-insensitive), in table order"""
+        key = normalize_name(query)
+        key_id = bisect_left(self.keys, key)
+        if key_id == len(self.keys) or self.keys[key_id] != key:
+            return self.rows[:0]
+        rows = self.rows[self.offsets[key_id]:self.offsets[key_id + 1]]
+        return rows if limit is None else rows[:limit]
+
+    def prefix(self, query: str, limit: Optional[int] = None) -> np.ndarray:
+        """Row ids whose brand name starts with query (case-insensitive), in table order"""
+        prefix = normalize_name(query)
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + PREFIX_SENTINEL, lo)
+        if lo == hi:
+            return self.rows[:0]
+        return _first_rows(self.rows[self.offsets[lo]:self.offsets[hi]], limit)
+
+
+class SubstringIndex:
+    """
+    N-gram inverted index answering case-insensitive substring queries
+
+    Returns exactly the rows str.contains(query, case=False, regex=False)
+    would, but only intersects the posting lists of the query's n-grams and
+    verifies the few surviving candidates. Distinct values are indexed once,
+    which keeps repetitive columns like generic_name small. Values, n-grams
+    and posting lists are flat arrays.
+    """
+
+    def __init__(self, values: pd.Series, n: int = 3):
+        self.n = n
+        # upper() mirrors how pandas folds case for str.contains(case=False)
+        values, self.offsets, self.rows = _group_rows(values, str.upper)
+        self.values = TextColumn.from_strings(values)
+
+        postings = {}
+        for value_id, value in enumerate(values):
+            for gram in {value[i:i + n] for i in range(len(value) - n + 1)}:
+                postings.setdefault(gram, []).append(value_id)
+        # The posting list of grams[i] is posting_ids[posting_offsets[i]:posting_offsets[i + 1]]
+        self.grams = TextLookup.build(TextColumn.from_strings(list(postings)))
+        self.posting_offsets, self.posting_ids = _flatten(list(postings.values()))
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Arrays from_arrays() restores the index from, for the database snapshot"""
+        return {
+            "n": np.asarray(self.n), **self.values.arrays("values"), "offsets": self.offsets, "rows": self.rows,
+            **self.grams.arrays("grams"), "posting_offsets": self.posting_offsets, "posting_ids": self.posting_ids
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "SubstringIndex":
+        index = cls.__new__(cls)
+        index.n = int(arrays["n"])
+        index.values = TextColumn.from_arrays(arrays, "values")
+        index.offsets, index.rows = arrays["offsets"], arrays["rows"]
+        index.grams = TextLookup.from_arrays(arrays, "grams")
+        index.posting_offsets, index.posting_ids = arrays["posting_offsets"], arrays["posting_ids"]
+        return index
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def _scan(self, query: str, limit: Optional[int] = None) -> np.ndarray:
+        """
+        Value ids containing a query too short for n-grams, ascending
+        Compares the value buffer byte by byte, a chunk at a time, until `limit` values matched
+        """
+        needle = np.frombuffer(query.encode("utf-8"), dtype=np.uint8)
+        buffer, bounds = self.values.buffer, self.values.offsets
+        found = []
+        for start in range(0, len(buffer), SCAN_CHUNK):
+            window = buffer[start:start + SCAN_CHUNK + len(needle) - 1]
+            count = len(window) - len(needle) + 1
+            hits = window[:count] == needle[0]
+            for i in range(1, len(needle)):
+                hits &= window[i:i + count] == needle[i]
+            positions = start + np.flatnonzero(hits)
+            value_ids = np.searchsorted(bounds, positions, side="right") - 1
+            # Matches running into the next value do not count
+            found.append(value_ids[positions + len(needle) <= bounds[value_ids + 1]])
+            if limit is not None and len(np.unique(np.concatenate(found))) >= limit:
+                break
+        return np.unique(np.concatenate(found)) if found else np.zeros(0, dtype=np.int64)
+
+    def _candidates(self, query: str, limit: Optional[int] = None):
+        """Value ids that may contain query, ascending"""
+        if not query:
+            return range(len(self.values))
+        if len(query) < self.n:
+            return self._scan(query, limit).tolist()
+
+        lists = []
+        for gram in {query[i:i + self.n] for i in range(len(query) - self.n + 1)}:
+            gram_id = self.grams.get(gram)
+            if gram_id is None:
+                return ()
+            lists.append(self.posting_ids[self.posting_offsets[gram_id]:self.posting_offsets[gram_id + 1]])
+
+        lists.sort(key=len)
+        candidates = lists[0]
+        for posting in lists[1:]:
+            candidates = np.intersect1d(candidates, posting, assume_unique=True)
+            if len(candidates) == 0:
+                break
+        return candidates.tolist()
+
+    def contains(self, query: str, limit: Optional[int] = None) -> np.ndarray:
+        """Row ids whose value contains query (case-insensitive), in table order"""
+        query = str(query).upper()
+        short = len(query) < self.n  # Candidates of a short query already contain it
+        matched = []
+        for value_id in self._candidates(query, limit):
+            if short or query in self.values[value_id]:
+                matched.append(self.rows[self.offsets[value_id]:self.offsets[value_id + 1]])
+                # Values are numbered by first occurrence, so once `limit` values
+                # matched no later value can contribute an earlier row
+                if limit is not None and len(matched) >= limit:
+                    break
+        if not matched:
+            return self.rows[:0]
+        return _first_rows(np.concatenate(matched), limit)
+
+
+class GenericGroups:
+    """
+    Generic-equivalence groups: brands sharing an identical salt composition
+
+    Rows of each group are stored cheapest first (unpriced rows last, ties in
+    table order), so "cheapest alternatives" is a slice of a precomputed array.
+    Brand names are read from the table's own column when a group is sliced.
+    """
+
+    def __init__(self, generic_names: pd.Series, brand_names: pd.Series, prices: pd.Series):
+        codes, names = pd.factorize(generic_names.array)
+        self.names = TextLookup.build(TextColumn.from_strings([str(name) for name in names]))
+        self.brand_names = brand_names.array
+
+        prices = pd.to_numeric(prices, errors="coerce").to_numpy(dtype=np.float64)
+        priced = ~np.isnan(prices)
+        sort_prices = np.where(priced, prices, np.inf)
+        row_ids = np.arange(len(codes), dtype=np.int32)
+
+        grouped = codes >= 0  # factorize marks missing compositions with -1
+        order = np.lexsort((row_ids[grouped], sort_prices[grouped], codes[grouped]))
+        self.rows = row_ids[grouped][order]
+
+        counts = np.bincount(codes[grouped], minlength=len(self.names))
+        self.offsets = np.zeros(len(self.names) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.offsets[1:])
+        self.priced_counts = np.bincount(codes[grouped & priced], minlength=len(self.names))
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Arrays from_arrays() restores the groups from, for the database snapshot"""
+        return {**self.names.arrays("names"), "rows": self.rows, "offsets": self.offsets,
+                "priced_counts": self.priced_counts}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], brand_names: pd.Series) -> "GenericGroups":
+        groups = cls.__new__(cls)
+        groups.names = TextLookup.from_arrays(arrays, "names")
+        groups.brand_names = brand_names.array
+        groups.rows, groups.offsets, groups.priced_counts = arrays["rows"], arrays["offsets"], arrays["priced_counts"]
+        return groups
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def alternatives(self, generic_name: str, exclude_brand: Optional[str] = None,
+                     limit: int = 10, priced_only: bool = False) -> np.ndarray:
+        """Cheapest rows with the same composition, skipping rows named exclude_brand"""
+        group_id = self.names.get(generic_name) if isinstance(generic_name, str) else None
+        if group_id is None:
+            return self.rows[:0]
+        start = self.offsets[group_id]
+        end = start + self.priced_counts[group_id] if priced_only else self.offsets[group_id + 1]
+
+        picked = []
+        for row in self.rows[start:end].tolist():
+            if self.brand_names[row] != exclude_brand:
+                picked.append(row)
+                if len(picked) >= limit:
+                    break
+        return np.array(picked, dtype=np.int32)
+
+
+class SuggestIndex:
+    """
+    Typeahead over brand names with the top-k names of every busy prefix precomputed
+
+    Names are ranked by popularity, using the number of listings (packs,
+    strengths, sellers) under a brand name as the proxy, then shorter names
+    first. Prefixes matching more than `precompute_above` names get their top
+    names stored at build time; narrower prefixes are ranked on the fly, which
+    touches at most that many names. An exact name match is always listed first.
+    Display fields are read from each name's first row of the table.
+    """
+
+    def __init__(self, brand_index: BrandIndex, brand_names: pd.Series, generic_names: Optional[pd.Series],
+                 prices: pd.Series, k: int = 10, precompute_above: int = 64):
+        self.keys = brand_index.keys
+        self.k = k
+        self.precompute_above = precompute_above
+
+        # Display fields come from each name's first row, as in search results
+        self.first_rows = brand_index.rows[brand_index.offsets[:-1]]
+        keys = self.keys.tolist()
+        listings = np.diff(brand_index.offsets)
+        lengths = np.fromiter((len(key) for key in keys), dtype=np.int64, count=len(keys))
+        order = np.lexsort((np.arange(len(keys)), lengths, -listings))
+        self.ranks = np.empty(len(keys), dtype=np.int32)
+        self.ranks[order] = np.arange(len(keys), dtype=np.int32)
+
+        self.brand_names = brand_names.array
+        self.generic_names = generic_names.array if generic_names is not None else None
+        self.prices = pd.to_numeric(prices, errors="coerce").to_numpy(dtype=np.float64)[self.first_rows]
+
+        # Top k + 1 names (one spare for the exact match) of every prefix wider than precompute_above
+        top: Dict[str, np.ndarray] = {}
+        ranges = [(0, len(keys))]
+        depth = 0
+        while ranges:
+            depth += 1
+            narrower = []
+            for lo, hi in ranges:
+                start = lo
+                while start < hi:
+                    prefix = keys[start][:depth]
+                    if len(prefix) < depth:
+                        start += 1  # The name is this prefix's parent; it ranks within the parent range
+                        continue
+                    end = bisect_left(keys, prefix + PREFIX_SENTINEL, start, hi)
+                    if end - start > precompute_above:
+                        top[prefix] = self._rank(start, end, k + 1)
+                        narrower.append((start, end))
+                    start = end
+            ranges = narrower
+        # The top names of prefix i are top_ids[top_offsets[i]:top_offsets[i + 1]]
+        self.prefixes = TextLookup.build(TextColumn.from_strings(list(top)))
+        self.top_offsets, self.top_ids = _flatten([ids.tolist() for ids in top.values()])
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Arrays from_arrays() restores the index from, for the database snapshot"""
+        return {
+            "k": np.asarray(self.k), "precompute_above": np.asarray(self.precompute_above),
+            "first_rows": self.first_rows, "ranks": self.ranks, "prices": self.prices,
+            **self.prefixes.arrays("prefixes"), "top_offsets": self.top_offsets, "top_ids": self.top_ids
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], brand_index: BrandIndex, brand_names: pd.Series,
+                    generic_names: Optional[pd.Series], k: int = 10) -> "SuggestIndex":
+        """The index saved by to_arrays(); raises ValueError when it was built for another k"""
+        if int(arrays["k"]) != k:
+            raise ValueError(f"saved for k={int(arrays['k'])}, not {k}")
+        index = cls.__new__(cls)
+        index.keys = brand_index.keys
+        index.k, index.precompute_above = k, int(arrays["precompute_above"])
+        index.first_rows, index.ranks, index.prices = arrays["first_rows"], arrays["ranks"], arrays["prices"]
+        index.brand_names = brand_names.array
+        index.generic_names = generic_names.array if generic_names is not None else None
+        index.prefixes = TextLookup.from_arrays(arrays, "prefixes")
+        index.top_offsets, index.top_ids = arrays["top_offsets"], arrays["top_ids"]
+        return index
+
+    def __len__(self) -> int:
+        return len(self.prefixes)
+
+    def _rank(self, lo: int, hi: int, count: int) -> np.ndarray:
+        """Key ids in [lo, hi) with the best ranks, best first"""
+        ranks = self.ranks[lo:hi]
+        if hi - lo > count:
+            best = np.argpartition(ranks, count)[:count]
+            return (lo + best[np.argsort(ranks[best])]).astype(np.int32)
+        return (lo + np.argsort(ranks)).astype(np.int32)
+
+    def _entry(self, key_id: int) -> Dict:
+        """brand_name / generic_name / price of a name, from its first row"""
+        row = int(self.first_rows[key_id])
+        salt = self.generic_names[row] if self.generic_names is not None else None
+        price = self.prices[key_id]
+        return {
+            "brand_name": self.brand_names[row],
+            "generic_name": salt if isinstance(salt, str) else "",
+            "price": None if np.isnan(price) else float(price)
+        }
+
+    def suggest(self, query: str, limit: int = 10) -> List[Dict]:
+        """Best names starting with query (case-insensitive), exact match first, with salt and price"""
+        prefix = normalize_name(query)
+        limit = min(limit, self.k)
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + PREFIX_SENTINEL, lo)
+        if lo == hi or limit <= 0:
+            return []
+        prefix_id = self.prefixes.get(prefix)
+        if prefix_id is None:
+            top = self._rank(lo, hi, limit + 1)
+        else:
+            top = self.top_ids[self.top_offsets[prefix_id]:self.top_offsets[prefix_id + 1]]
+        exact = self.keys[lo] == prefix
+        picked = [lo] if exact else []
+        picked.extend(key_id for key_id in top.tolist() if not (exact and key_id == lo))
+        return [self._entry(key_id) for key_id in picked[:limit]]
@@ -0,0 +1,172 @@
+"""
+MediLens Drug Interactions - the drug_interactions column, parsed once
+Every row's {"drug": [...], "brand": [...], "effect": [...]} JSON is parsed by
+load_data() into interned ids held in flat arrays, so requests (and the
+interaction checker) never run json.loads
+"""
+
+import json
+from typing import Dict, List, Optional, Tuple, Union
+import numpy as np
+from drug_store import TextColumn
+
+INTERACTION_KEYS = ["drug", "brand", "effect"]
+
+
+def format_interactions(data: Dict) -> str:
+    """Display string for an interactions dict: "drug: effect; drug: effect" """
+    interaction_items = []
+    for i, d in enumerate(data.get('drug', [])):
+        effect = data.get('effect', [])[i] if i < len(data.get('effect', [])) else 'Unknown'
+        interaction_items.append(f"{d}: {effect}")
+    return "; ".join(interaction_items)
+
+
+class InteractionTable:
+    """
+    Interactions of every row as interned ids in CSR layout
+
+    Row i interacts with drugs[drug_ids[k]] (listed with brand
+    brands[brand_ids[k]], severity effects[effect_codes[k]]) for k in
+    offsets[i]:offsets[i + 1]. The interned names are TextColumns. Rows
+    whose JSON is not the usual three equal-length string lists are listed
+    in `irregular_rows` and parsed from the source texts on request, as before.
+    """
+
+    def __init__(self, texts):
+        """texts: anything with len() and get(row) -> Optional[str], e.g. a TextColumn"""
+        self.texts = texts
+        self._tables: Tuple[List[str], List[str], List[str]] = ([], [], [])
+        self._codes: Tuple[Dict[str, int], Dict[str, int], Dict[str, int]] = ({}, {}, {})
+        irregular: List[int] = []
+
+        rows = len(texts)
+        self.has_data = np.zeros(rows, dtype=bool)  # Row has a regular interactions object (maybe empty)
+        self.offsets = np.zeros(rows + 1, dtype=np.int64)
+        drug_ids: List[int] = []
+        brand_ids: List[int] = []
+        effect_codes: List[int] = []
+        parsed: Dict[str, Optional[Tuple]] = {}  # Identical blobs are common; parse each once
+
+        for row in range(rows):
+            raw = texts.get(row)
+            if raw is not None and raw.startswith('{'):
+                if raw not in parsed:
+                    parsed[raw] = self._intern(raw)
+                entries = parsed[raw]
+                if entries is None:
+                    irregular.append(row)
+                else:
+                    self.has_data[row] = True
+                    drug_ids.extend(entries[0])
+                    brand_ids.extend(entries[1])
+                    effect_codes.extend(entries[2])
+            self.offsets[row + 1] = len(drug_ids)
+
+        self.irregular_rows = np.array(irregular, dtype=np.int64)
+        self.drug_ids = np.array(drug_ids, dtype=np.int32)
+        self.brand_ids = np.array(brand_ids, dtype=np.int32)
+        self.drugs, self.brands, self.effects = (TextColumn.from_strings(table) for table in self._tables)
+        self.effect_codes = np.array(effect_codes, dtype=np.uint8 if len(self.effects) < 256 else np.int32)
+        del self._tables, self._codes  # Only needed while interning
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Arrays from_arrays() restores the table from, for the database snapshot"""
+        return {
+            "has_data": self.has_data, "offsets": self.offsets, "irregular_rows": self.irregular_rows,
+            "drug_ids": self.drug_ids, "brand_ids": self.brand_ids, "effect_codes": self.effect_codes,
+            **self.drugs.arrays("drugs"), **self.brands.arrays("brands"), **self.effects.arrays("effects")
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], texts) -> "InteractionTable":
+        """texts: the column the table was parsed from, read for irregular rows"""
+        table = cls.__new__(cls)
+        table.texts = texts
+        table.has_data, table.offsets, table.irregular_rows = arrays["has_data"], arrays["offsets"], arrays["irregular_rows"]
+        table.drug_ids, table.brand_ids, table.effect_codes = arrays["drug_ids"], arrays["brand_ids"], arrays["effect_codes"]
+        table.drugs, table.brands, table.effects = (TextColumn.from_arrays(arrays, name) for name in ("drugs", "brands", "effects"))
+        return table
+
+    def _intern(self, raw: str) -> Optional[Tuple[List[int], List[int], List[int]]]:
+        """(drug ids, brand ids, effect codes) of one JSON blob; None when it is not the regular shape"""
+        try:
+            data = json.loads(raw)
+        except Exception:
+            return None
+        if not isinstance(data, dict) or list(data) != INTERACTION_KEYS:
+            return None
+        columns = [data[key] for key in INTERACTION_KEYS]
+        if any(not isinstance(values, list) or len(values) != len(columns[0]) for values in columns):
+            return None
+        if any(not isinstance(value, str) for values in columns for value in values):
+            return None
+
+        interned = []
+        for values, table, codes in zip(columns, self._tables, self._codes):
+            ids = []
+            for value in values:
+                code = codes.get(value)
+                if code is None:
+                    code = codes[value] = len(table)
+                    table.append(value)
+                ids.append(code)
+            interned.append(ids)
+        return tuple(interned)
+
+    def __len__(self) -> int:
+        return len(self.has_data)
+
+    @property
+    def nbytes(self) -> int:
+        return (self.offsets.nbytes + self.drug_ids.nbytes + self.brand_ids.nbytes + self.effect_codes.nbytes
+                + self.has_data.nbytes + self.irregular_rows.nbytes
+                + sum(table.buffer.nbytes + table.offsets.nbytes for table in (self.drugs, self.brands, self.effects)))
+
+    def _irregular(self, row: int) -> Optional[str]:
+        """Raw text of an irregular row, None for any other row"""
+        i = int(np.searchsorted(self.irregular_rows, row))
+        if i < len(self.irregular_rows) and self.irregular_rows[i] == row:
+            return self.texts.get(row)
+        return None
+
+    def entries(self, row: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(drug ids, effect codes) of a row; empty for irregular rows and rows without data"""
+        start, end = self.offsets[row], self.offsets[row + 1]
+        return self.drug_ids[start:end], self.effect_codes[start:end]
+
+    def data(self, row: int) -> Union[Dict, str, None]:
+        """
+        The row's interactions as the JSON object it was parsed from
+        Raw text when the JSON does not parse, None when there is none
+        """
+        if self.has_data[row]:
+            start, end = self.offsets[row], self.offsets[row + 1]
+            return {
+                "drug": [self.drugs[i] for i in self.drug_ids[start:end].tolist()],
+                "brand": [self.brands[i] for i in self.brand_ids[start:end].tolist()],
+                "effect": [self.effects[i] for i in self.effect_codes[start:end].tolist()]
+            }
+        raw = self._irregular(row)
+        if raw is None:
+            return None
+        try:
+            return json.loads(raw)
+        except Exception:
+            return raw
+
+    def text(self, row: int) -> str:
+        """Display string of the row's interactions ("drug: effect; ..."), raw text when the JSON does not parse"""
+        if self.has_data[row]:
+            drug_ids, effect_codes = self.entries(row)
+            return "; ".join(
+                f"{self.drugs[d]}: {self.effects[e]}" for d, e in zip(drug_ids.tolist(), effect_codes.tolist())
+            )
+        raw = self._irregular(row)
+        if raw is None:
+            return ""
+        try:
+            data = json.loads(raw)
+            return format_interactions(data) if data and 'drug' in data else ""
+        except Exception:
+            return raw
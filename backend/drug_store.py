@@ -0,0 +1,450 @@
+"""
+MediLens Drug Store - compact storage and binary snapshots of the drug database
+Lets load_data() skip the CSV parse and cleanup on every boot after the first,
+and keeps strings in flat buffers rather than Python objects, so forked workers
+share them instead of copying the pages they read
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from pandas.api.extensions import ExtensionArray, ExtensionDtype, take
+from pandas.api.types import is_integer
+
+SNAPSHOT_VERSION = 3  # Bump when the snapshot layout, an index layout or the cleanup in load_data() changes
+HASH_CHUNK = 1 << 20
+
+# Long free text kept out of the DataFrame and decoded only when a response needs it
+TEXT_COLUMNS = ['use_case', 'side_effects', 'interactions']
+
+
+def file_sha256(path: Path) -> str:
+    """SHA-256 of a file, streamed in 1 MB chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def snapshot_key(source_sha256: str, column_map: Dict[str, str]) -> str:
+    """Version key of a snapshot: source content + column mapping + snapshot layout"""
+    payload = json.dumps(
+        {"source": source_sha256, "columns": column_map, "version": SNAPSHOT_VERSION},
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def resident_memory_mb() -> Optional[float]:
+    """Current resident set size of this process in MB (Linux only)"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class TextColumn:
+    """
+    A column of strings held in one contiguous UTF-8 buffer
+
+    Row i is buffer[offsets[i]:offsets[i + 1]]; missing rows are flagged in
+    a boolean mask. Buffers may be memory-mapped straight from a snapshot.
+    Indexing and len() make a sorted column searchable with bisect.
+    """
+
+    def __init__(self, buffer: np.ndarray, offsets: np.ndarray, missing: np.ndarray):
+        self.buffer = buffer
+        self.offsets = offsets
+        self.missing = missing
+
+    @classmethod
+    def from_strings(cls, values: List[Optional[str]]) -> "TextColumn":
+        """Build from a list of strings, None for missing"""
+        encoded = [b"" if value is None else value.encode("utf-8") for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        buffer = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        missing = np.fromiter((value is None for value in values), dtype=bool, count=len(values))
+        return cls(buffer, offsets, missing)
+
+    @classmethod
+    def from_series(cls, series: pd.Series) -> "TextColumn":
+        missing = series.isna().to_numpy()
+        return cls.from_strings([None if is_missing else str(value)
+                                 for value, is_missing in zip(series.tolist(), missing)])
+
+    def arrays(self, name: str) -> Dict[str, np.ndarray]:
+        """The column's arrays under name.*, for SnapshotStore.save_indexes()"""
+        return {f"{name}.buffer": self.buffer, f"{name}.offsets": self.offsets, f"{name}.missing": self.missing}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], name: str) -> "TextColumn":
+        return cls(arrays[f"{name}.buffer"], arrays[f"{name}.offsets"], arrays[f"{name}.missing"])
+
+    def __len__(self) -> int:
+        return len(self.missing)
+
+    @property
+    def nbytes(self) -> int:
+        return self.buffer.nbytes + self.offsets.nbytes + self.missing.nbytes
+
+    def get(self, row: int) -> Optional[str]:
+        """Decode one row, None when missing"""
+        if self.missing[row]:
+            return None
+        return self.buffer[self.offsets[row]:self.offsets[row + 1]].tobytes().decode("utf-8")
+
+    __getitem__ = get
+
+    def encoded(self, row: int) -> bytes:
+        """UTF-8 bytes of one row, b"" when missing"""
+        return self.buffer[self.offsets[row]:self.offsets[row + 1]].tobytes()
+
+    def take(self, rows) -> List[Optional[str]]:
+        """Decode several rows"""
+        return [self.get(row) for row in rows]
+
+    def tolist(self) -> List[Optional[str]]:
+        """Decode every row in one pass over the buffer"""
+        data = self.buffer.tobytes()
+        bounds = self.offsets.tolist()
+        return [None if is_missing else data[start:end].decode("utf-8")
+                for start, end, is_missing in zip(bounds, bounds[1:], self.missing.tolist())]
+
+
+def text_key(value: bytes) -> int:
+    """Stable 32-bit key of a UTF-8 string; collisions are resolved by comparing the text"""
+    return zlib.crc32(value)
+
+
+class TextLookup:
+    """
+    String -> row lookups over a TextColumn, without a Python dict
+
+    The crc32 of every indexed row is kept sorted next to its row id; a lookup
+    binary-searches the key and compares the text of the few candidates.
+    When several rows hold the same string the lowest row id is returned.
+    """
+
+    def __init__(self, texts: TextColumn, keys: np.ndarray, ids: np.ndarray):
+        self.texts = texts
+        self.keys = keys
+        self.ids = ids
+
+    @classmethod
+    def build(cls, texts: TextColumn, ids: Optional[np.ndarray] = None) -> "TextLookup":
+        """Index rows `ids` of texts (all rows by default)"""
+        ids = np.arange(len(texts), dtype=np.int32) if ids is None else np.asarray(ids, dtype=np.int32)
+        data = texts.buffer.tobytes()
+        bounds = texts.offsets.tolist()
+        keys = np.fromiter((text_key(data[bounds[row]:bounds[row + 1]]) for row in ids.tolist()),
+                           dtype=np.uint32, count=len(ids))
+        order = np.argsort(keys, kind="stable")
+        return cls(texts, keys[order], ids[order])
+
+    def arrays(self, name: str) -> Dict[str, np.ndarray]:
+        """The lookup's arrays, its texts included, under name.*"""
+        return {**self.texts.arrays(f"{name}.texts"), f"{name}.keys": self.keys, f"{name}.ids": self.ids}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], name: str) -> "TextLookup":
+        return cls(TextColumn.from_arrays(arrays, f"{name}.texts"), arrays[f"{name}.keys"], arrays[f"{name}.ids"])
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def get(self, value: str) -> Optional[int]:
+        """Row id holding value, None when it is not indexed"""
+        encoded = value.encode("utf-8")
+        key = text_key(encoded)
+        i = int(np.searchsorted(self.keys, key))
+        while i < len(self.keys) and self.keys[i] == key:
+            row = int(self.ids[i])
+            if not self.texts.missing[row] and self.texts.encoded(row) == encoded:
+                return row
+            i += 1
+        return None
+
+    def __contains__(self, value: str) -> bool:
+        return self.get(value) is not None
+
+
+class TextDtype(ExtensionDtype):
+    """pandas dtype of TextArray columns"""
+
+    name = "text"
+    type = str
+    na_value = np.nan
+
+    @classmethod
+    def construct_array_type(cls):
+        return TextArray
+
+
+class TextArray(ExtensionArray):
+    """
+    A string column of a DataFrame stored as codes into a TextColumn of its distinct values
+
+    Like a categorical, except that the labels are one UTF-8 buffer rather
+    than Python strings, so codes and labels can be memory-mapped from a
+    snapshot and shared by forked workers. Missing rows have code -1 and
+    read as NaN, as in a categorical.
+    """
+
+    _dtype = TextDtype()
+
+    def __init__(self, codes: np.ndarray, labels: TextColumn):
+        self.codes = codes
+        self.labels = labels
+
+    @classmethod
+    def from_series(cls, series: pd.Series) -> "TextArray":
+        codes, uniques = pd.factorize(series)
+        return cls(codes.astype(np.int32), TextColumn.from_strings([str(value) for value in uniques]))
+
+    @classmethod
+    def _from_sequence(cls, scalars, *, dtype=None, copy=False):
+        return cls.from_series(pd.Series(list(scalars), dtype=object))
+
+    @classmethod
+    def _from_factorized(cls, values, original):
+        return cls(values.astype(np.int32), original.labels)
+
+    def _values_for_factorize(self):
+        # Labels are distinct, so equal codes mean equal strings
+        return self.codes.astype(np.int64), -1
+
+    @property
+    def dtype(self) -> TextDtype:
+        return self._dtype
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.labels.nbytes
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, item):
+        if is_integer(item):
+            code = self.codes[item]
+            return np.nan if code < 0 else self.labels.get(int(code))
+        if not isinstance(item, slice):
+            item = pd.api.indexers.check_array_indexer(self, item)
+        return type(self)(self.codes[item], self.labels)
+
+    def isna(self) -> np.ndarray:
+        return self.codes < 0
+
+    def take(self, indices, allow_fill: bool = False, fill_value=None) -> "TextArray":
+        if allow_fill and fill_value is not None and not pd.isna(fill_value):
+            raise ValueError("TextArray can only be filled with missing values")
+        return type(self)(take(self.codes, indices, allow_fill=allow_fill, fill_value=-1), self.labels)
+
+    def copy(self) -> "TextArray":
+        return type(self)(self.codes.copy(), self.labels)
+
+    @classmethod
+    def _concat_same_type(cls, to_concat):
+        to_concat = list(to_concat)
+        if all(array.labels is to_concat[0].labels for array in to_concat):
+            return cls(np.concatenate([array.codes for array in to_concat]), to_concat[0].labels)
+        return cls._from_sequence([value for array in to_concat for value in array.tolist()])
+
+    def tolist(self) -> list:
+        if len(self.codes) * 4 < len(self.labels):
+            # A few rows of a big column: decode just those labels
+            return [np.nan if code < 0 else self.labels.get(code) for code in self.codes.tolist()]
+        labels = self.labels.tolist()
+        return [np.nan if code < 0 else labels[code] for code in self.codes.tolist()]
+
+    def __array__(self, dtype=None, copy=None):
+        values = np.empty(len(self.codes), dtype=object)
+        values[:] = self.tolist()
+        return values if dtype is None else values.astype(dtype)
+
+
+def compact_table(df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, TextColumn]]:
+    """Store string columns as TextArrays and move long text into TextColumns"""
+    texts = {column: TextColumn.from_series(df[column]) for column in TEXT_COLUMNS if column in df.columns}
+    df = df.drop(columns=list(texts))
+    for column in df.columns:
+        if df[column].dtype.kind not in "biuf":
+            df[column] = TextArray.from_series(df[column])
+    return df, texts
+
+
+def table_nbytes(df: pd.DataFrame, texts: Dict[str, TextColumn] = None) -> int:
+    """Deep memory footprint of a table and its text columns"""
+    return int(df.memory_usage(deep=True).sum()) + sum(text.nbytes for text in (texts or {}).values())
+
+
+def _read_manifest(directory: Path) -> Optional[Dict]:
+    try:
+        with open(directory / "manifest.json", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class SnapshotStore:
+    """
+    Versioned on-disk snapshots of the compacted drug table and its indexes
+
+    Each snapshot is a directory of .npy files, all memory-mapped on load:
+    numeric columns, the codes and label buffers of TextArray columns, and
+    the buffers of the long-text TextColumns. The arrays of the indexes
+    load_data() builds over the table are added to the same directory, under
+    indexes/, once they are built. A snapshot is used only while its key
+    matches the source CSV's content hash and the column mapping; the CSV is
+    re-hashed only when its size or mtime changed.
+    """
+
+    def __init__(self, root: Path, column_map: Dict[str, str]):
+        self.root = Path(root)
+        self.column_map = column_map
+
+    def current_key(self, source: Path) -> str:
+        """Key for the source as it is now, reusing the recorded hash when size and mtime are unchanged"""
+        stat = source.stat()
+        latest = _read_manifest(self.root / "latest") if (self.root / "latest").exists() else None
+        source_info = (latest or {}).get("source", {})
+        if (source_info.get("path") == str(source) and source_info.get("size") == stat.st_size
+                and source_info.get("mtime_ns") == stat.st_mtime_ns):
+            return snapshot_key(source_info["sha256"], self.column_map)
+        return snapshot_key(file_sha256(source), self.column_map)
+
+    def load(self, source: Path) -> Optional[Tuple[pd.DataFrame, Dict[str, TextColumn]]]:
+        """Load the snapshot matching source, or None when it is missing or stale"""
+        directory = self.root / f"drugs-{self.current_key(source)}"
+        manifest = _read_manifest(directory)
+        if manifest is None:
+            return None
+
+        def mapped(file_name):
+            return np.load(directory / file_name, mmap_mode="r").view(np.ndarray)
+
+        def text_column(entry, prefix):
+            return TextColumn(*(mapped(entry[f"{prefix}{part}_file"]) for part in ("buffer", "offsets", "missing")))
+
+        columns = {}
+        for column in manifest["columns"]:
+            if column["kind"] == "numeric":
+                columns[column["name"]] = mapped(column["file"])
+            else:
+                columns[column["name"]] = TextArray(mapped(column["file"]), text_column(column, "labels_"))
+
+        texts = {text["name"]: text_column(text, "") for text in manifest["texts"]}
+        # copy=False keeps the columns backed by the memory-mapped files
+        return pd.DataFrame(columns, copy=False), texts
+
+    def save(self, df: pd.DataFrame, texts: Dict[str, TextColumn], source: Path) -> Path:
+        """Write a snapshot of the compacted table for source and point 'latest' at it"""
+        stat = source.stat()
+        source_sha256 = file_sha256(source)
+        key = snapshot_key(source_sha256, self.column_map)
+        directory = self.root / f"drugs-{key}"
+        staging = self.root / f".drugs-{key}-{os.getpid()}"
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir(parents=True)
+
+        def save_text_column(entry, prefix, stem, text):
+            for part in ("buffer", "offsets", "missing"):
+                entry[f"{prefix}{part}_file"] = f"{stem}.{part}.npy"
+                np.save(staging / entry[f"{prefix}{part}_file"], np.asarray(getattr(text, part)))
+
+        columns = []
+        for i, name in enumerate(df.columns):
+            series = df[name]
+            file_name = f"{i:02d}.npy"
+            if isinstance(series.array, TextArray):
+                np.save(staging / file_name, np.asarray(series.array.codes))
+                entry = {"name": name, "kind": "text", "file": file_name}
+                save_text_column(entry, "labels_", f"{i:02d}.labels", series.array.labels)
+                columns.append(entry)
+            else:
+                np.save(staging / file_name, series.to_numpy())
+                columns.append({"name": name, "kind": "numeric", "file": file_name})
+
+        text_entries = []
+        for name, text in texts.items():
+            entry = {"name": name}
+            save_text_column(entry, "", f"text-{name}", text)
+            text_entries.append(entry)
+
+        manifest = {
+            "key": key,
+            "version": SNAPSHOT_VERSION,
+            "rows": len(df),
+            "created": time.time(),
+            "source": {"path": str(source), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": source_sha256},
+            "columns": columns,
+            "texts": text_entries
+        }
+        with open(staging / "manifest.json", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(staging, directory)
+
+        # 'latest' only caches the source fingerprint so later boots can skip re-hashing
+        latest = self.root / "latest"
+        latest.mkdir(exist_ok=True)
+        with open(latest / ".manifest.json.tmp", "w", encoding="utf-8") as f:
+            json.dump({"key": key, "source": manifest["source"]}, f)
+        os.replace(latest / ".manifest.json.tmp", latest / "manifest.json")
+
+        self._prune(keep=directory)
+        return directory
+
+    def load_indexes(self, source: Path) -> Dict[str, Dict[str, np.ndarray]]:
+        """Memory-mapped arrays of every index saved with source's snapshot, by index name"""
+        directory = self.root / f"drugs-{self.current_key(source)}" / "indexes"
+        manifest = _read_manifest(directory)
+        if manifest is None:
+            return {}
+        return {
+            name: {array: np.load(directory / file_name, mmap_mode="r").view(np.ndarray)
+                   for array, file_name in files.items()}
+            for name, files in manifest["indexes"].items()
+        }
+
+    def save_indexes(self, source: Path, indexes: Dict[str, Dict[str, np.ndarray]]) -> Path:
+        """Add index arrays, by index name, to the snapshot of source; replaces any saved before"""
+        snapshot = self.root / f"drugs-{self.current_key(source)}"
+        if _read_manifest(snapshot) is None:
+            raise FileNotFoundError(f"No snapshot of {source} to add indexes to")
+        directory = snapshot / "indexes"
+        staging = snapshot / f".indexes-{os.getpid()}"
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir()
+
+        files = {}
+        for name, arrays in indexes.items():
+            files[name] = {}
+            for i, (array_name, array) in enumerate(arrays.items()):
+                file_name = f"{name}.{i:02d}.npy"
+                np.save(staging / file_name, np.asarray(array))
+                files[name][array_name] = file_name
+        with open(staging / "manifest.json", "w", encoding="utf-8") as f:
+            json.dump({"version": SNAPSHOT_VERSION, "indexes": files}, f, indent=2)
+
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(staging, directory)
+        return directory
+
+    def _prune(self, keep: Path):
+        """Remove snapshots of older CSV versions"""
+        for directory in self.root.glob("drugs-*"):
+            if directory != keep:
+                shutil.rmtree(directory, ignore_errors=True)
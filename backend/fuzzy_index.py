@@ -0,0 +1,198 @@
+"""
+MediLens Fuzzy Index - OCR-error-tolerant lookups over brand and salt words
+SymSpell-style symmetric-delete dictionary with an OCR-confusion-aware cost model
+"""
+
+import math
+import zlib
+from typing import Dict, List, Tuple
+import numpy as np
+from drug_store import TextColumn, TextLookup
+
+MAX_EDIT_DISTANCE = 2
+PREFIX_LENGTH = 10  # Deletes are generated on this many leading characters (SymSpell prefix trick)
+
+# Glyphs Tesseract reads in place of letters; folded before indexing and lookup
+OCR_MULTI_CHAR = (("rn", "m"), ("vv", "w"), ("cl", "d"))
+OCR_CHAR_MAP = str.maketrans({"0": "o", "1": "l", "|": "l", "5": "s", "8": "b", "2": "z", "9": "g", "$": "s", "@": "a"})
+
+# Letter pairs Tesseract commonly swaps; substituting one for the other is half an edit
+OCR_CONFUSABLE_PAIRS = (
+    ("l", "i"), ("i", "j"), ("c", "e"), ("n", "h"), ("u", "v"), ("a", "o"),
+    ("t", "f"), ("m", "n"), ("b", "h"), ("e", "o"), ("g", "q"),
+)
+OCR_CONFUSABLE = {pair for a, b in OCR_CONFUSABLE_PAIRS for pair in ((a, b), (b, a))}
+CONFUSABLE_COST = 0.5
+
+
+def ocr_normalize(word: str) -> str:
+    """Lowercase a word and fold common OCR glyph confusions (rn->m, 0->o, 1->l, ...)"""
+    word = word.lower()
+    for glyphs, letter in OCR_MULTI_CHAR:
+        word = word.replace(glyphs, letter)
+    return word.translate(OCR_CHAR_MAP)
+
+
+def edit_budget(token: str) -> float:
+    """Edit budget for a token: OCR confusions only for short words, more for long ones"""
+    if len(token) < 4 or sum(ch.isalpha() for ch in token) < 3:
+        return 0
+    if len(token) == 4:
+        return CONFUSABLE_COST
+    return 1 if len(token) < 8 else MAX_EDIT_DISTANCE
+
+
+def ocr_distance(a: str, b: str, limit: float = MAX_EDIT_DISTANCE) -> float:
+    """
+    Weighted Damerau-Levenshtein distance between two normalized words
+
+    Insertions, deletions and transpositions cost 1; substitutions cost 1, or
+    CONFUSABLE_COST for OCR-confusable letters. Returns limit + 1 once the
+    distance is known to exceed limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous_previous = None
+    previous = [float(j) for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [float(i)] + [0.0] * len(b)
+        for j in range(1, len(b) + 1):
+            if a[i - 1] == b[j - 1]:
+                substitution = 0.0
+            elif (a[i - 1], b[j - 1]) in OCR_CONFUSABLE:
+                substitution = CONFUSABLE_COST
+            else:
+                substitution = 1.0
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + substitution)
+            if (previous_previous is not None and j > 1
+                    and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+def _deletes(word: str, max_distance: int) -> Dict[str, int]:
+    """Strings reachable from word's prefix by deleting up to max_distance characters, with the delete count"""
+    variants = {word[:PREFIX_LENGTH]: 0}
+    frontier = list(variants)
+    for count in range(1, max_distance + 1):
+        next_frontier = []
+        for variant in frontier:
+            for i in range(len(variant)):
+                shorter = variant[:i] + variant[i + 1:]
+                if shorter not in variants:
+                    variants[shorter] = count
+                    next_frontier.append(shorter)
+        frontier = next_frontier
+    return variants
+
+
+def _key(variant: str) -> int:
+    """Stable 32-bit key of a delete variant; collisions are removed by verification"""
+    return zlib.crc32(variant.encode("utf-8"))
+
+
+class FuzzyIndex:
+    """
+    Answers 'which dictionary words are within edit distance 2 of this token'
+
+    Every delete variant of every (normalized) dictionary word is hashed into
+    one sorted numpy array, paired with the word id and the number of deletes.
+    A lookup hashes the query's own delete variants, binary-searches them,
+    and verifies the few candidates with ocr_distance. Words are kept in
+    TextColumn buffers, not Python lists.
+    """
+
+    def __init__(self, word_counts: Dict[str, int], min_length: int = 4):
+        words: List[str] = []
+        counts: List[int] = []
+        normalized_words: List[str] = []
+
+        keys = []
+        word_ids = []
+        depths = []
+        for word, count in word_counts.items():
+            if len(word) < min_length or word.isdigit():
+                continue
+            word_id = len(words)
+            normalized = ocr_normalize(word)
+            words.append(word)
+            counts.append(count)
+            normalized_words.append(normalized)
+            for variant, depth in _deletes(normalized, MAX_EDIT_DISTANCE).items():
+                keys.append(_key(variant))
+                word_ids.append(word_id)
+                depths.append(depth)
+
+        self.words = TextColumn.from_strings(words)
+        self.counts = np.array(counts, dtype=np.int64)
+        self.normalized = TextColumn.from_strings(normalized_words)
+        # First word of each normalized form, for the exact fast path of best()
+        self.normalized_ids = TextLookup.build(self.normalized)
+
+        order = np.argsort(np.array(keys, dtype=np.uint32), kind="stable")
+        self.keys = np.array(keys, dtype=np.uint32)[order]
+        self.word_ids = np.array(word_ids, dtype=np.int32)[order]
+        self.depths = np.array(depths, dtype=np.uint8)[order]
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Arrays from_arrays() restores the index from, for the database snapshot"""
+        return {**self.words.arrays("words"), "counts": self.counts, **self.normalized_ids.arrays("normalized"),
+                "keys": self.keys, "word_ids": self.word_ids, "depths": self.depths}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "FuzzyIndex":
+        index = cls.__new__(cls)
+        index.words = TextColumn.from_arrays(arrays, "words")
+        index.counts = arrays["counts"]
+        index.normalized_ids = TextLookup.from_arrays(arrays, "normalized")
+        index.normalized = index.normalized_ids.texts
+        index.keys, index.word_ids, index.depths = arrays["keys"], arrays["word_ids"], arrays["depths"]
+        return index
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def lookup(self, token: str, max_distance: float = MAX_EDIT_DISTANCE, limit: int = 5) -> List[Tuple[str, float]]:
+        """
+        Dictionary words within max_distance of token as (word, cost)
+
+        Ranked by cost, then by how many medicines share the word.
+        """
+        query = ocr_normalize(token)
+        if not query:
+            return []
+
+        # A confusable substitution (cost < 1) still needs one delete on each side to be probed
+        max_deletes = math.ceil(max_distance)
+        probes = np.array([_key(v) for v in _deletes(query, max_deletes)], dtype=np.uint32)
+        lo = np.searchsorted(self.keys, probes, side="left")
+        hi = np.searchsorted(self.keys, probes, side="right")
+
+        candidates = set()
+        for start, end in zip(lo.tolist(), hi.tolist()):
+            if start < end:
+                hits = self.word_ids[start:end][self.depths[start:end] <= max_deletes]
+                candidates.update(hits.tolist())
+
+        results = []
+        for word_id in candidates:
+            word = self.normalized[word_id]
+            if abs(len(word) - len(query)) > max_distance:
+                continue
+            cost = ocr_distance(query, word, max_distance)
+            if cost <= max_distance:
+                results.append((cost, -int(self.counts[word_id]), self.words[word_id]))
+        results.sort()
+        return [(word, cost) for cost, _, word in results[:limit]]
+
+    def best(self, token: str, max_distance: float = MAX_EDIT_DISTANCE) -> Tuple[str, float]:
+        """Closest dictionary word to token, or (None, None) when nothing is in range"""
+        # Most OCR damage is undone by ocr_normalize alone ('Augrnentin', 'D0lo')
+        word_id = self.normalized_ids.get(ocr_normalize(token))
+        if word_id is not None:
+            return self.words[word_id], 0.0
+        results = self.lookup(token, max_distance, limit=1)
+        return results[0] if results else (None, None)
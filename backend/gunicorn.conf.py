@@ -0,0 +1,37 @@
+"""
+Gunicorn config for multi-worker MediLens
+The drug database and its indexes are loaded once in the master process,
+before workers fork, so workers start from the master's pages instead of
+each loading its own copy. The table and the indexes are memory-mapped from
+the database snapshot (or built as numpy arrays on the first boot), so their
+pages stay shared for good
+
+Run: gunicorn main:app -c gunicorn.conf.py
+"""
+
+import gc
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '10000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+# Import main:app in the master so load_data() below runs before the fork
+preload_app = True
+
+
+def on_starting(server):
+    """Load the database and indexes in the master process"""
+    # Workers inherit the environment; OCRPool.from_env splits the cores by this
+    # count, so publish the number gunicorn actually forks (including any -w flag)
+    os.environ["WEB_CONCURRENCY"] = str(server.cfg.workers)
+    import main
+    main.load_data()
+    # Snapshot columns, text buffers and index arrays are memory-mapped, so workers
+    # share them via the page cache. Indexes built on a first boot are numpy arrays
+    # and TextColumn buffers too, not dicts, lists and strings, so reading them
+    # touches no reference counts and their pages stay shared after the fork.
+    # Freezing keeps the collector off the remaining Python objects
+    gc.freeze()
+    server.log.info("Preloaded drug database for %s workers", server.cfg.workers)
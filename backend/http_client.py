@@ -0,0 +1,90 @@
+"""
+MediLens HTTP Client - one pooled aiohttp session for all outbound requests
+Created in the app's lifespan so pharmacy lookups reuse connections, DNS
+answers and TLS sessions instead of paying for them on every call
+"""
+
+import asyncio
+import os
+from typing import Dict, Optional
+import aiohttp
+
+# Pharmacy search pages; base URLs can point at a local stub server (e.g. ONEMG_BASE_URL=http://127.0.0.1:8081)
+PHARMACY_ENDPOINTS = {
+    "1mg": ("ONEMG_BASE_URL", "https://www.1mg.com", "/search/all?name={query}"),
+    "PharmEasy": ("PHARMEASY_BASE_URL", "https://pharmeasy.in", "/search/all?name={query}"),
+    "Netmeds": ("NETMEDS_BASE_URL", "https://www.netmeds.com", "/catalogsearch/result/{query}/all"),
+}
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+
+def pharmacy_url(pharmacy: str, medicine_name: str) -> str:
+    """Search URL for a medicine on a pharmacy site, honouring base URL overrides"""
+    env_var, default_base, path = PHARMACY_ENDPOINTS[pharmacy]
+    base = os.getenv(env_var, default_base).rstrip("/")
+    return base + path.format(query=medicine_name.replace(' ', '%20'))
+
+
+class HTTPClient:
+    """
+    App-scoped aiohttp session
+
+    Keep-alive connections are pooled with a total and a per-host limit,
+    DNS answers are cached, and every request gets the same connect/read
+    timeouts. start() and close() are called from the FastAPI lifespan.
+    """
+
+    def __init__(self, total_timeout: float = 5.0, connect_timeout: float = 2.0,
+                 max_connections: int = 100, max_per_host: int = 10,
+                 dns_cache_ttl: int = 300, keepalive_timeout: float = 30.0):
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, connect=connect_timeout)
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    @classmethod
+    def from_env(cls) -> "HTTPClient":
+        """Client configured by the HTTP_* variables"""
+        return cls(
+            total_timeout=float(os.getenv("HTTP_TIMEOUT", "5")),
+            connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", "2")),
+            max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+            max_per_host=int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "10")),
+            dns_cache_ttl=int(os.getenv("HTTP_DNS_CACHE_TTL", "300")),
+            keepalive_timeout=float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))
+        )
+
+    async def start(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            limit_per_host=self.max_per_host,
+            ttl_dns_cache=self.dns_cache_ttl,
+            keepalive_timeout=self.keepalive_timeout
+        )
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, headers=DEFAULT_HEADERS)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+            # Let the transports of SSL connections finish closing (aiohttp's documented graceful shutdown)
+            await asyncio.sleep(0.25)
+
+    def get(self, url: str, **kwargs):
+        """session.get(...) on the shared session; use as `async with client.get(url) as response`"""
+        if self.session is None:
+            raise RuntimeError("HTTP client is not started")
+        return self.session.get(url, **kwargs)
+
+    def stats(self) -> Dict:
+        connector = self.session.connector if self.session is not None else None
+        return {
+            "open": connector is not None and not connector.closed,
+            "max_connections": self.max_connections,
+            "max_per_host": self.max_per_host
+        }
@@ -0,0 +1,213 @@
+"""
+MediLens Interaction Checker - prescription-wide drug interaction checks
+An adjacency index keyed by normalized salt, built once by load_data() from
+the parsed drug_interactions data plus the class rules of upgrade_dataset.py,
+so checking every pair of a prescription is a handful of binary searches
+"""
+
+import re
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from drug_interactions import InteractionTable
+from drug_store import TextColumn, TextLookup
+from upgrade_dataset import ACTIVE_INTERACTIONS, INTERACTION_MAP, CLASS_RULES
+
+STRENGTH_PATTERN = re.compile(r"\([^)]*\)")
+
+# Effect labels of the 1mg interaction data, mildest first; unknown labels rank as MODERATE
+EFFECT_RANKS = {"MINOR": 0, "MODERATE": 1, "SERIOUS": 2, "LIFE-THREATENING": 3}
+RANK_SEVERITY = {0: "minor", 1: "moderate", 2: "critical", 3: "critical"}
+SEVERITY_ORDER = {"critical": 0, "moderate": 1, "minor": 2}
+CLASS_NAMES = sorted({cname for _, cname in CLASS_RULES})
+
+
+def normalize_salt(name: str) -> str:
+    """'Amoxycillin (500mg)' -> 'amoxycillin'"""
+    return " ".join(STRENGTH_PATTERN.sub(" ", str(name)).lower().split())
+
+
+def split_salts(composition: str) -> List[str]:
+    """Normalized salts of a composition like 'Amoxycillin (500mg) + Clavulanic Acid (125mg)'"""
+    salts = []
+    for part in str(composition).split("+"):
+        salt = normalize_salt(part)
+        if salt and salt not in salts:
+            salts.append(salt)
+    return salts
+
+
+def salt_class(salt: str) -> Optional[str]:
+    """Drug class of a salt by upgrade_dataset.CLASS_RULES, first matching rule wins"""
+    for rx, cname in CLASS_RULES:
+        if rx.search(salt):
+            return cname
+    return None
+
+
+class InteractionChecker:
+    """
+    Salt-to-salt interaction index
+
+    Every row's interactions apply to each salt of its composition, so rows
+    are collapsed to distinct (composition, interacting drug) pairs before
+    being expanded to salt pairs; a pair keeps its most severe effect.
+    Salts are interned into a TextColumn; edges are a sorted array of
+    (low id << 32) | high id keys with the pair's effect code alongside.
+    """
+
+    def __init__(self, interaction_table: InteractionTable, compositions: pd.Series):
+        self._salt_ids: Dict[str, int] = {}
+        self.effects = interaction_table.effects
+        edges: Dict[int, int] = {}  # Salt pair key -> effect code
+
+        codes, uniques = pd.factorize(compositions)
+        composition_salts = [[self._intern(salt) for salt in split_salts(value)] for value in uniques]
+        drug_salts = np.array([self._intern(normalize_salt(drug)) for drug in interaction_table.drugs.tolist()],
+                              dtype=np.int64)
+        ranks = np.array([EFFECT_RANKS.get(effect.upper(), 1) for effect in self.effects.tolist()], dtype=np.int64)
+
+        # One entry per (row, interacting drug) from the CSR arrays, then distinct (composition, salt) pairs
+        entry_rows = np.repeat(np.arange(len(interaction_table), dtype=np.int64), np.diff(interaction_table.offsets))
+        entry_compositions = codes[entry_rows]
+        keep = entry_compositions >= 0
+        entry_compositions = entry_compositions[keep]
+        entry_salts = drug_salts[interaction_table.drug_ids[keep]]
+        entry_effects = interaction_table.effect_codes[keep].astype(np.int64)
+        if len(entry_effects):
+            # Most severe effect first, so np.unique's first occurrence is the one kept
+            order = np.lexsort((-ranks[entry_effects], entry_salts, entry_compositions))
+            pairs = np.stack([entry_compositions[order], entry_salts[order]], axis=1)
+            _, first = np.unique(pairs, axis=0, return_index=True)
+            for composition, salt, effect in zip(pairs[first, 0].tolist(), pairs[first, 1].tolist(),
+                                                 entry_effects[order][first].tolist()):
+                for own_salt in composition_salts[composition]:
+                    if own_salt != salt:
+                        self._add_edge(edges, own_salt, salt, effect, ranks)
+
+        salts = list(self._salt_ids)
+        del self._salt_ids  # Only needed while interning
+        self.salts = TextColumn.from_strings(salts)
+        self.salt_ids = TextLookup.build(self.salts)
+        edge_keys = np.fromiter(edges.keys(), dtype=np.int64, count=len(edges))
+        order = np.argsort(edge_keys)
+        self.edge_keys = edge_keys[order]
+        self.edge_effects = np.fromiter(edges.values(), dtype=np.int32, count=len(edges))[order]
+        # Index into CLASS_NAMES of every salt's class, -1 for none
+        self.classes = np.array([CLASS_NAMES.index(cname) if cname else -1 for cname in map(salt_class, salts)],
+                                dtype=np.int8)
+        self.advice = self._advice()
+
+    @staticmethod
+    def _advice() -> Dict[frozenset, str]:
+        """ACTIVE_INTERACTIONS advice by salt set, e.g. {"amoxicillin", "clavulanic acid"}"""
+        return {frozenset(split_salts(active)): text for active, text in ACTIVE_INTERACTIONS.items()}
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Arrays from_arrays() restores the index from, for the database snapshot"""
+        return {**self.salt_ids.arrays("salts"), "edge_keys": self.edge_keys, "edge_effects": self.edge_effects,
+                "classes": self.classes}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], interaction_table: InteractionTable) -> "InteractionChecker":
+        checker = cls.__new__(cls)
+        checker.salt_ids = TextLookup.from_arrays(arrays, "salts")
+        checker.salts = checker.salt_ids.texts
+        checker.effects = interaction_table.effects
+        checker.edge_keys, checker.edge_effects = arrays["edge_keys"], arrays["edge_effects"]
+        checker.classes = arrays["classes"]
+        checker.advice = cls._advice()
+        return checker
+
+    def _intern(self, salt: str) -> int:
+        return self._salt_ids.setdefault(salt, len(self._salt_ids))
+
+    @staticmethod
+    def _add_edge(edges: Dict[int, int], a: int, b: int, effect: int, ranks: np.ndarray):
+        key = (a << 32) | b if a < b else (b << 32) | a
+        current = edges.get(key)
+        if current is None or ranks[effect] > ranks[current]:
+            edges[key] = effect
+
+    def __len__(self) -> int:
+        return len(self.edge_keys)
+
+    def edge(self, a: int, b: int) -> Optional[int]:
+        """Effect code of the interaction between two salt ids, None when there is none"""
+        key = (a << 32) | b if a < b else (b << 32) | a
+        i = int(np.searchsorted(self.edge_keys, key))
+        if i < len(self.edge_keys) and self.edge_keys[i] == key:
+            return int(self.edge_effects[i])
+        return None
+
+    def salt_class(self, salt: str) -> Optional[str]:
+        salt_id = self.salt_ids.get(salt)
+        if salt_id is None:
+            return salt_class(salt)
+        code = int(self.classes[salt_id])
+        return CLASS_NAMES[code] if code >= 0 else None
+
+    def known_salt(self, name: str) -> bool:
+        return normalize_salt(name) in self.salt_ids
+
+    def advisories(self, salts: List[str]) -> List[str]:
+        """Per-medicine advice: ACTIVE_INTERACTIONS for its exact salts, else INTERACTION_MAP for its classes"""
+        text = self.advice.get(frozenset(salts))
+        if text is not None:
+            return [text]
+        classes = {self.salt_class(salt) for salt in salts} - {None}
+        return [INTERACTION_MAP[cname] for cname in sorted(classes) if cname in INTERACTION_MAP]
+
+    def check(self, medicines: List[Tuple[str, List[str]]]) -> List[Dict]:
+        """
+        Interactions between every pair of medicines, given as (label, normalized salts)
+
+        Reports dataset interactions between their salts, the same salt in both
+        (duplicate therapy) and two salts of the same drug class.
+        """
+        found = []
+        for (label_a, salts_a), (label_b, salts_b) in combinations(medicines, 2):
+            for salt in [salt for salt in salts_a if salt in salts_b]:
+                found.append({
+                    "medicines": [label_a, label_b],
+                    "salts": [salt, salt],
+                    "type": "duplicate_salt",
+                    "severity": "moderate",
+                    "description": f"Both contain {salt.title()}",
+                    "recommendation": self.advice.get(frozenset([salt]), "Avoid taking the same salt twice; ask your doctor or pharmacist."),
+                    "effects": ["Risk of overdose"]
+                })
+            for salt_a in salts_a:
+                for salt_b in salts_b:
+                    if salt_a == salt_b:
+                        continue
+                    id_a, id_b = self.salt_ids.get(salt_a), self.salt_ids.get(salt_b)
+                    effect = None
+                    if id_a is not None and id_b is not None:
+                        effect = self.edge(id_a, id_b)
+                    if effect is not None:
+                        label = self.effects[effect]
+                        found.append({
+                            "medicines": [label_a, label_b],
+                            "salts": [salt_a, salt_b],
+                            "type": "interaction",
+                            "effect": label,
+                            "severity": RANK_SEVERITY[EFFECT_RANKS.get(label.upper(), 1)],
+                            "description": f"{salt_a.title()} and {salt_b.title()}: {label.lower()} interaction",
+                            "recommendation": "Consult your doctor before taking these together.",
+                            "effects": [label.title()]
+                        })
+                    cname = self.salt_class(salt_a)
+                    if cname is not None and cname == self.salt_class(salt_b):
+                        found.append({
+                            "medicines": [label_a, label_b],
+                            "salts": [salt_a, salt_b],
+                            "type": "same_class",
+                            "severity": "moderate",
+                            "description": f"Both are {cname} drugs ({salt_a.title()}, {salt_b.title()})",
+                            "recommendation": INTERACTION_MAP.get(cname, "Consult your doctor; check for interactions."),
+                            "effects": [f"Duplicate {cname} therapy"]
+                        })
+        found.sort(key=lambda item: SEVERITY_ORDER[item["severity"]])
+        return found
@@ -7,22 +7,37 @@ Updated to support 253,973+ Indian medicines database
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+from pydantic import BaseModel
 from contextlib import asynccontextmanager
 import uvicorn
-import cv2
 import pytesseract
-import numpy as np
 import pandas as pd
-from PIL import Image
-import io
 import re
 import os
-import aiohttp
 import asyncio
 from typing import List, Dict, Optional
 from pathlib import Path
 from datetime import datetime
-import json
+from urllib.parse import urlparse
+import time
+import gc
+from drug_index import BrandIndex, SubstringIndex, GenericGroups, SuggestIndex
+from drug_interactions import InteractionTable
+from interaction_checker import InteractionChecker, split_salts
+from drug_store import SnapshotStore, compact_table, table_nbytes, resident_memory_mb
+from medicine_matcher import MedicineMatcher, tokenize
+from http_client import HTTPClient, PHARMACY_ENDPOINTS, pharmacy_url
+from price_cache import PriceCache
+from resilience import UpstreamGuard, UpstreamError, CircuitOpen
+from fuzzy_index import FuzzyIndex, edit_budget
+from ocr_pipeline import (
+    OCRPool, OCRError, InvalidImageError, ImageTooLarge, PoolSaturated, run_pipeline, run_pipeline_words,
+    prepare_regions, ocr_regions,
+    split_regions, merge_regions, iter_pages, engine_name, PIPELINE_VERSION, PROFILES, DEFAULT_PROFILE, OCR_MODES
+)
+from ocr_engine import TESSEROCR_AVAILABLE
+from ocr_cache import OCRCache, content_key, perceptual_hash
 
 # Load datasets
 # Try multiple possible data locations (for local dev and Docker)
@@ -31,7 +46,24 @@ if not DATA_DIR.exists():
     DATA_DIR = Path(__file__).parent.parent / "data"  # For local dev: parent/data
     
 drugs_df = None
-prices_data = None
+drug_texts = {}  # Long text columns (use_case, side_effects, interactions) as TextColumns
+brand_index = None  # Exact/prefix brand name lookups, built by load_data()
+brand_ngrams = None  # Substring lookups over brand_name
+generic_ngrams = None  # Substring lookups over generic_name (salt composition)
+medicine_matcher = None  # Brand/salt automaton for OCR text
+fuzzy_index = None  # OCR-error-tolerant lookups over brand stems and salt words
+generic_groups = None  # Salt composition -> price-sorted row ids
+suggest_index = None  # Typeahead: top brand names per prefix, precomputed
+interaction_table = None  # drug_interactions parsed once into interned ids
+interaction_checker = None  # Salt-to-salt interaction index for /interactions/check
+ocr_pool = None  # Worker processes running the OCR pipeline, started per web worker
+ocr_cache = None  # /ocr results by upload hash, scoped to dataset_version
+dataset_version = None  # Snapshot key of the loaded CSV (content hash + column mapping)
+tesseract_available = False  # Probed once at startup, not per health check
+ocr_engine_name = None  # Engine the OCR pool workers run (tesserocr / pytesseract)
+http_client = None  # Pooled aiohttp session for pharmacy lookups, opened in lifespan
+price_cache = None  # Pharmacy observations per medicine, refreshed in the background
+upstream_guard = None  # Coalescing, per-host limits and circuit breakers for pharmacy sites
 
 # Column mapping: new dataset columns -> internal names we use
 # New dataset: id, name, price, Is_discontinued, manufacturer_name, type, pack_size_label,
@@ -51,9 +83,77 @@ COLUMN_MAP = {
     'type': 'medicine_type'
 }
 
+# Binary snapshots of the cleaned table, so later boots skip the CSV parse
+SNAPSHOT_DIR = Path(os.getenv("DRUG_SNAPSHOT_DIR", str(DATA_DIR / ".snapshots")))
+USE_SNAPSHOT = os.getenv("DRUG_SNAPSHOT", "1") != "0"
+
+OCR_CACHE_DIR = DATA_DIR / ".ocr_cache"
+
+# Preprocessing profile: fast / balanced / accurate trade OCR accuracy for latency, legacy is the original fixed pipeline
+OCR_PROFILE = os.getenv("OCR_PROFILE", DEFAULT_PROFILE)
+if OCR_PROFILE not in PROFILES:
+    print(f"⚠️ Unknown OCR_PROFILE '{OCR_PROFILE}', using '{DEFAULT_PROFILE}'")
+    OCR_PROFILE = DEFAULT_PROFILE
+
+# page: one Tesseract call over the whole image; regions: detect text lines and OCR them in parallel;
+# words: word boxes with confidences, low-confidence noise dropped and lines matched separately
+OCR_MODE = os.getenv("OCR_MODE", "page")
+if OCR_MODE not in OCR_MODES:
+    print(f"⚠️ Unknown OCR_MODE '{OCR_MODE}', using 'page'")
+    OCR_MODE = "page"
+
+# /ocr/batch limits; pages of one batch run concurrently up to OCR_BATCH_CONCURRENCY (default: OCR pool workers)
+OCR_BATCH_MAX_FILES = int(os.getenv("OCR_BATCH_MAX_FILES", "20"))
+OCR_BATCH_MAX_PAGES = int(os.getenv("OCR_BATCH_MAX_PAGES", "50"))
+OCR_BATCH_CONCURRENCY = int(os.getenv("OCR_BATCH_CONCURRENCY", "0"))
+
+# Largest accepted upload per file; bigger ones get 413 before they are read into memory
+OCR_MAX_UPLOAD_BYTES = int(float(os.getenv("OCR_MAX_UPLOAD_MB", "10")) * 2**20)
+UPLOAD_CHUNK = 1 << 20
+MULTIPART_OVERHEAD = 64 * 1024  # Boundaries and part headers on top of the file bytes
+
+# Most medicines checked against each other by one /interactions/check call
+INTERACTION_CHECK_MAX_MEDICINES = 50
+
+# /suggest returns at most this many names
+SUGGEST_MAX_RESULTS = 10
+
+# /drugs/batch: most medicine names resolved per request, generic alternatives per result
+DRUGS_BATCH_MAX_NAMES = int(os.getenv("DRUGS_BATCH_MAX_NAMES", "50"))
+GENERICS_LIMIT = 10
+
+def clean_drug_table(df: pd.DataFrame) -> pd.DataFrame:
+    """Map columns, drop discontinued medicines and derive full_composition"""
+    # Rename columns to standardized names if using new dataset format
+    if 'name' in df.columns and 'brand_name' not in df.columns:
+        df = df.rename(columns=COLUMN_MAP)
+        print("📝 Mapped columns to standard format")
+    
+    if 'brand_name' not in df.columns:
+        return df
+    
+    # Remove discontinued medicines for cleaner results
+    if 'is_discontinued' in df.columns:
+        before_count = len(df)
+        df = df[~df['is_discontinued'].isin([True, 'TRUE', 'True'])]
+        print(f"🧹 Filtered discontinued medicines: {before_count} → {len(df)}")
+    
+    # Positional row ids are shared by drugs_df and every lookup index
+    df = df.reset_index(drop=True)
+    
+    # Create a combined active ingredient column
+    if 'active_ingredient_2' in df.columns:
+        first = df['active_ingredient'].fillna('').astype(str)
+        second = df['active_ingredient_2']
+        has_second = second.notna() & (second.astype(str) != '')
+        combined = (first + ' + ' + second.fillna('').astype(str)).str.strip(' +')
+        df['full_composition'] = combined.where(has_second, first)
+    
+    return df
+
 def load_data():
     """Load drug database and price information"""
-    global drugs_df, prices_data
+    global drugs_df, drug_texts, brand_index, brand_ngrams, generic_ngrams, medicine_matcher, fuzzy_index, generic_groups, suggest_index, interaction_table, interaction_checker, dataset_version
     try:
         # Try to load expanded database first
         master_path = DATA_DIR / "drugs_master.csv"
@@ -62,44 +162,141 @@ def load_data():
         
         # Prefer master dataset if available
         if master_path.exists():
-            drugs_df = pd.read_csv(master_path, low_memory=False)
-            print(f"✅ Loaded {len(drugs_df)} drugs from MASTER database")
+            source_path, label = master_path, "MASTER database"
         elif expanded_path.exists():
-            drugs_df = pd.read_csv(expanded_path, low_memory=False)
-            print(f"✅ Loaded {len(drugs_df)} drugs from EXPANDED database")
+            source_path, label = expanded_path, "EXPANDED database"
         elif original_path.exists():
-            drugs_df = pd.read_csv(original_path, low_memory=False)
-            print(f"✅ Loaded {len(drugs_df)} drugs from database")
+            source_path, label = original_path, "database"
         else:
             print(f"⚠️ No drug database found at {DATA_DIR}")
             drugs_df = pd.DataFrame()
             return
         
-        # Rename columns to standardized names if using new dataset format
-        if 'name' in drugs_df.columns and 'brand_name' not in drugs_df.columns:
-            drugs_df = drugs_df.rename(columns=COLUMN_MAP)
-            print("📝 Mapped columns to standard format")
+        started = time.perf_counter()
+        snapshot_store = SnapshotStore(SNAPSHOT_DIR, COLUMN_MAP) if USE_SNAPSHOT else None
+        snapshot = None
+        if snapshot_store is not None:
+            try:
+                snapshot = snapshot_store.load(source_path)
+            except Exception as e:
+                print(f"⚠️ Ignoring unreadable snapshot: {e}")
+        
+        saved_indexes = {}
+        if snapshot is not None:
+            drugs_df, drug_texts = snapshot
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            print(f"⚡ Loaded {len(drugs_df)} drugs from {label} snapshot in {elapsed_ms:.0f} ms")
+            try:
+                saved_indexes = snapshot_store.load_indexes(source_path)
+            except Exception as e:
+                print(f"⚠️ Ignoring unreadable index snapshot: {e}")
+        else:
+            drugs_df = pd.read_csv(source_path, low_memory=False)
+            print(f"✅ Loaded {len(drugs_df)} drugs from {label}")
+            drugs_df = clean_drug_table(drugs_df)
+            
+            # Categorical codes for repetitive columns, contiguous buffers for long text
+            rss_before = resident_memory_mb()
+            bytes_before = table_nbytes(drugs_df)
+            drugs_df, drug_texts = compact_table(drugs_df)
+            gc.collect()
+            rss_after = resident_memory_mb()
+            print(f"🗜️ Compacted drug table: {bytes_before / 2**20:.1f} MB → {table_nbytes(drugs_df, drug_texts) / 2**20:.1f} MB")
+            if rss_before is not None and rss_after is not None:
+                print(f"🧠 Resident memory: {rss_before:.0f} MB → {rss_after:.0f} MB")
+            
+            if snapshot_store is not None:
+                try:
+                    snapshot_path = snapshot_store.save(drugs_df, drug_texts, source_path)
+                    print(f"💾 Wrote database snapshot: {snapshot_path}")
+                except Exception as e:
+                    print(f"⚠️ Could not write database snapshot: {e}")
+        
+        started = time.perf_counter()
+        rebuilt = []
+        
+        def restore_or_build(name, restore, build):
+            """The index saved with the snapshot, or a freshly built one (saved below)"""
+            if name in saved_indexes:
+                try:
+                    return restore(saved_indexes[name])
+                except Exception as e:
+                    print(f"⚠️ Rebuilding {name} index: {e}")
+            rebuilt.append(name)
+            return build()
+        
+        if 'interactions' in drug_texts:
+            texts = drug_texts['interactions']
+            interaction_table = restore_or_build(
+                "interactions",
+                lambda arrays: InteractionTable.from_arrays(arrays, texts),
+                lambda: InteractionTable(texts)
+            )
+            print(f"💊 Interactions of {int(interaction_table.has_data.sum())} drugs "
+                  f"({len(interaction_table.drugs)} interacting drugs, {interaction_table.nbytes / 2**20:.1f} MB)")
+        
+        # Versions anything derived from the data, like cached OCR matches
+        dataset_version = (snapshot_store or SnapshotStore(SNAPSHOT_DIR, COLUMN_MAP)).current_key(source_path)
         
-        # Clean up data
         if 'brand_name' in drugs_df.columns:
-            # Remove discontinued medicines for cleaner results
-            if 'is_discontinued' in drugs_df.columns:
-                before_count = len(drugs_df)
-                drugs_df = drugs_df[drugs_df['is_discontinued'] != True]
-                drugs_df = drugs_df[drugs_df['is_discontinued'] != 'TRUE']
-                drugs_df = drugs_df[drugs_df['is_discontinued'] != 'True']
-                print(f"🧹 Filtered discontinued medicines: {before_count} → {len(drugs_df)}")
+            # Build lookup indexes once instead of rescanning columns per request
+            brand_names, generic_names = drugs_df['brand_name'], drugs_df.get('generic_name')
+            brand_index = restore_or_build("brand", BrandIndex.from_arrays, lambda: BrandIndex(brand_names))
+            brand_ngrams = restore_or_build("brand_ngrams", SubstringIndex.from_arrays,
+                                            lambda: SubstringIndex(brand_names))
+            if generic_names is not None:
+                generic_ngrams = restore_or_build("generic_ngrams", SubstringIndex.from_arrays,
+                                                  lambda: SubstringIndex(generic_names))
+                generic_groups = restore_or_build(
+                    "generic_groups",
+                    lambda arrays: GenericGroups.from_arrays(arrays, brand_names),
+                    lambda: GenericGroups(generic_names, brand_names, drugs_df['price'])
+                )
+            print(f"🗂️ Indexed {len(brand_index)} unique brand names, {len(brand_ngrams.grams)} trigrams")
+            
+            suggest_index = restore_or_build(
+                "suggest",
+                lambda arrays: SuggestIndex.from_arrays(arrays, brand_index, brand_names, generic_names, k=SUGGEST_MAX_RESULTS),
+                lambda: SuggestIndex(brand_index, brand_names, generic_names, drugs_df['price'], k=SUGGEST_MAX_RESULTS)
+            )
+            print(f"⌨️ Typeahead ranked for {len(suggest_index)} busy prefixes")
             
-            # Create a combined active ingredient column
-            if 'active_ingredient_2' in drugs_df.columns:
-                drugs_df['full_composition'] = drugs_df.apply(
-                    lambda row: f"{row['active_ingredient'] or ''} + {row['active_ingredient_2']}".strip(' +') 
-                    if pd.notna(row.get('active_ingredient_2')) and row.get('active_ingredient_2') 
-                    else (row['active_ingredient'] if pd.notna(row.get('active_ingredient')) else ''),
-                    axis=1
+            if interaction_table is not None and generic_names is not None:
+                interaction_checker = restore_or_build(
+                    "interaction_checker",
+                    lambda arrays: InteractionChecker.from_arrays(arrays, interaction_table),
+                    lambda: InteractionChecker(interaction_table, generic_names)
                 )
+                print(f"🔗 Interaction index: {len(interaction_checker)} salt pairs over {len(interaction_checker.salts)} salts")
+            
+            medicine_matcher = restore_or_build("matcher", MedicineMatcher.from_arrays,
+                                                lambda: MedicineMatcher(brand_names, generic_names))
+            print(f"🧬 Compiled {len(medicine_matcher)} brand/salt phrases for OCR matching")
+            
+            fuzzy_index = restore_or_build("fuzzy", FuzzyIndex.from_arrays,
+                                           lambda: FuzzyIndex(medicine_matcher.word_counts))
+            print(f"🔡 Fuzzy index over {len(fuzzy_index)} brand/salt words")
             
             print(f"✅ Database ready with {len(drugs_df)} medicines")
+        
+        indexes = {
+            "interactions": interaction_table, "brand": brand_index, "brand_ngrams": brand_ngrams,
+            "generic_ngrams": generic_ngrams, "generic_groups": generic_groups, "suggest": suggest_index,
+            "interaction_checker": interaction_checker, "matcher": medicine_matcher, "fuzzy": fuzzy_index
+        }
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if not rebuilt:
+            print(f"⚡ Loaded indexes from snapshot in {elapsed_ms:.0f} ms")
+        else:
+            print(f"🛠️ Built {len(rebuilt)} indexes in {elapsed_ms:.0f} ms")
+            if snapshot_store is not None:
+                try:
+                    snapshot_store.save_indexes(source_path, {
+                        name: index.to_arrays() for name, index in indexes.items() if index is not None
+                    })
+                    print("💾 Saved indexes to the database snapshot")
+                except Exception as e:
+                    print(f"⚠️ Could not save indexes to the snapshot: {e}")
             
     except Exception as e:
         print(f"⚠️ Error loading database: {e}")
@@ -114,6 +311,9 @@ def check_tesseract():
         print("✅ Tesseract OCR is installed and accessible")
         return True
     except Exception as e:
+        if TESSEROCR_AVAILABLE:
+            print("✅ Tesseract OCR available through tesserocr")
+            return True
         print(f"⚠️ Tesseract OCR not found: {e}")
         print("📥 Please install Tesseract OCR from: https://github.com/UB-Mannheim/tesseract/wiki")
         # Try to set path for Windows
@@ -133,11 +333,36 @@ def check_tesseract():
 async def lifespan(app: FastAPI):
     """Lifespan event handler (replaces deprecated on_event)"""
     # Startup
-    load_data()
-    check_tesseract()
+    # Under gunicorn (gunicorn.conf.py) the master already loaded the database before forking
+    if drugs_df is None:
+        load_data()
+    else:
+        print(f"♻️ Worker {os.getpid()} attached to preloaded drug database")
+    global ocr_pool, ocr_cache, tesseract_available, ocr_engine_name, http_client, price_cache, upstream_guard
+    tesseract_available = check_tesseract()
+    ocr_pool = OCRPool.from_env(pytesseract.pytesseract.tesseract_cmd)
+    ocr_pool.start()
+    # Start one worker now so the first upload doesn't pay for process start and traineddata loading
+    try:
+        ocr_engine_name = await ocr_pool.run(engine_name)
+        print(f"🔤 OCR engine: {ocr_engine_name}")
+    except Exception as e:
+        print(f"⚠️ OCR worker failed to start: {e}")
+    print(f"🧵 OCR pool: {ocr_pool.workers} workers, queue of {ocr_pool.queue_size}, '{OCR_PROFILE}' preprocessing")
+    try:
+        ocr_cache = OCRCache.from_env(OCR_CACHE_DIR, f"{dataset_version or 'no-data'}-v{PIPELINE_VERSION}-{OCR_PROFILE}")
+    except OSError as e:
+        print(f"⚠️ OCR cache disabled: {e}")
+    http_client = HTTPClient.from_env()
+    await http_client.start()
+    upstream_guard = UpstreamGuard.from_env()
+    price_cache = PriceCache.from_env(fetch_pharmacy_page, list(PHARMACY_ENDPOINTS))
     print("🚀 MediLens Backend Started")
     yield
     # Shutdown
+    await price_cache.close()
+    await http_client.close()
+    ocr_pool.shutdown()
     print("👋 MediLens Backend Shutting Down")
 
 # Initialize FastAPI app with lifespan
@@ -157,6 +382,60 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class UploadSizeLimit:
+    """
+    Reject oversized OCR uploads before the body is parsed
+    A declared Content-Length is checked up front; bodies without one
+    (chunked transfer) are counted as they arrive and cut off at the limit
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/ocr"):
+            await self.app(scope, receive, send)
+            return
+        max_files = OCR_BATCH_MAX_FILES if scope["path"].startswith("/ocr/batch") else 1
+        limit = max_files * OCR_MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD
+        detail = f"Upload too large. Maximum is {OCR_MAX_UPLOAD_BYTES // 2**20} MB per file."
+
+        length = Headers(scope=scope).get("content-length")
+        if length and length.isdigit() and int(length) > limit:
+            await JSONResponse(status_code=413, content={"detail": detail})(scope, receive, send)
+            return
+
+        received = 0
+
+        async def receive_counted():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, receive_counted, send)
+
+app.add_middleware(UploadSizeLimit)
+
+async def read_upload(file: UploadFile) -> bytes:
+    """Read an upload in chunks, failing with 413 as soon as it passes OCR_MAX_UPLOAD_BYTES"""
+    if file.size is not None and file.size > OCR_MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"{file.filename} is too large. Maximum is {OCR_MAX_UPLOAD_BYTES // 2**20} MB per file.")
+    chunks = []
+    total = 0
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > OCR_MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"{file.filename} is too large. Maximum is {OCR_MAX_UPLOAD_BYTES // 2**20} MB per file.")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -167,97 +446,71 @@ async def root():
         "database_loaded": drugs_df is not None and not drugs_df.empty,
         "total_medicines": len(drugs_df) if drugs_df is not None else 0,
         "tesseract_available": check_tesseract_available(),
-        "endpoints": ["/ocr", "/drugs", "/search", "/info", "/price"]
+        "ocr_engine": ocr_engine_name,
+        "ocr_pool": ocr_pool.stats() if ocr_pool is not None else None,
+        "ocr_cache": ocr_cache.stats() if ocr_cache is not None else None,
+        "http_client": http_client.stats() if http_client is not None else None,
+        "price_cache": price_cache.stats() if price_cache is not None else None,
+        "endpoints": ["/ocr", "/ocr/batch", "/drugs", "/drugs/batch", "/suggest", "/interactions/check", "/search", "/info", "/price", "/metrics"]
     }
 
 def check_tesseract_available():
-    """Check if Tesseract is available"""
-    try:
-        pytesseract.get_tesseract_version()
-        return True
-    except:
-        return False
+    """Check if Tesseract is available (cached from startup; health probes must not spawn tesseract)"""
+    return tesseract_available
 
 # ============================================
 # REAL PHARMACY API INTEGRATION
 # ============================================
 
-async def fetch_1mg_price(medicine_name: str) -> Optional[Dict]:
-    """Fetch real price from 1mg.com"""
+async def get_pharmacy_page(pharmacy: str, url: str) -> Optional[Dict]:
+    """
+    One request to a pharmacy search page
+    Search pages answer 200 even when nothing matches, so any other status (403 blocks,
+    captcha or redirect pages, 429, 5xx) raises UpstreamError and counts against the host's circuit
+    """
+    async with http_client.get(url) as response:
+        if response.status != 200:
+            raise UpstreamError(f"HTTP {response.status}")
+        # Parse response - this is simplified, actual implementation needs HTML parsing
+        return {
+            "pharmacy": pharmacy,
+            "available": True,
+            "url": url
+        }
+
+async def fetch_pharmacy_page(pharmacy: str, medicine_name: str) -> Optional[Dict]:
+    """
+    Check a pharmacy's search page for a medicine over the shared HTTP client
+    Identical concurrent lookups share one request; a failing host is skipped while its circuit is open
+    """
+    url = pharmacy_url(pharmacy, medicine_name)
     try:
-        async with aiohttp.ClientSession() as session:
-            # 1mg search API endpoint
-            url = f"https://www.1mg.com/search/all?name={medicine_name.replace(' ', '%20')}"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            
-            async with session.get(url, headers=headers, timeout=5) as response:
-                if response.status == 200:
-                    # Parse response - this is simplified, actual implementation needs HTML parsing
-                    return {
-                        "pharmacy": "1mg",
-                        "available": True,
-                        "url": url
-                    }
+        return await upstream_guard.call(urlparse(url).netloc, url, lambda: get_pharmacy_page(pharmacy, url))
+    except CircuitOpen:
+        return None
     except Exception as e:
-        print(f"❌ 1mg API Error: {e}")
+        print(f"❌ {pharmacy} API Error: {e}")
     return None
 
+async def fetch_1mg_price(medicine_name: str) -> Optional[Dict]:
+    """Fetch real price from 1mg.com"""
+    return await fetch_pharmacy_page("1mg", medicine_name)
+
 async def fetch_pharmeasy_price(medicine_name: str) -> Optional[Dict]:
     """Fetch real price from PharmEasy"""
-    try:
-        async with aiohttp.ClientSession() as session:
-            url = f"https://pharmeasy.in/search/all?name={medicine_name.replace(' ', '%20')}"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            
-            async with session.get(url, headers=headers, timeout=5) as response:
-                if response.status == 200:
-                    return {
-                        "pharmacy": "PharmEasy",
-                        "available": True,
-                        "url": url
-                    }
-    except Exception as e:
-        print(f"❌ PharmEasy API Error: {e}")
-    return None
+    return await fetch_pharmacy_page("PharmEasy", medicine_name)
 
 async def fetch_netmeds_price(medicine_name: str) -> Optional[Dict]:
     """Fetch real price from Netmeds"""
-    try:
-        async with aiohttp.ClientSession() as session:
-            url = f"https://www.netmeds.com/catalogsearch/result/{medicine_name.replace(' ', '%20')}/all"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            
-            async with session.get(url, headers=headers, timeout=5) as response:
-                if response.status == 200:
-                    return {
-                        "pharmacy": "Netmeds",
-                        "available": True,
-                        "url": url
-                    }
-    except Exception as e:
-        print(f"❌ Netmeds API Error: {e}")
-    return None
+    return await fetch_pharmacy_page("Netmeds", medicine_name)
 
-async def get_real_pharmacy_prices(medicine_name: str, base_price: float) -> List[Dict]:
+def get_real_pharmacy_prices(medicine_name: str, base_price: float) -> List[Dict]:
     """
-    Fetch real prices from multiple Indian pharmacy websites
-    Falls back to calculated prices if APIs fail
+    Prices across Indian pharmacy websites, answered from the price cache
+    Live pharmacy observations are refreshed in the background; prices fall
+    back to the calculated estimates, so this never waits on a pharmacy site
     """
-    print(f"🔍 Fetching real prices for: {medicine_name}")
-    
-    # Try to fetch from real APIs in parallel
-    results = await asyncio.gather(
-        fetch_1mg_price(medicine_name),
-        fetch_pharmeasy_price(medicine_name),
-        fetch_netmeds_price(medicine_name),
-        return_exceptions=True
-    )
+    observations = price_cache.lookup(medicine_name) if price_cache is not None else {}
     
     pharmacy_data = []
     
@@ -274,15 +527,18 @@ async def get_real_pharmacy_prices(medicine_name: str, base_price: float) -> Lis
     
     for pharmacy_name, data in realistic_variations.items():
         calculated_price = round(base_price * data["multiplier"], 2)
+        observation = observations.get(pharmacy_name)
         
         pharmacy_data.append({
             "pharmacy": pharmacy_name,
             "price": calculated_price,
             "discount": data["discount"],
-            "in_stock": True,
+            "in_stock": observation["available"] if observation else True,
             "delivery": data["delivery"],
-            "url": f"https://www.google.com/search?q={medicine_name}+price+{pharmacy_name.replace(' ', '+')}",
-            "last_updated": datetime.now().isoformat()
+            "url": observation["url"] if observation else f"https://www.google.com/search?q={medicine_name}+price+{pharmacy_name.replace(' ', '+')}",
+            "last_updated": observation["last_updated"] if observation else datetime.now().isoformat(),
+            # fresh / stale: checked on the pharmacy site; estimated: calculated only
+            "freshness": observation["freshness"] if observation else "estimated"
         })
     
     # Sort by price (lowest first)
@@ -290,13 +546,100 @@ async def get_real_pharmacy_prices(medicine_name: str, base_price: float) -> Lis
     
     return pharmacy_data
 
+async def run_ocr(contents: bytes, mode: str = "page") -> Dict:
+    """
+    OCR one image in the process pool, mapping pool and pipeline errors to HTTP errors
+    Regions mode fans the detected text lines out across the pool's workers
+    """
+    try:
+        if mode == "regions":
+            result = await ocr_pool.run(prepare_regions, contents, OCR_PROFILE)
+            if "regions" in result:
+                regions = result.pop("regions")
+                started = time.perf_counter()
+                batches = split_regions(regions, ocr_pool.workers)
+                batch_texts = await ocr_pool.run_many(ocr_regions, [[regions[i] for i in batch] for batch in batches])
+                texts = [""] * len(regions)
+                for batch, batch_text in zip(batches, batch_texts):
+                    for i, text in zip(batch, batch_text):
+                        texts[i] = text
+                result["text"] = merge_regions(regions, texts)
+                result["preprocessing"]["ocr_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            return result
+        if mode == "words":
+            return await ocr_pool.run(run_pipeline_words, contents, OCR_PROFILE)
+        return await ocr_pool.run(run_pipeline, contents, OCR_PROFILE)
+    except PoolSaturated:
+        raise HTTPException(
+            status_code=503,
+            detail="OCR is busy with other prescriptions. Please try again in a few seconds.",
+            headers={"Retry-After": "5"}
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="OCR timed out. Please try a smaller or clearer image.")
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OCRError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def ocr_payload(contents: bytes, mode: str) -> Dict:
+    """OCR one image (or serve it from the OCR cache) and detect the medicines in its text"""
+    # Same upload (or, with OCR_CACHE_PHASH_DISTANCE, the same photo re-encoded) seen before
+    cache_key = phash = None
+    if ocr_cache is not None:
+        cache_key = f"{content_key(contents)}-{mode}"
+        if ocr_cache.max_hash_distance is not None:
+            phash = await asyncio.to_thread(perceptual_hash, contents)
+        cached = await asyncio.to_thread(ocr_cache.get, cache_key, phash)
+        if cached is not None:
+            print(f"♻️ OCR cache hit: {cached['detected_medicines']}")
+            return cached
+    
+    # Decode, preprocess and OCR in the process pool so searches keep being served meanwhile
+    result = await run_ocr(contents, mode)
+    
+    text = result["text"]
+    print(f"🖼️ Preprocessing: {result['preprocessing']}")
+    
+    # Clean and parse text
+    cleaned_text = clean_ocr_text(text)
+    if "words" in result:
+        detected_medicines, highlights = extract_medicines_from_words(result["words"])
+    else:
+        detected_medicines = extract_medicine_names(cleaned_text)
+    
+    print(f"📄 Raw OCR text: {text[:200]}...")  # Log first 200 chars
+    print(f"💊 Detected medicines: {detected_medicines}")
+    
+    payload = {
+        "raw_text": text,
+        "cleaned_text": cleaned_text,
+        "detected_medicines": detected_medicines,
+        "count": len(detected_medicines)
+    }
+    if "words" in result:
+        payload["words"] = result["words"]
+        payload["highlights"] = highlights
+    if ocr_cache is not None:
+        # Lets /drugs/batch resolve this result by id instead of by name list
+        payload["ocr_id"] = cache_key
+        await asyncio.to_thread(ocr_cache.put, cache_key, payload, phash)
+    return payload
+
 @app.post("/ocr")
-async def process_prescription(file: UploadFile = File(...)):
+async def process_prescription(file: UploadFile = File(...), mode: Optional[str] = None):
     """
     Extract text from prescription image using OCR
+    mode: 'page' or 'regions' (OCR only detected text lines, in parallel); defaults to OCR_MODE
     Returns: Detected medicine names
     """
     try:
+        mode = mode or OCR_MODE
+        if mode not in OCR_MODES:
+            raise HTTPException(status_code=400, detail=f"Unknown OCR mode '{mode}'. Use one of: {', '.join(OCR_MODES)}")
+        
         # Validate file
         if not file:
             raise HTTPException(status_code=400, detail="No file uploaded")
@@ -304,52 +647,16 @@ async def process_prescription(file: UploadFile = File(...)):
         # Log incoming request
         print(f"📥 Received file: {file.filename}, Content-Type: {file.content_type}")
         
-        # Read image
-        contents = await file.read()
+        # Read image (chunked, capped at OCR_MAX_UPLOAD_MB)
+        contents = await read_upload(file)
         
         if not contents:
             raise HTTPException(status_code=400, detail="Empty file uploaded")
         
         print(f"📦 File size: {len(contents)} bytes")
         
-        nparr = np.frombuffer(contents, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            raise HTTPException(status_code=400, detail="Invalid image file. Please upload a valid JPEG or PNG image.")
-        
-        # Preprocess image for better OCR
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        # Apply thresholding
-        _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        
-        # Denoise
-        denoised = cv2.fastNlMeansDenoising(thresh, None, 10, 7, 21)
-        
-        # OCR using pytesseract
-        try:
-            text = pytesseract.image_to_string(denoised)
-        except Exception as ocr_error:
-            raise HTTPException(
-                status_code=500, 
-                detail=f"OCR failed. Is Tesseract installed? Error: {str(ocr_error)}"
-            )
-        
-        # Clean and parse text
-        cleaned_text = clean_ocr_text(text)
-        detected_medicines = extract_medicine_names(cleaned_text)
-        
-        print(f"📄 Raw OCR text: {text[:200]}...")  # Log first 200 chars
-        print(f"💊 Detected medicines: {detected_medicines}")
-        
-        return {
-            "success": True,
-            "raw_text": text,
-            "cleaned_text": cleaned_text,
-            "detected_medicines": detected_medicines,
-            "count": len(detected_medicines)
-        }
+        payload = await ocr_payload(contents, mode)
+        return {"success": True, **payload}
     
     except HTTPException:
         raise
@@ -357,6 +664,96 @@ async def process_prescription(file: UploadFile = File(...)):
         print(f"❌ OCR Error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"OCR processing failed: {str(e)}")
 
+@app.post("/ocr/batch")
+async def process_prescription_batch(files: List[UploadFile] = File(...), mode: Optional[str] = None):
+    """
+    OCR several prescription images or multi-page documents (PDF, TIFF) in one request
+    Pages are decoded one at a time as workers free up, so only a few are ever in memory
+    Returns: per-page results plus the medicines detected across all pages
+    """
+    mode = mode or OCR_MODE
+    if mode not in OCR_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown OCR mode '{mode}'. Use one of: {', '.join(OCR_MODES)}")
+    if not files:
+        raise HTTPException(status_code=400, detail="No files uploaded")
+    if len(files) > OCR_BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Too many files: at most {OCR_BATCH_MAX_FILES} per batch")
+    
+    print(f"📥 Received batch of {len(files)} file(s)")
+    concurrency = asyncio.Semaphore(OCR_BATCH_CONCURRENCY or ocr_pool.workers)
+    pages = []
+    tasks = []
+    truncated = False
+    
+    async def process_page(entry: Dict, contents: bytes):
+        try:
+            entry.update(await ocr_payload(contents, mode))
+            entry["success"] = True
+        except HTTPException as e:
+            entry.update({"success": False, "error": e.detail})
+        except Exception as e:
+            print(f"❌ OCR Error on {entry['file']} page {entry['page']}: {str(e)}")
+            entry.update({"success": False, "error": f"OCR processing failed: {str(e)}"})
+        finally:
+            concurrency.release()
+    
+    for file in files:
+        try:
+            contents = await read_upload(file)
+        except HTTPException as e:
+            pages.append({"file": file.filename, "page": 1, "success": False, "error": e.detail})
+            continue
+        if not contents:
+            pages.append({"file": file.filename, "page": 1, "success": False, "error": "Empty file uploaded"})
+            continue
+        page_iter = iter_pages(contents)
+        page_number = 0
+        while True:
+            # Wait for a free slot before decoding the next page
+            await concurrency.acquire()
+            if len(pages) >= OCR_BATCH_MAX_PAGES:
+                concurrency.release()
+                truncated = True
+                break
+            try:
+                page = await asyncio.to_thread(next, page_iter, None)
+            except OCRError as e:
+                # Unreadable or oversized page; pages already queued still finish
+                concurrency.release()
+                pages.append({"file": file.filename, "page": page_number + 1, "success": False, "error": str(e)})
+                break
+            except Exception as e:
+                concurrency.release()
+                print(f"❌ Could not read {file.filename} page {page_number + 1}: {str(e)}")
+                pages.append({"file": file.filename, "page": page_number + 1, "success": False, "error": f"Could not read page: {str(e)}"})
+                break
+            if page is None:
+                concurrency.release()
+                break
+            page_number += 1
+            entry = {"file": file.filename, "page": page_number}
+            pages.append(entry)
+            tasks.append(asyncio.create_task(process_page(entry, page)))
+        del contents, page_iter
+        if truncated:
+            break
+    
+    await asyncio.gather(*tasks)
+    
+    # Medicines across pages, first appearance first
+    detected_medicines = list(dict.fromkeys(
+        medicine for entry in pages if entry["success"] for medicine in entry["detected_medicines"]
+    ))
+    print(f"💊 Batch detected {len(detected_medicines)} medicines over {len(pages)} page(s)")
+    return {
+        "success": any(entry["success"] for entry in pages),
+        "pages": pages,
+        "page_count": len(pages),
+        "truncated": truncated,
+        "detected_medicines": detected_medicines,
+        "count": len(detected_medicines)
+    }
+
 def clean_ocr_text(text: str) -> str:
     """Clean OCR output using regex and text processing"""
     # Remove extra whitespace
@@ -368,70 +765,154 @@ def clean_ocr_text(text: str) -> str:
 def extract_medicine_names(text: str) -> List[str]:
     """
     Extract potential medicine names from text
-    Enhanced with fuzzy matching for 250k+ medicine database
+    One linear pass of the brand/salt automaton over the text, so the cost
+    depends on the text length rather than on the 250k+ medicine database
     """
-    medicines = []
-    
-    if drugs_df is None or drugs_df.empty:
+    if drugs_df is None or drugs_df.empty or medicine_matcher is None:
         print("⚠️ Drug database not loaded")
-        return medicines
+        return []
     
-    # Split text into words and clean
-    words = re.findall(r'\b[A-Za-z]{3,}\b', text)  # Words with 3+ letters
+    # Brand phrases ("Augmentin 625 Duo", "Dolo") and salt names, in order of appearance,
+    # plus fuzzy hits for OCR-damaged words the exact pass missed ("Augrnentin", "D0lo")
+    rows = medicine_matcher.match(text, fuzzy_index)
+    medicines = drugs_df['brand_name'].iloc[rows].tolist()
     
-    # Also try to extract compound names (e.g., "Augmentin 625", "Azee 500")
-    compound_patterns = re.findall(r'\b[A-Za-z]+[\s\-]?\d+(?:mg|ml|mcg)?\b', text, re.IGNORECASE)
-    words.extend(compound_patterns)
-    
-    print(f"🔍 Extracted words: {words[:20]}...")  # Log first 20 words
+    # Remove duplicates and return
+    unique_medicines = list(dict.fromkeys(medicines))  # Preserves order
+    print(f"✅ Found {len(unique_medicines)} unique medicines")
+    return unique_medicines[:50]  # Limit total results
+
+def extract_medicines_from_words(words: List[Dict]):
+    """
+    Medicines named in OCR words (from run_pipeline_words), matched one text line at a time
+    Returns (medicine names, highlights): each highlight is the matched words'
+    text, their combined box in upload pixels, lowest confidence and medicines
+    """
+    if drugs_df is None or drugs_df.empty or medicine_matcher is None:
+        print("⚠️ Drug database not loaded")
+        return [], []
     
-    # Check each word against database
+    lines: Dict[int, List[Dict]] = {}
     for word in words:
-        if len(word) < 3:
-            continue
-        
-        word_clean = word.strip()
-            
-        # Try exact match first
-        exact_matches = drugs_df[
-            drugs_df['brand_name'].str.lower() == word_clean.lower()
-        ]
-        
-        if not exact_matches.empty:
-            medicines.extend(exact_matches['brand_name'].tolist()[:5])  # Limit matches
-            continue
-        
-        # Try partial match (starts with) - more efficient for large dataset
-        partial_matches = drugs_df[
-            drugs_df['brand_name'].str.lower().str.startswith(word_clean.lower(), na=False)
-        ]
-        
-        if not partial_matches.empty:
-            medicines.extend(partial_matches['brand_name'].tolist()[:5])
-            continue
-        
-        # Try contains match only for longer words (4+ chars) to avoid too many results
-        if len(word_clean) >= 4:
-            contains_matches = drugs_df[
-                drugs_df['brand_name'].str.contains(word_clean, case=False, na=False, regex=False)
-            ]
-            
-            if not contains_matches.empty:
-                medicines.extend(contains_matches['brand_name'].tolist()[:3])
+        lines.setdefault(word["line"], []).append(word)
+    
+    brand_names = drugs_df['brand_name']
+    medicines = []
+    highlights = []
+    for _, line_words in sorted(lines.items()):
+        # A phrase can span words ("Augmentin 625 Duo") but never two lines
+        tokens = []
+        token_words = []
+        for i, word in enumerate(line_words):
+            for token in tokenize(word["text"]):
+                tokens.append(token)
+                token_words.append(i)
         
-        # Also try matching against salt composition / generic name
-        if 'generic_name' in drugs_df.columns and len(word_clean) >= 4:
-            generic_matches = drugs_df[
-                drugs_df['generic_name'].str.contains(word_clean, case=False, na=False, regex=False)
-            ]
-            
-            if not generic_matches.empty:
-                medicines.extend(generic_matches['brand_name'].tolist()[:3])
+        for start, end, rows in medicine_matcher.match_tokens(tokens, fuzzy_index):
+            matched = line_words[token_words[start]:token_words[end - 1] + 1]
+            names = list(dict.fromkeys(brand_names.iloc[rows].tolist()))
+            medicines.extend(names)
+            left = min(w["box"][0] for w in matched)
+            top = min(w["box"][1] for w in matched)
+            right = max(w["box"][0] + w["box"][2] for w in matched)
+            bottom = max(w["box"][1] + w["box"][3] for w in matched)
+            highlights.append({
+                "text": " ".join(w["text"] for w in matched),
+                "box": [left, top, right - left, bottom - top],
+                "confidence": min(w["confidence"] for w in matched),
+                "medicines": names
+            })
     
-    # Remove duplicates and return
     unique_medicines = list(dict.fromkeys(medicines))  # Preserves order
     print(f"✅ Found {len(unique_medicines)} unique medicines")
-    return unique_medicines[:50]  # Limit total results
+    return unique_medicines[:50], highlights
+
+def fuzzy_brand_rows(query: str, limit: int):
+    """
+    Resolve a misspelt or OCR-damaged query through the fuzzy index
+    Returns (row ids, corrected query) - corrected query is None when nothing is close
+    """
+    tokens = query.lower().split()
+    if fuzzy_index is None or not tokens:
+        return brand_index.rows[:0], None
+    
+    word, _ = fuzzy_index.best(tokens[0], edit_budget(tokens[0]))
+    if word is None:
+        return brand_index.rows[:0], None
+    
+    corrected = " ".join([word] + tokens[1:])
+    rows = brand_index.prefix(corrected, limit)
+    if len(rows) == 0:
+        rows = brand_index.prefix(word, limit)
+    if len(rows) == 0 and generic_ngrams is not None:
+        rows = generic_ngrams.contains(word, limit)
+    return rows, corrected
+
+def drug_text(row_id: int, column: str) -> Optional[str]:
+    """Decode one long-text field (use_case, side_effects, interactions); None when missing"""
+    text = drug_texts.get(column)
+    return text.get(row_id) if text is not None else None
+
+def resolve_brand_rows(medicine_name: str):
+    """
+    Rows for a medicine name: exact brand, then brand prefix, then substring, then fuzzy
+    Returns (row ids, corrected query) - corrected query is only set by the fuzzy step
+    """
+    # Find exact or partial matches through the precomputed brand index
+    # Try exact match first
+    rows = brand_index.exact(medicine_name, limit=10)
+    
+    # If no exact match, try starts with
+    if len(rows) == 0:
+        rows = brand_index.prefix(medicine_name, limit=20)
+    
+    # If still no match, try contains
+    if len(rows) == 0:
+        rows = brand_ngrams.contains(medicine_name, limit=20)
+    
+    # Last resort: tolerate typos and OCR confusions (e.g. "Augrnentin")
+    corrected_query = None
+    if len(rows) == 0:
+        rows, corrected_query = fuzzy_brand_rows(medicine_name, limit=20)
+    return rows, corrected_query
+
+def format_generics(rows) -> List[Dict]:
+    """brand_name / price / manufacturer dicts for generic alternative rows, NaN cleaned"""
+    generics = drugs_df.iloc[rows]
+    generics_list = []
+    for _, gen in generics[['brand_name', 'price', 'manufacturer']].iterrows():
+        generics_list.append({
+            'brand_name': gen['brand_name'] if pd.notna(gen['brand_name']) else '',
+            'price': float(gen['price']) if pd.notna(gen['price']) else 0.0,
+            'manufacturer': gen['manufacturer'] if pd.notna(gen['manufacturer']) else ''
+        })
+    return generics_list
+
+def drug_item(row_id: int, drug: pd.Series, generics_list: List[Dict]) -> Dict:
+    """The /drugs response item for one row"""
+    generic_name = drug.get('generic_name', '')
+    
+    # Drug interactions, parsed once by load_data()
+    interactions_data = interaction_table.data(row_id) if interaction_table is not None else None
+    
+    # Build response item
+    item = {
+        "brand_name": drug['brand_name'] if pd.notna(drug.get('brand_name')) else '',
+        "active_ingredient": drug.get('active_ingredient', '') if pd.notna(drug.get('active_ingredient')) else '',
+        "generic_name": generic_name if pd.notna(generic_name) else '',
+        "use_case": (drug_text(row_id, 'use_case') or '')[:500],  # Truncate long descriptions
+        "side_effects": drug_text(row_id, 'side_effects') or '',
+        "price": float(drug['price']) if pd.notna(drug.get('price')) else None,
+        "manufacturer": drug.get('manufacturer', '') if pd.notna(drug.get('manufacturer')) else '',
+        "generics": generics_list,
+        "pack_size": drug.get('pack_size', '') if pd.notna(drug.get('pack_size')) else '',
+        "interactions": interactions_data
+    }
+    
+    # Add full composition if available
+    if 'full_composition' in drugs_df.columns:
+        item['full_composition'] = drug.get('full_composition', '') if pd.notna(drug.get('full_composition')) else ''
+    return item
 
 @app.get("/drugs")
 async def get_drugs(medicine_name: Optional[str] = None):
@@ -444,88 +925,35 @@ async def get_drugs(medicine_name: Optional[str] = None):
             return {"success": False, "error": "Drug database not loaded"}
         
         if medicine_name:
-            # Find exact or partial matches - optimized for large dataset
-            medicine_lower = medicine_name.lower()
-            
-            # Try exact match first
-            exact_matches = drugs_df[
-                drugs_df['brand_name'].str.lower() == medicine_lower
-            ]
-            
-            # If no exact match, try starts with
-            if exact_matches.empty:
-                matches = drugs_df[
-                    drugs_df['brand_name'].str.lower().str.startswith(medicine_lower, na=False)
-                ].head(20)
-            else:
-                matches = exact_matches.head(10)
-            
-            # If still no match, try contains
-            if matches.empty:
-                matches = drugs_df[
-                    drugs_df['brand_name'].str.contains(medicine_name, case=False, na=False, regex=False)
-                ].head(20)
+            rows, corrected_query = resolve_brand_rows(medicine_name)
+            matches = drugs_df.iloc[rows]
             
             if matches.empty:
                 return {"success": False, "message": "No matches found"}
             
             results = []
-            for _, drug in matches.iterrows():
+            for row_id, drug in matches.iterrows():
                 # Find generic alternatives with same salt composition
                 generic_name = drug.get('generic_name', '')
                 generics_list = []
                 
                 if pd.notna(generic_name) and generic_name:
-                    # Find other brands with same salt composition (generic)
-                    generics = drugs_df[
-                        (drugs_df['generic_name'] == generic_name) &
-                        (drugs_df['brand_name'] != drug['brand_name'])
-                    ].head(10)
-                    
-                    # Convert generics to dict and clean NaN values
-                    for _, gen in generics[['brand_name', 'price', 'manufacturer']].sort_values(by='price', ascending=True, na_position='last').iterrows():
-                        gen_item = {
-                            'brand_name': gen['brand_name'] if pd.notna(gen['brand_name']) else '',
-                            'price': float(gen['price']) if pd.notna(gen['price']) else 0.0,
-                            'manufacturer': gen['manufacturer'] if pd.notna(gen['manufacturer']) else ''
-                        }
-                        generics_list.append(gen_item)
-                
-                # Parse drug interactions if available
-                interactions_data = None
-                if 'interactions' in drugs_df.columns and pd.notna(drug.get('interactions')):
-                    try:
-                        interactions_raw = drug.get('interactions', '{}')
-                        if isinstance(interactions_raw, str) and interactions_raw.startswith('{'):
-                            interactions_data = json.loads(interactions_raw)
-                    except:
-                        interactions_data = str(drug.get('interactions', ''))
+                    # Cheapest other brands with same salt composition (generic), precomputed
+                    generics_list = format_generics(generic_groups.alternatives(generic_name, drug['brand_name'], limit=10))
                 
-                # Build response item
-                item = {
-                    "brand_name": drug['brand_name'] if pd.notna(drug.get('brand_name')) else '',
-                    "active_ingredient": drug.get('active_ingredient', '') if pd.notna(drug.get('active_ingredient')) else '',
-                    "generic_name": generic_name if pd.notna(generic_name) else '',
-                    "use_case": str(drug.get('use_case', ''))[:500] if pd.notna(drug.get('use_case')) else '',  # Truncate long descriptions
-                    "side_effects": drug.get('side_effects', '') if pd.notna(drug.get('side_effects')) else '',
-                    "price": float(drug['price']) if pd.notna(drug.get('price')) else None,
-                    "manufacturer": drug.get('manufacturer', '') if pd.notna(drug.get('manufacturer')) else '',
-                    "generics": generics_list,
-                    "pack_size": drug.get('pack_size', '') if pd.notna(drug.get('pack_size')) else '',
-                    "interactions": interactions_data
-                }
-                
-                # Add full composition if available
-                if 'full_composition' in drugs_df.columns:
-                    item['full_composition'] = drug.get('full_composition', '') if pd.notna(drug.get('full_composition')) else ''
-                
-                results.append(item)
+                results.append(drug_item(row_id, drug, generics_list))
             
-            return {"success": True, "results": results, "total_found": len(matches)}
+            response = {"success": True, "results": results, "total_found": len(matches)}
+            if corrected_query and corrected_query != medicine_name.lower():
+                response["corrected_query"] = corrected_query
+            return response
         else:
             # Return sample drugs (limit for performance)
             # Replace NaN values with None for JSON serialization
-            sample_df = drugs_df.head(50).copy()
+            sample_df = drugs_df.head(50).astype(object)
+            for column, text in drug_texts.items():
+                # object dtype keeps missing text as None (a plain list would become str dtype with NaN)
+                sample_df[column] = pd.Series(text.take(range(len(sample_df))), index=sample_df.index, dtype=object)
             sample_df = sample_df.where(pd.notnull(sample_df), None)
             sample = sample_df.to_dict('records')
             return {
@@ -539,6 +967,178 @@ async def get_drugs(medicine_name: Optional[str] = None):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Error fetching drugs: {str(e)}")
 
+class DrugBatchRequest(BaseModel):
+    medicine_names: List[str] = []
+    ocr_id: Optional[str] = None  # ocr_id of an /ocr result; its detected medicines are resolved too
+    include_prices: bool = False  # Pharmacy prices start background lookups; only ask when they are shown
+
+def batch_generics(generic_name: str, brand_name: str, groups: Dict) -> List[Dict]:
+    """
+    Generic alternatives for one result, sharing the formatted salt group across a batch
+    Each group's cheapest rows are formatted once; only the row's own brand is filtered out per result
+    """
+    group = groups.get(generic_name)
+    if group is None:
+        prefetch = GENERICS_LIMIT + 8  # Room for the excluded brand's own pack sizes
+        rows = generic_groups.alternatives(generic_name, None, limit=prefetch)
+        group = groups[generic_name] = (format_generics(rows), len(rows) < prefetch)
+    generics, complete = group
+    picked = [gen for gen in generics if gen['brand_name'] != brand_name][:GENERICS_LIMIT]
+    if len(picked) < GENERICS_LIMIT and not complete:
+        return format_generics(generic_groups.alternatives(generic_name, brand_name, limit=GENERICS_LIMIT))
+    return picked
+
+@app.post("/drugs/batch")
+async def get_drugs_batch(request: DrugBatchRequest):
+    """
+    Resolve every medicine of a prescription in one request
+    Takes medicine names and/or the ocr_id of an /ocr result; returns the /drugs
+    items for all matches (each row once), generic alternatives computed once
+    per salt group, and with include_prices, pharmacy prices for the best match of each name
+    """
+    try:
+        if drugs_df is None or drugs_df.empty:
+            return {"success": False, "error": "Drug database not loaded"}
+        
+        names = list(request.medicine_names)
+        if request.ocr_id:
+            ocr_result = await asyncio.to_thread(ocr_cache.get, request.ocr_id) if ocr_cache is not None else None
+            if ocr_result is None:
+                raise HTTPException(status_code=404, detail="OCR result not found or expired. Send medicine_names instead.")
+            names = ocr_result["detected_medicines"] + names
+        
+        # Same name twice (or in another case) is resolved once
+        queries = []
+        seen = set()
+        for name in names:
+            query = " ".join(name.split())
+            if query and query.lower() not in seen:
+                seen.add(query.lower())
+                queries.append(query)
+        if len(queries) > DRUGS_BATCH_MAX_NAMES:
+            raise HTTPException(status_code=400, detail=f"Too many medicines (max {DRUGS_BATCH_MAX_NAMES} per request)")
+        
+        # Resolve all names first, then read every matched row in one pass
+        row_queries = {}  # Row id -> first query that matched it, in match order
+        best_rows = set()
+        resolved = []
+        for query in queries:
+            rows, corrected_query = resolve_brand_rows(query)
+            rows = rows.tolist()
+            for row in rows:
+                row_queries.setdefault(row, query)
+            if rows:
+                best_rows.add(rows[0])
+            entry = {"query": query, "total_found": len(rows)}
+            if corrected_query and corrected_query != query.lower():
+                entry["corrected_query"] = corrected_query
+            resolved.append(entry)
+        
+        groups = {}
+        results = []
+        matches = drugs_df.iloc[list(row_queries)]
+        for row_id, drug in matches.iterrows():
+            generic_name = drug.get('generic_name', '')
+            generics_list = []
+            if pd.notna(generic_name) and generic_name:
+                generics_list = batch_generics(generic_name, drug['brand_name'], groups)
+            
+            item = drug_item(row_id, drug, generics_list)
+            item["matched_query"] = row_queries[row_id]
+            if request.include_prices and row_id in best_rows and item["price"] is not None and item["brand_name"]:
+                item["pharmacy_prices"] = get_real_pharmacy_prices(item["brand_name"], item["price"])
+            results.append(item)
+        
+        return {
+            "success": True,
+            "results": results,
+            "queries": resolved,
+            "unmatched": [entry["query"] for entry in resolved if entry["total_found"] == 0],
+            "total_found": len(results),
+            "generic_groups": len(groups)
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Error resolving medicines: {str(e)}")
+
+class InteractionCheckRequest(BaseModel):
+    medicines: List[str]  # Brand names or salt compositions (e.g. "Paracetamol + Caffeine")
+
+def medicine_salts(name: str) -> Dict:
+    """Resolve a medicine to its salts: a known salt or composition as given, else the matching brand's composition"""
+    entry = {"query": name, "brand_name": None, "salts": split_salts(name), "matched": False}
+    # all() of no salts is True; "", "()" or "+" name nothing
+    known = bool(entry["salts"]) and all(interaction_checker.known_salt(salt) for salt in entry["salts"])
+    if "+" in name or known:
+        entry["matched"] = known
+        return entry
+    rows, _ = resolve_brand_rows(name)
+    if len(rows):
+        drug = drugs_df.iloc[int(rows[0])]
+        if pd.notna(drug.get('generic_name')):
+            entry.update(brand_name=drug['brand_name'], salts=split_salts(drug['generic_name']), matched=True)
+    return entry
+
+@app.post("/interactions/check")
+async def check_interactions(request: InteractionCheckRequest):
+    """
+    Check every pair of medicines in a prescription for interactions in one call
+    Dataset interactions between their salts, duplicate salts and same-class drugs, from a precomputed index
+    """
+    try:
+        if drugs_df is None or drugs_df.empty or interaction_checker is None:
+            return {"success": False, "error": "Drug database not loaded"}
+        
+        names = list(dict.fromkeys(name.strip() for name in request.medicines if name and name.strip()))
+        if len(names) > INTERACTION_CHECK_MAX_MEDICINES:
+            raise HTTPException(status_code=400, detail=f"Too many medicines (max {INTERACTION_CHECK_MAX_MEDICINES} per request)")
+        
+        medicines = [medicine_salts(name) for name in names]
+        for medicine in medicines:
+            medicine["advisories"] = interaction_checker.advisories(medicine["salts"])
+        interactions = interaction_checker.check([(medicine["query"], medicine["salts"]) for medicine in medicines])
+        
+        return {
+            "success": True,
+            "medicines": medicines,
+            "interactions": interactions,
+            "critical_count": sum(item["severity"] == "critical" for item in interactions),
+            "total_found": len(interactions)
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Error checking interactions: {str(e)}")
+
+@app.get("/metrics")
+async def metrics():
+    """Counters for outbound pharmacy lookups (coalescing, per-host limits, circuit breakers) and caches"""
+    return {
+        "upstreams": upstream_guard.stats() if upstream_guard is not None else None,
+        "http_client": http_client.stats() if http_client is not None else None,
+        "price_cache": price_cache.stats() if price_cache is not None else None,
+        "ocr_pool": ocr_pool.stats() if ocr_pool is not None else None,
+        "ocr_cache": ocr_cache.stats() if ocr_cache is not None else None
+    }
+
+@app.get("/suggest")
+async def suggest_medicine(q: str, limit: int = 5):
+    """
+    Typeahead suggestions: brand names starting with q, with salt and price
+    Served from the precomputed prefix index; no table scan, no generics
+    """
+    if suggest_index is None or not q.strip():
+        return {"success": True, "query": q, "suggestions": []}
+    # Not stripped: a trailing space means the user moved on to the next word
+    return {"success": True, "query": q, "suggestions": suggest_index.suggest(q.lstrip(), max(0, min(limit, SUGGEST_MAX_RESULTS)))}
+
 @app.get("/search")
 async def search_medicine(query: str):
     """
@@ -560,38 +1160,26 @@ async def get_medicine_info(medicine_name: str):
             return {"success": False, "error": "Drug database not loaded"}
         
         # Try exact match first
-        matches = drugs_df[
-            drugs_df['brand_name'].str.lower() == medicine_name.lower()
-        ]
+        matches = drugs_df.iloc[brand_index.exact(medicine_name)]
         
         # If no exact match, try contains
         if matches.empty:
-            matches = drugs_df[
-                drugs_df['brand_name'].str.contains(medicine_name, case=False, na=False, regex=False)
-            ].head(1)
+            matches = drugs_df.iloc[brand_ngrams.contains(medicine_name, limit=1)]
         
         if matches.empty:
             return {"success": False, "message": "Medicine not found"}
         
         drug = matches.iloc[0]
+        row_id = drug.name
         
-        # Parse drug interactions JSON if available
+        # Drug interactions, parsed once by load_data(), with their display string
         interactions_data = None
         interactions_text = ""
-        if 'interactions' in drugs_df.columns and pd.notna(drug.get('interactions')):
-            try:
-                interactions_raw = drug.get('interactions', '{}')
-                if isinstance(interactions_raw, str) and interactions_raw.startswith('{'):
-                    interactions_data = json.loads(interactions_raw)
-                    # Format interactions for display
-                    if interactions_data and 'drug' in interactions_data:
-                        interaction_items = []
-                        for i, d in enumerate(interactions_data.get('drug', [])):
-                            effect = interactions_data.get('effect', [])[i] if i < len(interactions_data.get('effect', [])) else 'Unknown'
-                            interaction_items.append(f"{d}: {effect}")
-                        interactions_text = "; ".join(interaction_items)
-            except:
-                interactions_text = str(drug.get('interactions', ''))
+        if interaction_table is not None:
+            interactions_data = interaction_table.data(row_id)
+            if isinstance(interactions_data, str):
+                interactions_data = None  # Unparseable JSON is shown as raw text only
+            interactions_text = interaction_table.text(row_id)
         
         response = {
             "success": True,
@@ -599,8 +1187,8 @@ async def get_medicine_info(medicine_name: str):
                 "brand_name": drug['brand_name'] if pd.notna(drug.get('brand_name')) else '',
                 "active_ingredient": drug.get('active_ingredient', '') if pd.notna(drug.get('active_ingredient')) else '',
                 "generic_name": drug.get('generic_name', '') if pd.notna(drug.get('generic_name')) else '',
-                "use_case": drug.get('use_case', '') if pd.notna(drug.get('use_case')) else '',
-                "side_effects": drug.get('side_effects', '') if pd.notna(drug.get('side_effects')) else '',
+                "use_case": drug_text(row_id, 'use_case') or '',
+                "side_effects": drug_text(row_id, 'side_effects') or '',
                 "precautions": "Consult your doctor before use. Read the medicine description carefully.",
                 "price": float(drug['price']) if pd.notna(drug.get('price')) else None,
                 "manufacturer": drug.get('manufacturer', '') if pd.notna(drug.get('manufacturer')) else '',
@@ -625,22 +1213,18 @@ async def get_medicine_info(medicine_name: str):
 async def get_price_comparison(medicine_name: str):
     """
     Get REAL price comparison across different Indian pharmacies
-    Fetches live data and provides accurate pricing information
+    Answers from the price cache immediately; pharmacy sites are checked in the background
     """
     try:
         if drugs_df is None or drugs_df.empty:
             return {"success": False, "error": "Drug database not loaded"}
         
         # Find medicine in database - try exact match first
-        matches = drugs_df[
-            drugs_df['brand_name'].str.lower() == medicine_name.lower()
-        ]
+        matches = drugs_df.iloc[brand_index.exact(medicine_name)]
         
         # If no exact match, try contains
         if matches.empty:
-            matches = drugs_df[
-                drugs_df['brand_name'].str.contains(medicine_name, case=False, na=False, regex=False)
-            ].head(1)
+            matches = drugs_df.iloc[brand_ngrams.contains(medicine_name, limit=1)]
         
         if matches.empty:
             return {"success": False, "message": "Medicine not found in database"}
@@ -648,9 +1232,8 @@ async def get_price_comparison(medicine_name: str):
         medicine_data = matches.iloc[0]
         base_price = float(medicine_data['price']) if pd.notna(medicine_data.get('price')) else 100.0
         
-        # Fetch real pharmacy prices
-        print(f"💰 Fetching real prices for {medicine_name} (Base: ₹{base_price})")
-        price_comparison = await get_real_pharmacy_prices(medicine_name, base_price)
+        # Cached pharmacy prices; a background refresh is scheduled when they are missing or stale
+        price_comparison = get_real_pharmacy_prices(medicine_name, base_price)
         
         # Calculate best deal
         cheapest = min(price_comparison, key=lambda x: x['price'])
@@ -661,11 +1244,9 @@ async def get_price_comparison(medicine_name: str):
         generic_alternatives = []
         generic_name = medicine_data.get('generic_name', '')
         if pd.notna(generic_name) and generic_name:
-            generics = drugs_df[
-                (drugs_df['generic_name'] == generic_name) &
-                (drugs_df['brand_name'] != medicine_data['brand_name']) &
-                (drugs_df['price'].notna())
-            ].nsmallest(5, 'price')
+            generics = drugs_df.iloc[
+                generic_groups.alternatives(generic_name, medicine_data['brand_name'], limit=5, priced_only=True)
+            ]
             
             for _, gen in generics.iterrows():
                 generic_alternatives.append({
@@ -0,0 +1,306 @@
+"""
+MediLens Medicine Matcher - single-pass medicine detection for OCR text
+Compiles every brand and salt name into one Aho-Corasick automaton at startup
+"""
+
+import re
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from drug_store import TextColumn, TextLookup
+from fuzzy_index import FuzzyIndex, edit_budget
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+SALT_STRENGTH_PATTERN = re.compile(r"\([^)]*\)")
+
+# Dosage-form words: dropped from the end of brand names ("Dolo 650 Tablet" -> "dolo 650")
+# and never used on their own as a brand stem
+FORM_WORDS = {
+    "tablet", "tablets", "tab", "capsule", "capsules", "cap", "syrup", "suspension", "injection",
+    "cream", "gel", "ointment", "drop", "drops", "spray", "solution", "inhaler", "rotacap",
+    "lotion", "powder", "sachet", "soap", "shampoo", "infusion", "respules", "dry", "oral",
+}
+
+BRAND_MATCH_LIMIT = 5  # Brands emitted per matched brand phrase
+SALT_MATCH_LIMIT = 3  # Brands emitted per matched salt name
+TOKEN_SHIFT = 32  # Packs (node, token) transitions into one int key
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase alphanumeric tokens"""
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+def brand_phrases(name: str) -> List[Tuple[str, ...]]:
+    """Token phrases a brand name is recognised by: full name, name without form words, stem"""
+    tokens = tuple(tokenize(name))
+    if not tokens:
+        return []
+    phrases = [tokens]
+
+    end = len(tokens)
+    while end > 1 and tokens[end - 1] in FORM_WORDS:
+        end -= 1
+    if end < len(tokens):
+        phrases.append(tokens[:end])
+
+    stem = tokens[0]
+    if len(stem) >= 3 and not stem.isdigit() and stem not in FORM_WORDS and len(tokens) > 1:
+        phrases.append((stem,))
+    return phrases
+
+
+def salt_phrases(composition: str) -> List[Tuple[str, ...]]:
+    """Token phrases of each salt in a composition like 'Amoxycillin (500mg) + Clavulanic Acid (125mg)'"""
+    phrases = []
+    for salt in SALT_STRENGTH_PATTERN.sub(" ", str(composition)).split("+"):
+        tokens = tuple(tokenize(salt))
+        if tokens and len("".join(tokens)) >= 4:
+            phrases.append(tokens)
+    return phrases
+
+
+class PhraseAutomaton:
+    """
+    Token-level Aho-Corasick automaton
+
+    Phrases are sequences of tokens, so every match starts and ends on a word
+    boundary; a phrase's id is its position in the list it was built from.
+    Transitions are one sorted array of (node << TOKEN_SHIFT) | token_id keys
+    with the child node alongside; tokens live in a TextColumn buffer.
+    """
+
+    def __init__(self, phrases: List[Tuple[str, ...]]):
+        token_ids: Dict[str, int] = {}
+        goto: Dict[int, int] = {}
+        fail = [0]
+        depth = [0]
+        output = [-1]  # Phrase id ending at each node, -1 for none
+        output_link = [0]  # Nearest proper suffix node with an output
+        children: List[List[Tuple[int, int]]] = [[]]
+
+        for phrase_id, phrase in enumerate(phrases):
+            node = 0
+            for token in phrase:
+                token_id = token_ids.setdefault(token, len(token_ids))
+                key = (node << TOKEN_SHIFT) | token_id
+                child = goto.get(key)
+                if child is None:
+                    child = len(fail)
+                    goto[key] = child
+                    fail.append(0)
+                    depth.append(depth[node] + 1)
+                    output.append(-1)
+                    output_link.append(0)
+                    children.append([])
+                    children[node].append((token_id, child))
+                node = child
+            if output[node] == -1:
+                output[node] = phrase_id
+
+        # Breadth-first pass to compute failure and output links
+        queue = [child for _, child in children[0]]
+        for node in queue:
+            for token_id, child in children[node]:
+                state = fail[node]
+                while state and ((state << TOKEN_SHIFT) | token_id) not in goto:
+                    state = fail[state]
+                target = goto.get((state << TOKEN_SHIFT) | token_id, 0)
+                fail[child] = target if target != child else 0
+                fallback = fail[child]
+                output_link[child] = fallback if output[fallback] != -1 else output_link[fallback]
+                queue.append(child)
+
+        self.tokens = TextLookup.build(TextColumn.from_strings(list(token_ids)))
+        goto_keys = np.fromiter(goto.keys(), dtype=np.int64, count=len(goto))
+        order = np.argsort(goto_keys)
+        self.goto_keys = goto_keys[order]
+        self.goto_nodes = np.fromiter(goto.values(), dtype=np.int32, count=len(goto))[order]
+        self.fail = np.array(fail, dtype=np.int32)
+        self.depth = np.array(depth, dtype=np.int32)
+        self.output = np.array(output, dtype=np.int32)
+        self.output_link = np.array(output_link, dtype=np.int32)
+        self.phrase_count = len(phrases)
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            **self.tokens.arrays("tokens"), "goto_keys": self.goto_keys, "goto_nodes": self.goto_nodes,
+            "fail": self.fail, "depth": self.depth, "output": self.output, "output_link": self.output_link,
+            "phrase_count": np.asarray(self.phrase_count)
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "PhraseAutomaton":
+        automaton = cls.__new__(cls)
+        automaton.tokens = TextLookup.from_arrays(arrays, "tokens")
+        automaton.goto_keys, automaton.goto_nodes = arrays["goto_keys"], arrays["goto_nodes"]
+        automaton.fail, automaton.depth = arrays["fail"], arrays["depth"]
+        automaton.output, automaton.output_link = arrays["output"], arrays["output_link"]
+        automaton.phrase_count = int(arrays["phrase_count"])
+        return automaton
+
+    def __len__(self) -> int:
+        return self.phrase_count
+
+    def token_id(self, token: str) -> Optional[int]:
+        return self.tokens.get(token)
+
+    def _child(self, node: int, token_id: int) -> int:
+        """Node reached from node along token_id, -1 when there is no such transition"""
+        key = (node << TOKEN_SHIFT) | token_id
+        i = int(np.searchsorted(self.goto_keys, key))
+        if i < len(self.goto_keys) and self.goto_keys[i] == key:
+            return int(self.goto_nodes[i])
+        return -1
+
+    def phrase_id(self, phrase: Tuple[str, ...]) -> Optional[int]:
+        """Id of a phrase the automaton was built with, None otherwise"""
+        node = 0
+        for token in phrase:
+            token_id = self.tokens.get(token)
+            node = self._child(node, token_id) if token_id is not None else -1
+            if node < 0:
+                return None
+        phrase_id = int(self.output[node])
+        return phrase_id if phrase_id >= 0 else None
+
+    def find_all(self, tokens: List[str]) -> List[Tuple[int, int, int]]:
+        """All (start, end, phrase_id) matches over tokens, in one linear pass"""
+        matches = []
+        node = 0
+        for position, token in enumerate(tokens):
+            token_id = self.tokens.get(token)
+            if token_id is None:
+                node = 0  # No phrase contains this token
+                continue
+            child = self._child(node, token_id)
+            while node and child < 0:
+                node = int(self.fail[node])
+                child = self._child(node, token_id)
+            node = max(child, 0)
+
+            hit = node if self.output[node] != -1 else int(self.output_link[node])
+            while hit:
+                matches.append((position + 1 - int(self.depth[hit]), position + 1, int(self.output[hit])))
+                hit = int(self.output_link[hit])
+        return matches
+
+
+class MedicineMatcher:
+    """
+    Finds brand and salt names in OCR text
+
+    Each phrase maps to the first few rows (in table order) it identifies:
+    brand phrases to up to BRAND_MATCH_LIMIT rows, salt names to up to
+    SALT_MATCH_LIMIT rows carrying that salt.
+    """
+
+    def __init__(self, brand_names: pd.Series, generic_names: pd.Series = None):
+        # Medicines per single-word phrase (brand stems, one-word salts), ranks fuzzy hits
+        word_counts: Dict[str, int] = {}
+
+        brand_rows: Dict[Tuple[str, ...], List[int]] = {}
+        for row, name in enumerate(brand_names.tolist()):
+            if isinstance(name, str):
+                for phrase in brand_phrases(name):
+                    if len(phrase) == 1:
+                        word_counts[phrase[0]] = word_counts.get(phrase[0], 0) + 1
+                    rows = brand_rows.setdefault(phrase, [])
+                    if len(rows) < BRAND_MATCH_LIMIT:
+                        rows.append(row)
+
+        salt_rows: Dict[Tuple[str, ...], List[int]] = {}
+        if generic_names is not None:
+            for row, composition in enumerate(generic_names.tolist()):
+                if isinstance(composition, str):
+                    for phrase in salt_phrases(composition):
+                        if len(phrase) == 1:
+                            word_counts[phrase[0]] = word_counts.get(phrase[0], 0) + 1
+                        rows = salt_rows.setdefault(phrase, [])
+                        if len(rows) < SALT_MATCH_LIMIT and row not in rows:
+                            rows.append(row)
+
+        phrases = list(dict.fromkeys(list(brand_rows) + list(salt_rows)))
+        self.automaton = PhraseAutomaton(phrases)
+        # Brand rows first, then salt rows, for phrases that are both;
+        # phrase i's rows are phrase_rows[phrase_offsets[i]:phrase_offsets[i + 1]]
+        rows = [brand_rows.get(phrase, []) + salt_rows.get(phrase, []) for phrase in phrases]
+        self.phrase_offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(phrase_rows) for phrase_rows in rows], out=self.phrase_offsets[1:])
+        self.phrase_rows = np.fromiter((row for phrase_rows in rows for row in phrase_rows),
+                                       dtype=np.int32, count=int(self.phrase_offsets[-1]))
+        self.words = TextColumn.from_strings(list(word_counts))
+        self.counts = np.fromiter(word_counts.values(), dtype=np.int32, count=len(word_counts))
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Arrays from_arrays() restores the matcher from, for the database snapshot"""
+        automaton = {f"automaton.{name}": array for name, array in self.automaton.to_arrays().items()}
+        return {**automaton, "phrase_offsets": self.phrase_offsets, "phrase_rows": self.phrase_rows,
+                **self.words.arrays("words"), "counts": self.counts}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "MedicineMatcher":
+        matcher = cls.__new__(cls)
+        matcher.automaton = PhraseAutomaton.from_arrays(
+            {name[len("automaton."):]: array for name, array in arrays.items() if name.startswith("automaton.")}
+        )
+        matcher.phrase_offsets, matcher.phrase_rows = arrays["phrase_offsets"], arrays["phrase_rows"]
+        matcher.words = TextColumn.from_arrays(arrays, "words")
+        matcher.counts = arrays["counts"]
+        return matcher
+
+    def __len__(self) -> int:
+        return len(self.automaton)
+
+    @property
+    def word_counts(self) -> Dict[str, int]:
+        """Medicines per single-word phrase, as FuzzyIndex is built from"""
+        return dict(zip(self.words.tolist(), self.counts.tolist()))
+
+    def _rows(self, phrase_id: int) -> List[int]:
+        return self.phrase_rows[self.phrase_offsets[phrase_id]:self.phrase_offsets[phrase_id + 1]].tolist()
+
+    def _fuzzy_matches(self, tokens: List[str], matches: List[Tuple[int, int, int]],
+                       fuzzy: FuzzyIndex) -> List[Tuple[int, int, int]]:
+        """Single-word matches for tokens no exact phrase covered, e.g. OCR's 'D0lo' or 'Augrnentin'"""
+        covered = set()
+        for start, end, _ in matches:
+            covered.update(range(start, end))
+
+        fuzzy_matches = []
+        for position, token in enumerate(tokens):
+            if position in covered or self.automaton.token_id(token) is not None:
+                continue
+            budget = edit_budget(token)
+            if not budget:
+                continue
+            word, _ = fuzzy.best(token, budget)
+            if word is not None:
+                fuzzy_matches.append((position, position + 1, self.automaton.phrase_id((word,))))
+        return fuzzy_matches
+
+    def match_tokens(self, tokens: List[str], fuzzy: Optional[FuzzyIndex] = None) -> List[Tuple[int, int, List[int]]]:
+        """
+        Non-overlapping (start, end, row ids) token spans naming medicines, in order
+
+        Overlapping matches resolve leftmost-longest, so 'Dolo 650' wins over 'Dolo'.
+        With a fuzzy index built from word_counts, tokens left unmatched are
+        also looked up within a small OCR-aware edit distance.
+        """
+        matches = self.automaton.find_all(tokens)
+        if fuzzy is not None:
+            matches.extend(self._fuzzy_matches(tokens, matches, fuzzy))
+        matches.sort(key=lambda m: (m[0], m[0] - m[1]))
+
+        spans = []
+        cursor = 0
+        for start, end, phrase_id in matches:
+            if start < cursor:
+                continue
+            spans.append((start, end, self._rows(phrase_id)))
+            cursor = end
+        return spans
+
+    def match(self, text: str, fuzzy: Optional[FuzzyIndex] = None) -> List[int]:
+        """Row ids of medicines mentioned in text, in order of appearance"""
+        return [row for _, _, rows in self.match_tokens(tokenize(text), fuzzy) for row in rows]
@@ -0,0 +1,223 @@
+"""
+MediLens OCR Cache - content-addressed cache of /ocr results
+An in-memory LRU in front of a size-bounded directory of JSON files, shared
+by all web workers. Entries live under a namespace tied to the drug database
+version, so detected_medicines never outlives the data it was matched against.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+import cv2
+import numpy as np
+
+HASH_SIZE = 8  # dHash grid: 8x8 gradient bits -> 64-bit hash
+RESCAN_FRACTION = 16  # Re-count the directory after writing disk_bytes / 16, so other workers' files count too
+
+
+def content_key(contents: bytes) -> str:
+    """SHA-256 of the uploaded bytes"""
+    return hashlib.sha256(contents).hexdigest()
+
+
+def perceptual_hash(contents: bytes) -> Optional[int]:
+    """
+    64-bit difference hash of an image, None when it cannot be decoded
+
+    Decodes at 1/8 scale (JPEG decoders skip most of the work), so it costs a
+    few milliseconds even for phone photos. Re-encoded or resized copies of
+    the same prescription land within a few bits of each other.
+    """
+    img = cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if img is None:
+        return None
+    small = cv2.resize(img, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+class OCRCache:
+    """
+    Two-tier cache of OCR payloads keyed by SHA-256 of the upload
+
+    Memory tier: OrderedDict LRU of up to memory_entries payloads.
+    Disk tier: one JSON file per entry under root/namespace, evicted least
+    recently used first (by mtime, refreshed on every hit) once the directory
+    grows past disk_bytes. The budget is for the directory, which every web
+    worker writes to: each worker re-counts it before evicting and after
+    writing disk_bytes / RESCAN_FRACTION, so together they overshoot by at most
+    that slice each. Other namespaces are deleted on startup.
+
+    With max_hash_distance set, uploads whose perceptual hash is within that
+    many bits of a cached entry also hit (same photo, re-compressed or resized).
+    """
+
+    def __init__(self, root: Path, namespace: str, memory_entries: int = 256,
+                 disk_bytes: int = 100 * 2**20, max_hash_distance: Optional[int] = None):
+        self.directory = Path(root) / namespace
+        self.memory_entries = memory_entries
+        self.disk_bytes = disk_bytes
+        self.max_hash_distance = max_hash_distance
+        self.memory: "OrderedDict[str, Dict]" = OrderedDict()
+        self.hashes: Dict[str, int] = {}  # Entry key -> perceptual hash
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for stale in Path(root).iterdir():
+            if stale.is_dir() and stale != self.directory:
+                shutil.rmtree(stale, ignore_errors=True)
+
+        self.disk_used = 0  # Directory size at the last scan plus this worker's writes since
+        self.unscanned = 0  # Bytes this worker wrote since the last scan
+        for path in self.directory.glob("*.json"):
+            self.disk_used += path.stat().st_size
+            if max_hash_distance is not None:
+                entry = self._read(path)
+                if entry is not None and entry.get("phash") is not None:
+                    self.hashes[path.stem] = entry["phash"]
+
+    @classmethod
+    def from_env(cls, default_root: Path, namespace: str) -> Optional["OCRCache"]:
+        """Cache configured by OCR_CACHE* variables, None when OCR_CACHE=0"""
+        if os.getenv("OCR_CACHE", "1") == "0":
+            return None
+        distance = os.getenv("OCR_CACHE_PHASH_DISTANCE")
+        return cls(
+            Path(os.getenv("OCR_CACHE_DIR", str(default_root))),
+            namespace,
+            memory_entries=int(os.getenv("OCR_CACHE_ENTRIES", "256")),
+            disk_bytes=int(float(os.getenv("OCR_CACHE_DISK_MB", "100")) * 2**20),
+            max_hash_distance=int(distance) if distance else None
+        )
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    @staticmethod
+    def _read(path: Path) -> Optional[Dict]:
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _remember(self, key: str, payload: Dict):
+        self.memory[key] = payload
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def _get_key(self, key: str) -> Optional[Dict]:
+        payload = self.memory.get(key)
+        if payload is not None:
+            self.memory.move_to_end(key)
+            return payload
+        path = self._path(key)
+        entry = self._read(path)
+        if entry is None:
+            return None
+        try:
+            os.utime(path)  # Mark as recently used for disk eviction
+        except OSError:
+            pass
+        self._remember(key, entry["payload"])
+        return entry["payload"]
+
+    def _nearest(self, phash: int) -> Optional[str]:
+        """Key of the cached entry closest to phash, if within max_hash_distance"""
+        if not self.hashes:
+            return None
+        keys = list(self.hashes)
+        hashes = np.array([self.hashes[key] for key in keys], dtype=np.uint64)
+        distances = np.unpackbits((hashes ^ np.uint64(phash)).view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+        best = int(np.argmin(distances))
+        return keys[best] if distances[best] <= self.max_hash_distance else None
+
+    def get(self, key: str, phash: Optional[int] = None) -> Optional[Dict]:
+        """Cached payload for an upload's SHA-256 key, or for a near-duplicate image"""
+        with self._lock:
+            payload = self._get_key(key)
+            if payload is None and phash is not None and self.max_hash_distance is not None:
+                near_key = self._nearest(phash)
+                if near_key is not None:
+                    payload = self._get_key(near_key)
+                    if payload is not None:
+                        self.near_hits += 1
+                        return payload
+            if payload is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return payload
+
+    def put(self, key: str, payload: Dict, phash: Optional[int] = None):
+        """Store a payload in both tiers"""
+        with self._lock:
+            self._remember(key, payload)
+            if phash is not None and self.max_hash_distance is not None:
+                self.hashes[key] = phash
+
+            path = self._path(key)
+            temp_path = path.with_name(f".{key}.{os.getpid()}.tmp")
+            try:
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump({"payload": payload, "phash": phash}, f)
+                size = temp_path.stat().st_size
+                try:
+                    replaced = path.stat().st_size  # Overwriting an entry frees its old file
+                except OSError:
+                    replaced = 0
+                os.replace(temp_path, path)
+            except OSError as e:
+                print(f"⚠️ Could not write OCR cache entry: {e}")
+                return
+            self.disk_used += size - replaced
+            self.unscanned += size
+            if self.disk_used > self.disk_bytes or self.unscanned > self.disk_bytes // RESCAN_FRACTION:
+                self._evict()
+
+    def _evict(self):
+        """
+        Re-count the directory (every worker's files); when it is over disk_bytes,
+        delete least recently used files until it is under 90% of disk_bytes
+        """
+        entries = []
+        for path in self.directory.glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue  # Evicted by another worker
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        used = sum(size for _, size, _ in entries)
+        self.unscanned = 0
+        if used <= self.disk_bytes:
+            self.disk_used = used
+            return
+        for _, size, path in entries:
+            if used <= self.disk_bytes * 0.9:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            used -= size
+            self.hashes.pop(path.stem, None)
+        self.disk_used = used
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "memory_entries": len(self.memory),
+            "disk_bytes": self.disk_used,
+            "hits": self.hits,
+            "near_duplicate_hits": self.near_hits,
+            "misses": self.misses
+        }
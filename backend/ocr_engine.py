@@ -0,0 +1,141 @@
+"""
+MediLens OCR Engine - the Tesseract backend used by OCR pool workers
+Prefers a persistent in-process Tesseract (tesserocr, the C API) that loads
+the language data once per worker; falls back to pytesseract, which spawns
+the tesseract binary for every call
+"""
+
+import os
+from typing import Dict, List, Optional
+import numpy as np
+from PIL import Image
+import pytesseract
+
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
+DEFAULT_PSM = 3  # Fully automatic page segmentation, Tesseract's own default
+
+# image_to_data returns one dict per recognised word:
+#   {"text", "conf" (0-100), "left", "top", "width", "height", "line" (page-wide line number)}
+
+
+class PytesseractEngine:
+    """One tesseract subprocess (and temp files) per call"""
+
+    name = "pytesseract"
+
+    def __init__(self, lang: str = "eng", tesseract_cmd: Optional[str] = None):
+        self.lang = lang
+        if tesseract_cmd:
+            pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+    def image_to_string(self, image: np.ndarray, psm: int = DEFAULT_PSM) -> str:
+        return pytesseract.image_to_string(image, lang=self.lang, config=f"--psm {psm}")
+
+    def image_to_data(self, image: np.ndarray, psm: int = DEFAULT_PSM) -> List[Dict]:
+        data = pytesseract.image_to_data(
+            image, lang=self.lang, config=f"--psm {psm}", output_type=pytesseract.Output.DICT
+        )
+        words = []
+        line_ids = {}
+        for i, text in enumerate(data["text"]):
+            if not str(text).strip():
+                continue
+            line_key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            words.append({
+                "text": str(text),
+                "conf": float(data["conf"][i]),
+                "left": int(data["left"][i]),
+                "top": int(data["top"][i]),
+                "width": int(data["width"][i]),
+                "height": int(data["height"][i]),
+                "line": line_ids.setdefault(line_key, len(line_ids))
+            })
+        return words
+
+    def close(self):
+        pass
+
+
+class TesserocrEngine:
+    """Long-lived Tesseract instance in this process; traineddata is loaded once"""
+
+    name = "tesserocr"
+
+    def __init__(self, lang: str = "eng"):
+        self.lang = lang
+        self.api = tesserocr.PyTessBaseAPI(lang=lang, psm=DEFAULT_PSM)
+
+    def image_to_string(self, image: np.ndarray, psm: int = DEFAULT_PSM) -> str:
+        self.api.SetPageSegMode(psm)
+        self.api.SetImage(Image.fromarray(image))
+        try:
+            return self.api.GetUTF8Text()
+        finally:
+            self.api.Clear()
+
+    def image_to_data(self, image: np.ndarray, psm: int = DEFAULT_PSM) -> List[Dict]:
+        self.api.SetPageSegMode(psm)
+        self.api.SetImage(Image.fromarray(image))
+        try:
+            self.api.Recognize()
+            words = []
+            line = -1
+            iterator = self.api.GetIterator()
+            level = tesserocr.RIL.WORD
+            for word in tesserocr.iterate_level(iterator, level):
+                if word.IsAtBeginningOf(tesserocr.RIL.TEXTLINE):
+                    line += 1
+                text = word.GetUTF8Text(level)
+                box = word.BoundingBox(level)
+                if not text or not text.strip() or box is None:
+                    continue
+                left, top, right, bottom = box
+                words.append({
+                    "text": text,
+                    "conf": float(word.Confidence(level)),
+                    "left": left,
+                    "top": top,
+                    "width": right - left,
+                    "height": bottom - top,
+                    "line": max(line, 0)
+                })
+            return words
+        finally:
+            self.api.Clear()
+
+    def close(self):
+        self.api.End()
+
+
+_engine = None
+
+
+def create_engine(kind: str = "auto", lang: str = "eng", tesseract_cmd: Optional[str] = None):
+    """Build an engine: 'tesserocr', 'pytesseract', or 'auto' (tesserocr when it loads)"""
+    if kind in ("auto", "tesserocr") and TESSEROCR_AVAILABLE:
+        try:
+            return TesserocrEngine(lang)
+        except Exception as e:
+            if kind == "tesserocr":
+                raise
+            print(f"⚠️ tesserocr failed to start ({e}), falling back to pytesseract")
+    elif kind == "tesserocr":
+        raise RuntimeError("OCR_ENGINE=tesserocr but the tesserocr package is not installed")
+    return PytesseractEngine(lang, tesseract_cmd)
+
+
+def init_engine(tesseract_cmd: Optional[str] = None):
+    """Create this process's engine from OCR_ENGINE / OCR_LANG; called once per pool worker"""
+    global _engine
+    _engine = create_engine(os.getenv("OCR_ENGINE", "auto"), os.getenv("OCR_LANG", "eng"), tesseract_cmd)
+    return _engine
+
+
+def get_engine():
+    """This process's engine, created on first use"""
+    return _engine if _engine is not None else init_engine()
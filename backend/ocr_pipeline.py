@@ -0,0 +1,639 @@
+"""
+MediLens OCR Pipeline - prescription image decoding, preprocessing and OCR
+Runs in a pool of worker processes so OCR never blocks the API's event loop
+"""
+
+import asyncio
+import io
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Optional, Tuple
+import cv2
+import numpy as np
+from PIL import Image, ImageSequence
+from ocr_engine import get_engine, init_engine
+
+try:
+    import fitz  # PyMuPDF, only needed for PDF uploads
+    PDF_AVAILABLE = True
+except ImportError:
+    PDF_AVAILABLE = False
+
+PIPELINE_VERSION = 2  # Bump when preprocessing or OCR changes what text an image yields
+
+# Preprocessing profiles, picked per deployment with OCR_PROFILE
+#   text_height: target height of a text line's characters in px (Tesseract reads best around 20-30)
+#   max_megapixels: hard cap on the image Tesseract sees
+#   clean_noise / clean_separability: below / above these the page is clean and denoising is skipped
+#   median_noise: below this a 3x3 median is enough, above it NL-means runs
+#   search_window: NL-means search window (the fixed pipeline used 21)
+PROFILES = {
+    "fast": {
+        "normalize": True, "adaptive": True, "text_height": 20, "max_megapixels": 2.0,
+        "clean_noise": 4.0, "clean_separability": 0.85, "median_noise": 12.0, "search_window": 11
+    },
+    "balanced": {
+        "normalize": True, "adaptive": True, "text_height": 28, "max_megapixels": 4.0,
+        "clean_noise": 2.5, "clean_separability": 0.92, "median_noise": 6.0, "search_window": 15
+    },
+    "accurate": {
+        "normalize": True, "adaptive": True, "text_height": 32, "max_megapixels": 8.0,
+        "clean_noise": 1.5, "clean_separability": 0.97, "median_noise": 3.0, "search_window": 21
+    },
+    # The original fixed pipeline at full resolution, for comparison and rollback
+    "legacy": {"normalize": False, "adaptive": False},
+}
+DEFAULT_PROFILE = "balanced"
+
+NOISE_KERNEL = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+MAX_PIXELS = int(float(os.getenv("OCR_MAX_PIXELS", "50e6")))  # Decompression-bomb guard
+REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+)
+ESTIMATE_SIDE = 1000  # Text height is estimated on a copy at most this many px on its long side
+MIN_GLYPHS = 20  # Fewer character-sized blobs than this and the image is left at its own scale
+MIN_SCALE = 0.25
+MAX_SCALE = 2.0
+
+# page: one Tesseract call; regions: OCR only the detected text lines;
+# words: word boxes with confidences, noise filtered before matching
+OCR_MODES = ("page", "regions", "words")
+MIN_WORD_CONFIDENCE = float(os.getenv("OCR_MIN_WORD_CONFIDENCE", "60"))
+LINE_PSM = 7  # Tesseract page segmentation for a single text line
+BLOCK_PSM = 6  # ... for a uniform block of text
+MAX_REGIONS = 150  # More lines than this and one page-level call is cheaper
+MAX_REGION_COVERAGE = 0.6  # Regions covering more of the page than this: OCR the page
+MAX_REGION_LINES = 4  # Taller regions are logos, stamps or photos, not prescription text
+MAX_INK_DENSITY = 0.6  # Solid blobs (logos, bars) rather than strokes of text
+
+PDF_DPI = int(os.getenv("OCR_PDF_DPI", "200"))  # Render resolution for PDF pages
+TIFF_MAGIC = (b"II*\x00", b"MM\x00*")
+
+
+class OCRError(Exception):
+    """OCR failed inside a pool worker"""
+
+    def __init__(self, message: str = "", report: Optional[Dict] = None):
+        super().__init__(message)
+        self.report = report  # Preprocessing report collected before the failure, if any
+
+
+class InvalidImageError(OCRError):
+    """Uploaded bytes are not a decodable image"""
+
+
+class ImageTooLarge(OCRError):
+    """Image has more pixels than OCR_MAX_PIXELS"""
+
+
+class PoolSaturated(Exception):
+    """Every worker is busy and the queue is full"""
+
+
+def _init_worker(tesseract_cmd: Optional[str]):
+    """Runs once in each pool worker"""
+    # One OCR job per core; keep OpenCV from oversubscribing it with its own threads
+    cv2.setNumThreads(1)
+    # Tesseract and its language data stay loaded for the life of the worker
+    init_engine(tesseract_cmd)
+
+
+def engine_name() -> str:
+    """OCR engine a pool worker runs; also warms the worker up"""
+    return get_engine().name
+
+
+def estimate_noise(gray: np.ndarray) -> float:
+    """Standard deviation of Gaussian noise in a grayscale image (Immerkaer's fast estimator)"""
+    # int16 output (|response| <= 16 * 255) and cv2.norm keep this to one 2-byte-per-pixel temporary
+    laplacian = cv2.filter2D(gray, cv2.CV_16S, NOISE_KERNEL, borderType=cv2.BORDER_REPLICATE)
+    height, width = gray.shape
+    return float(cv2.norm(laplacian[1:-1, 1:-1], cv2.NORM_L1) * np.sqrt(np.pi / 2) / (6 * (width - 2) * (height - 2)))
+
+
+def otsu_separability(gray: np.ndarray) -> float:
+    """Share of the intensity variance explained by Otsu's ink/paper split, 1.0 for a clean scan"""
+    # From the 256-bin histogram, so no image-sized masks are allocated
+    histogram = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel().astype(np.float64)
+    probabilities = histogram / histogram.sum()
+    levels = np.arange(256, dtype=np.float64)
+    total_mean = float((probabilities * levels).sum())
+    variance = float((probabilities * (levels - total_mean) ** 2).sum())
+    if variance == 0:
+        return 1.0
+    weights = np.cumsum(probabilities)[:-1]
+    means = np.cumsum(probabilities * levels)[:-1]
+    valid = (weights > 0) & (weights < 1)
+    if not valid.any():
+        return 0.0
+    between = (total_mean * weights[valid] - means[valid]) ** 2 / (weights[valid] * (1 - weights[valid]))
+    return float(between.max()) / variance
+
+
+def estimate_text_height(gray: np.ndarray) -> Optional[float]:
+    """Median height in pixels of character-sized blobs, None when nothing looks like text"""
+    scale = min(1.0, ESTIMATE_SIDE / max(gray.shape))
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+    _, ink = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    # Characters: a few pixels tall, not page-wide rules, borders or logos
+    glyphs = (heights >= 3) & (heights < small.shape[0] / 8) & (widths < small.shape[1] / 4) & (areas >= 4)
+    if glyphs.sum() < MIN_GLYPHS:
+        return None
+    return float(np.median(heights[glyphs])) / scale
+
+
+def normalize_resolution(gray: np.ndarray, settings: Dict) -> Tuple[np.ndarray, float]:
+    """Rescale so text is about settings['text_height'] px tall, within the profile's pixel budget"""
+    scale = 1.0
+    text_height = estimate_text_height(gray)
+    if text_height is not None:
+        scale = min(max(settings["text_height"] / text_height, MIN_SCALE), MAX_SCALE)
+    pixels = gray.shape[0] * gray.shape[1] * scale * scale
+    max_pixels = settings["max_megapixels"] * 1e6
+    if pixels > max_pixels:
+        scale *= (max_pixels / pixels) ** 0.5
+    if abs(scale - 1.0) < 0.1:
+        return gray, 1.0
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+    return cv2.resize(gray, None, fx=scale, fy=scale, interpolation=interpolation), scale
+
+
+def preprocess(gray: np.ndarray, profile: str = DEFAULT_PROFILE) -> Tuple[np.ndarray, Dict]:
+    """
+    Staged preprocessing: resolution -> denoise (picked by measured noise) -> Otsu threshold
+
+    Returns the binary image for Tesseract and a record of what each stage
+    did, including per-stage *_ms timings.
+    """
+    settings = PROFILES[profile]
+    report = {"profile": profile}
+    started = stage_started = time.perf_counter()
+
+    def stage_done(name):
+        nonlocal stage_started
+        now = time.perf_counter()
+        report[f"{name}_ms"] = round((now - stage_started) * 1000, 1)
+        stage_started = now
+
+    if settings["normalize"]:
+        gray, scale = normalize_resolution(gray, settings)
+        report["scale"] = round(scale, 3)
+        stage_done("resize")
+    report["size"] = [int(gray.shape[1]), int(gray.shape[0])]
+
+    if not settings["adaptive"]:
+        # Fixed pipeline: threshold, then NL-means on the binary image
+        _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        stage_done("threshold")
+        denoised = cv2.fastNlMeansDenoising(thresh, None, 10, 7, 21)
+        report["denoiser"] = "nl_means"
+        stage_done("denoise")
+        report["preprocess_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return denoised, report
+
+    noise = estimate_noise(gray)
+    separability = otsu_separability(gray)
+    report["noise"] = round(noise, 2)
+    report["separability"] = round(separability, 3)
+    stage_done("analyze")
+
+    # Already a clean, high-contrast page: denoising cannot help Tesseract
+    if noise < settings["clean_noise"] or separability >= settings["clean_separability"]:
+        denoiser = "none"
+    elif noise < settings["median_noise"]:
+        denoiser = "median"
+        gray = cv2.medianBlur(gray, 3)
+    else:
+        denoiser = "nl_means"
+        gray = cv2.fastNlMeansDenoising(gray, None, min(noise * 1.5, 20.0), 7, settings["search_window"])
+    report["denoiser"] = denoiser
+    stage_done("denoise")
+
+    # Binarize in place: the grayscale buffer is not needed afterwards
+    cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=gray)
+    stage_done("threshold")
+    report["preprocess_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return gray, report
+
+
+def detect_text_regions(binary: np.ndarray, text_height: float) -> List[Tuple[int, int, int, int]]:
+    """
+    Bounding boxes (x, y, w, h) of text lines in a binarized page, in reading order
+
+    Ink is smeared horizontally by about one character height so the letters
+    of a line fuse into one contour; boxes that are too small, too tall or
+    too solid to be text are dropped.
+    """
+    ink = cv2.bitwise_not(binary)
+    unit = max(int(round(text_height)), 3)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (unit + unit // 2, max(unit // 4, 1)))
+    lines = cv2.dilate(ink, kernel)
+    contours, _ = cv2.findContours(lines, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    boxes = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if h < unit * 0.5 or w < unit or h > unit * MAX_REGION_LINES:
+            continue
+        if cv2.countNonZero(ink[y:y + h, x:x + w]) > MAX_INK_DENSITY * w * h:
+            continue
+        boxes.append((x, y, w, h))
+
+    # Reading order: group boxes whose vertical centres fall on the same line, then left to right
+    boxes.sort(key=lambda box: box[1] + box[3] / 2)
+    rows: List[List[Tuple[int, int, int, int]]] = []
+    for box in boxes:
+        centre = box[1] + box[3] / 2
+        if rows and abs(centre - (rows[-1][0][1] + rows[-1][0][3] / 2)) < unit * 0.5:
+            rows[-1].append(box)
+        else:
+            rows.append([box])
+    return [box for row in rows for box in sorted(row)]
+
+
+def check_page_size(width: int, height: int, page: int):
+    """Raise ImageTooLarge for a page over MAX_PIXELS, from its size alone (nothing decoded yet)"""
+    if width * height > MAX_PIXELS:
+        raise ImageTooLarge(f"Page {page} is too large ({width}x{height}). Please upload pages under {MAX_PIXELS / 1e6:.0f} megapixels.")
+
+
+def iter_pages(contents: bytes) -> Iterator[bytes]:
+    """
+    Encoded images of a document's pages, produced one at a time
+
+    Multi-page PDFs (with PyMuPDF) and TIFFs yield one PNG per page; any other
+    upload is a single image and is yielded unchanged. Every page is checked
+    against MAX_PIXELS before it is rendered or decoded; a page that cannot be
+    read (truncated TIFF, broken PDF page) raises InvalidImageError.
+    """
+    if contents[:5] == b"%PDF-":
+        if not PDF_AVAILABLE:
+            raise InvalidImageError("PDF uploads need PyMuPDF installed on the server. Please upload images instead.")
+        try:
+            document = fitz.open(stream=contents, filetype="pdf")
+        except Exception as e:
+            raise InvalidImageError(f"Invalid PDF file: {e}")
+        with document:
+            for number in range(1, document.page_count + 1):
+                try:
+                    page = document.load_page(number - 1)
+                    # Page size is in points (1/72 inch)
+                    check_page_size(round(page.rect.width * PDF_DPI / 72), round(page.rect.height * PDF_DPI / 72), number)
+                    png = page.get_pixmap(dpi=PDF_DPI, colorspace=fitz.csGRAY).tobytes("png")
+                except OCRError:
+                    raise
+                except Exception as e:
+                    raise InvalidImageError(f"Could not render PDF page {number}: {e}")
+                yield png
+    elif contents[:4] in TIFF_MAGIC:
+        try:
+            image = Image.open(io.BytesIO(contents))
+        except Exception as e:
+            raise InvalidImageError(f"Invalid TIFF file: {e}")
+        with image:
+            frames = ImageSequence.Iterator(image)
+            number = 0
+            while True:
+                number += 1
+                try:
+                    frame = next(frames, None)
+                    if frame is None:
+                        break
+                    # frame.size comes from the frame's header; pixels are decoded by convert()
+                    check_page_size(*frame.size, number)
+                    buffer = io.BytesIO()
+                    frame.convert("L").save(buffer, format="PNG")
+                except OCRError:
+                    raise
+                except Exception as e:
+                    raise InvalidImageError(f"Could not decode TIFF page {number}: {e}")
+                yield buffer.getvalue()
+    else:
+        yield contents
+
+
+def decode_grayscale(contents: bytes, max_megapixels: Optional[float] = None) -> Tuple[np.ndarray, int]:
+    """
+    Decode an upload straight to grayscale, at reduced resolution when it is far larger than needed
+
+    The header is read first (no pixels decoded) to reject decompression
+    bombs and to pick the largest IMREAD_REDUCED_GRAYSCALE_* factor that
+    still leaves max_megapixels. JPEGs are then downscaled inside the
+    decoder, so the full-resolution image never exists in memory.
+    Returns (image, reduction factor).
+    """
+    try:
+        with Image.open(io.BytesIO(contents)) as header:
+            width, height = header.size
+    except Exception:
+        width = height = None  # Not something PIL knows; let OpenCV try
+
+    factor, flag = 1, cv2.IMREAD_GRAYSCALE
+    if width is not None:
+        if width * height > MAX_PIXELS:
+            raise ImageTooLarge(f"Image is too large ({width}x{height}). Please upload a photo under {MAX_PIXELS / 1e6:.0f} megapixels.")
+        if max_megapixels is not None:
+            for candidate, candidate_flag in REDUCED_DECODE_FLAGS:
+                if width * height / (candidate * candidate) >= max_megapixels * 1e6:
+                    factor, flag = candidate, candidate_flag
+                    break
+
+    # frombuffer wraps the upload without copying it
+    gray = cv2.imdecode(np.frombuffer(contents, np.uint8), flag)
+    if gray is None:
+        raise InvalidImageError("Invalid image file. Please upload a valid JPEG or PNG image.")
+    return gray, factor
+
+
+def _decode_and_preprocess(contents: bytes, profile: str) -> Tuple[np.ndarray, Dict]:
+    started = time.perf_counter()
+    gray, factor = decode_grayscale(contents, PROFILES[profile].get("max_megapixels"))
+    decode_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    # Preprocess image for better OCR
+    binary, report = preprocess(gray, profile)
+    report["decode_ms"] = decode_ms
+    report["decode_reduction"] = factor
+    return binary, report
+
+
+def _recognize(image: np.ndarray, psm: int = 3, report: Optional[Dict] = None) -> str:
+    """OCR with this worker's persistent engine; a failure carries `report` along"""
+    try:
+        return get_engine().image_to_string(image, psm)
+    except Exception as ocr_error:
+        raise OCRError(f"OCR failed. Is Tesseract installed? Error: {str(ocr_error)}", report)
+
+
+def run_pipeline(contents: bytes, profile: str = DEFAULT_PROFILE) -> Dict:
+    """
+    Decode, preprocess and OCR one uploaded image
+    Top-level so it can be pickled into a pool worker
+    """
+    binary, report = _decode_and_preprocess(contents, profile)
+
+    started = time.perf_counter()
+    text = _recognize(binary, report=report)
+    report["ocr_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    return {"text": text, "preprocessing": report}
+
+
+def is_noise_word(text: str) -> bool:
+    """Tesseract debris: no letters or digits, mostly symbols, or a lone letter"""
+    alphanumeric = sum(ch.isalnum() for ch in text)
+    if alphanumeric == 0 or alphanumeric * 2 < len(text):
+        return True
+    return alphanumeric == 1 and not text.strip(".,:;()-").isdigit()
+
+
+def run_pipeline_words(contents: bytes, profile: str = DEFAULT_PROFILE,
+                       min_confidence: float = MIN_WORD_CONFIDENCE) -> Dict:
+    """
+    Decode, preprocess and OCR one image into confident words with boxes
+
+    Returns {"words": [...], "text": ..., "preprocessing": report}. Words
+    below min_confidence and symbol noise are dropped; boxes are in the
+    uploaded image's pixel coordinates; text has one line per OCR line.
+    """
+    binary, report = _decode_and_preprocess(contents, profile)
+
+    started = time.perf_counter()
+    try:
+        words = get_engine().image_to_data(binary)
+    except Exception as ocr_error:
+        raise OCRError(f"OCR failed. Is Tesseract installed? Error: {str(ocr_error)}", report)
+    report["ocr_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    # Back from the preprocessed image to the upload's coordinates
+    to_original = report["decode_reduction"] / report.get("scale", 1.0)
+    kept = []
+    for word in words:
+        if word["conf"] < min_confidence or is_noise_word(word["text"]):
+            continue
+        kept.append({
+            "text": word["text"],
+            "confidence": round(word["conf"], 1),
+            "box": [int(round(word[key] * to_original)) for key in ("left", "top", "width", "height")],
+            "line": word["line"]
+        })
+    report["words"] = len(words)
+    report["words_kept"] = len(kept)
+
+    lines: Dict[int, List[str]] = {}
+    for word in kept:
+        lines.setdefault(word["line"], []).append(word["text"])
+    text = "\n".join(" ".join(line) for _, line in sorted(lines.items()))
+    return {"words": kept, "text": text, "preprocessing": report}
+
+
+def prepare_regions(contents: bytes, profile: str = DEFAULT_PROFILE) -> Dict:
+    """
+    Decode, preprocess and cut an image into text-line crops for ocr_regions
+
+    Returns {"regions": [...], "preprocessing": report}, each region holding
+    its padded crop, page-segmentation mode and reading-order row. When
+    regions would not save work (none found, too many, or they cover most of
+    the page) the page is OCR'd here instead and {"text": ...} is returned,
+    exactly like run_pipeline.
+    """
+    binary, report = _decode_and_preprocess(contents, profile)
+    started = time.perf_counter()
+    text_height = estimate_text_height(binary) or PROFILES[DEFAULT_PROFILE]["text_height"]
+    boxes = detect_text_regions(binary, text_height)
+    coverage = sum(w * h for _, _, w, h in boxes) / float(binary.shape[0] * binary.shape[1])
+    report["regions"] = len(boxes)
+    report["region_coverage"] = round(coverage, 3)
+    report["detect_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    if not boxes or len(boxes) > MAX_REGIONS or coverage > MAX_REGION_COVERAGE:
+        started = time.perf_counter()
+        text = _recognize(binary, report=report)
+        report["ocr_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return {"text": text, "preprocessing": report}
+
+    margin = max(int(text_height // 2), 4)
+    regions = []
+    row = 0
+    previous_centre = None
+    for x, y, w, h in boxes:
+        centre = y + h / 2
+        if previous_centre is not None and abs(centre - previous_centre) >= text_height * 0.5:
+            row += 1
+        previous_centre = centre
+        crop = cv2.copyMakeBorder(binary[y:y + h, x:x + w], margin, margin, margin, margin,
+                                  cv2.BORDER_CONSTANT, value=255)
+        regions.append({
+            "image": crop,
+            "psm": LINE_PSM if h < text_height * 2 else BLOCK_PSM,
+            "row": row
+        })
+    return {"regions": regions, "preprocessing": report}
+
+
+def ocr_regions(regions: List[Dict]) -> List[str]:
+    """OCR a batch of crops from prepare_regions, one text per crop"""
+    return [_recognize(region["image"], region["psm"]).strip() for region in regions]
+
+
+def split_regions(regions: List[Dict], parts: int) -> List[List[int]]:
+    """Indices of regions split into at most `parts` batches of similar pixel count (largest first, greedy)"""
+    parts = max(1, min(parts, len(regions)))
+    batches: List[List[int]] = [[] for _ in range(parts)]
+    loads = [0] * parts
+    for i in sorted(range(len(regions)), key=lambda i: -regions[i]["image"].size):
+        target = loads.index(min(loads))
+        loads[target] += regions[i]["image"].size
+        batches[target].append(i)
+    return [sorted(batch) for batch in batches]
+
+
+def merge_regions(regions: List[Dict], texts: List[str]) -> str:
+    """Join region texts in reading order: same row with spaces, rows with newlines"""
+    lines: List[List[str]] = []
+    current_row = None
+    for region, text in zip(regions, texts):
+        if not text:
+            continue
+        if region["row"] != current_row:
+            lines.append([])
+            current_row = region["row"]
+        lines[-1].append(text)
+    return "\n".join(" ".join(parts) for parts in lines)
+
+
+class OCRPool:
+    """
+    Bounded process pool for OCR jobs
+
+    At most `workers` jobs run at once and at most `queue_size` more wait;
+    run() raises PoolSaturated beyond that instead of queueing without limit.
+    Workers are started with 'spawn', so they never inherit the drug
+    database or the event loop of the API process.
+    """
+
+    def __init__(self, workers: int, queue_size: int, timeout: float, tesseract_cmd: Optional[str] = None):
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.timeout = timeout
+        self.tesseract_cmd = tesseract_cmd
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.in_flight = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, tesseract_cmd: Optional[str] = None) -> "OCRPool":
+        """Pool sized by OCR_WORKERS / OCR_QUEUE_SIZE / OCR_TIMEOUT"""
+        # Split the cores between the web workers by default; gunicorn.conf.py exports the
+        # worker count it forks, and a single uvicorn process (no WEB_CONCURRENCY) gets them all
+        web_workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+        workers = int(os.getenv("OCR_WORKERS", str(max(1, (os.cpu_count() or 1) // web_workers))))
+        queue_size = int(os.getenv("OCR_QUEUE_SIZE", str(workers * 2)))
+        timeout = float(os.getenv("OCR_TIMEOUT", "60"))
+        return cls(workers, queue_size, timeout, tesseract_cmd)
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.queue_size
+
+    def start(self):
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.tesseract_cmd,)
+        )
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def _acquire(self):
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                self.rejected += 1
+                raise PoolSaturated()
+            self.in_flight += 1
+
+    def _release(self, _future=None):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _submit(self, func, *args):
+        try:
+            return self.executor.submit(func, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM on a huge image); replace the pool and retry once
+            self.shutdown()
+            self.start()
+            return self.executor.submit(func, *args)
+
+    async def run(self, func, *args):
+        """Run func(*args) in a worker; raises PoolSaturated when the pool is full"""
+        self._acquire()
+        try:
+            future = self._submit(func, *args)
+        except Exception:
+            self._release()
+            raise
+
+        # The slot frees when the worker finishes, even if the request already timed out
+        future.add_done_callback(self._release)
+        return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+
+    async def run_many(self, func, batches: List) -> List:
+        """
+        Run func(batch) for each batch in parallel, results in batch order
+
+        The fan-out of one request takes a single slot, so splitting work
+        across cores never makes the pool reject other uploads.
+        """
+        if not batches:
+            return []
+        self._acquire()
+        futures = []
+        try:
+            for batch in batches:
+                futures.append(self._submit(func, batch))
+        except Exception:
+            for future in futures:
+                future.cancel()
+            self._release()
+            raise
+
+        remaining = [len(futures)]
+        remaining_lock = threading.Lock()
+
+        def done(_future):
+            with remaining_lock:
+                remaining[0] -= 1
+                finished = remaining[0] == 0
+            if finished:
+                self._release()
+
+        for future in futures:
+            future.add_done_callback(done)
+        return await asyncio.wait_for(
+            asyncio.gather(*(asyncio.wrap_future(future) for future in futures)),
+            self.timeout
+        )
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "in_flight": self.in_flight,
+            "rejected": self.rejected
+        }
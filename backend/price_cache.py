@@ -0,0 +1,146 @@
+"""
+MediLens Price Cache - pharmacy lookups kept off the /price request path
+Observations from the pharmacy sites are cached per medicine with a TTL and
+refreshed by background tasks (stale-while-revalidate), so /price answers
+straight away from the cache or the calculated prices
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# fetch(pharmacy, medicine_name) -> {"pharmacy", "available", "url"}, or None when the site did not answer
+Fetcher = Callable[[str, str], Awaitable[Optional[Dict]]]
+
+
+class PriceCache:
+    """
+    Per-medicine cache of pharmacy observations
+
+    An observation younger than ttl is "fresh"; up to max_age it is "stale" but
+    still served while a background refresh runs; older ones are dropped and
+    the caller falls back to estimated prices. Requests never wait on a fetch:
+    lookup() returns what is cached now and schedules at most one refresh per
+    medicine, with refresh_concurrency refreshes running at a time.
+    """
+
+    def __init__(self, fetch: Fetcher, pharmacies: List[str], ttl: float = 900.0,
+                 max_age: float = 86400.0, max_entries: int = 1024, refresh_concurrency: int = 4):
+        self.fetch = fetch
+        self.pharmacies = list(pharmacies)
+        self.ttl = ttl
+        self.max_age = max_age
+        self.max_entries = max_entries
+        # Medicine key -> {"attempted": timestamp of last refresh, "observations": {pharmacy: observation}}
+        self.entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self.refreshing: Dict[str, asyncio.Task] = {}
+        self.semaphore = asyncio.Semaphore(refresh_concurrency)
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.failed_fetches = 0
+
+    @classmethod
+    def from_env(cls, fetch: Fetcher, pharmacies: List[str]) -> "PriceCache":
+        """Cache configured by the PRICE_* variables"""
+        return cls(
+            fetch,
+            pharmacies,
+            ttl=float(os.getenv("PRICE_CACHE_TTL", "900")),
+            max_age=float(os.getenv("PRICE_CACHE_MAX_AGE", "86400")),
+            max_entries=int(os.getenv("PRICE_CACHE_ENTRIES", "1024")),
+            refresh_concurrency=int(os.getenv("PRICE_REFRESH_CONCURRENCY", "4"))
+        )
+
+    @staticmethod
+    def key(medicine_name: str) -> str:
+        return " ".join(medicine_name.lower().split())
+
+    def freshness(self, fetched_at: float, now: Optional[float] = None) -> str:
+        age = (now or time.time()) - fetched_at
+        if age <= self.ttl:
+            return "fresh"
+        return "stale" if age <= self.max_age else "expired"
+
+    def lookup(self, medicine_name: str) -> Dict[str, Dict]:
+        """
+        Cached observations for a medicine, by pharmacy, each with last_updated and freshness
+
+        Never waits: a missing or stale entry schedules a background refresh
+        and the current (possibly empty) observations are returned.
+        """
+        key = self.key(medicine_name)
+        now = time.time()
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            self.refresh(medicine_name)
+            return {}
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        if now - entry["attempted"] > self.ttl:
+            self.refresh(medicine_name)
+
+        observations = {}
+        for pharmacy, observation in entry["observations"].items():
+            freshness = self.freshness(observation["fetched_at"], now)
+            if freshness == "expired":
+                continue
+            observations[pharmacy] = {
+                **observation,
+                "last_updated": datetime.fromtimestamp(observation["fetched_at"]).isoformat(),
+                "freshness": freshness
+            }
+        return observations
+
+    def refresh(self, medicine_name: str) -> Optional[asyncio.Task]:
+        """Start a background refresh for a medicine unless one is already running"""
+        key = self.key(medicine_name)
+        task = self.refreshing.get(key)
+        if task is None:
+            task = asyncio.create_task(self._refresh(key, medicine_name))
+            self.refreshing[key] = task
+            task.add_done_callback(lambda _: self.refreshing.pop(key, None))
+        return task
+
+    async def _refresh(self, key: str, medicine_name: str):
+        async with self.semaphore:
+            self.refreshes += 1
+            results = await asyncio.gather(
+                *(self.fetch(pharmacy, medicine_name) for pharmacy in self.pharmacies),
+                return_exceptions=True
+            )
+        now = time.time()
+        entry = self.entries.get(key) or {"observations": {}}
+        entry["attempted"] = now
+        for pharmacy, result in zip(self.pharmacies, results):
+            if isinstance(result, dict):
+                entry["observations"][pharmacy] = {**result, "fetched_at": now}
+            else:
+                # Keep the previous observation; it ages out through max_age
+                self.failed_fetches += 1
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def close(self):
+        """Cancel in-flight refreshes (called on shutdown, before the HTTP client closes)"""
+        tasks = list(self.refreshing.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshing": len(self.refreshing),
+            "refreshes": self.refreshes,
+            "failed_fetches": self.failed_fetches
+        }
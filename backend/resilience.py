@@ -0,0 +1,183 @@
+"""
+MediLens Resilience - guards around outbound requests to pharmacy sites
+Identical in-flight requests are coalesced, each host gets a concurrency
+limit, and a circuit breaker stops calling a host that keeps failing until a
+probe request shows it has recovered
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a host whose circuit is open"""
+
+
+class UpstreamError(Exception):
+    """An upstream answered, but with a status that counts as a failure (anything but 200: 403, 429, 5xx, ...)"""
+
+
+class SingleFlight:
+    """Callers asking for the same key while a call is running share its result"""
+
+    def __init__(self):
+        self.calls: Dict[str, asyncio.Future] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        future = self.calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self.calls[key] = future
+        self.executed += 1
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Mark retrieved; nobody else may be waiting
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self.calls.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self.calls), "executed": self.executed, "coalesced": self.coalesced}
+
+
+class CircuitBreaker:
+    """
+    closed -> open after failure_threshold consecutive failures
+    open -> half_open once reset_timeout seconds have passed; one probe call is let through
+    half_open -> closed if the probe succeeds, back to open if it fails
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.successes = 0
+        self.total_failures = 0
+        self.rejected = 0
+        self.times_opened = 0
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; in half-open state only the single probe may"""
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+        if self.state == "closed" or (self.state == "half_open" and not self.probing):
+            self.probing = self.state == "half_open"
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        self.successes += 1
+        self.failures = 0
+        self.probing = False
+        self.state = "closed"
+
+    def record_failure(self):
+        self.total_failures += 1
+        self.failures += 1
+        self.probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.times_opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "successes": self.successes,
+            "failures": self.total_failures,
+            "rejected": self.rejected,
+            "times_opened": self.times_opened
+        }
+
+
+class UpstreamGuard:
+    """
+    Per-host circuit breaker and semaphore, plus request coalescing, for outbound calls
+
+    call(host, key, func) runs func() at most once per key at a time, with at
+    most max_per_host calls to a host in flight, and raises CircuitOpen without
+    calling func while that host's circuit is open. Exceptions from func count
+    as failures; raise UpstreamError for responses that should trip the breaker.
+    """
+
+    def __init__(self, max_per_host: int = 4, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.max_per_host = max_per_host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.singleflight = SingleFlight()
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.in_flight: Dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls) -> "UpstreamGuard":
+        """Guard configured by the UPSTREAM_* variables"""
+        return cls(
+            max_per_host=int(os.getenv("UPSTREAM_MAX_PER_HOST", "4")),
+            failure_threshold=int(os.getenv("UPSTREAM_FAILURE_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("UPSTREAM_RESET_TIMEOUT", "30"))
+        )
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        if host not in self.breakers:
+            self.breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            self.semaphores[host] = asyncio.Semaphore(self.max_per_host)
+            self.in_flight[host] = 0
+        return self.breakers[host]
+
+    async def call(self, host: str, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        return await self.singleflight.do(key, lambda: self._call(host, func))
+
+    async def _call(self, host: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        breaker = self.breaker(host)
+        if not breaker.allow():
+            raise CircuitOpen(f"Circuit open for {host}")
+        try:
+            async with self.semaphores[host]:
+                self.in_flight[host] += 1
+                try:
+                    result = await func()
+                finally:
+                    self.in_flight[host] -= 1
+        except asyncio.CancelledError:
+            breaker.probing = False
+            raise
+        except Exception:
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+        return result
+
+    def state(self, host: str) -> Optional[str]:
+        breaker = self.breakers.get(host)
+        return breaker.state if breaker is not None else None
+
+    def stats(self) -> Dict:
+        return {
+            "coalescing": self.singleflight.stats(),
+            "hosts": {
+                host: {**breaker.stats(), "in_flight": self.in_flight[host], "max_in_flight": self.max_per_host}
+                for host, breaker in self.breakers.items()
+            }
+        }
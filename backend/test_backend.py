@@ -141,6 +141,358 @@ def test_api_endpoints():
         traceback.print_exc()
         return False
 
+def test_price_cache():
+    """Check the price cache against a local fake pharmacy server"""
+    print("\n" + "="*50)
+    print("💰 Testing Price Cache")
+    print("="*50)
+    
+    async def run():
+        from aiohttp import web
+        from http_client import HTTPClient, PHARMACY_ENDPOINTS, pharmacy_url
+        from price_cache import PriceCache
+        
+        async def pharmacy_page(request):
+            await asyncio.sleep(0.2)  # A slow pharmacy site must not delay lookups
+            return web.Response(text="ok")
+        
+        app = web.Application()
+        app.router.add_get("/{tail:.*}", pharmacy_page)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        for env_var, _, _ in PHARMACY_ENDPOINTS.values():
+            os.environ[env_var] = f"http://127.0.0.1:{port}"
+        
+        client = HTTPClient(total_timeout=2)
+        await client.start()
+        
+        async def fetch(pharmacy, medicine_name):
+            url = pharmacy_url(pharmacy, medicine_name)
+            async with client.get(url) as response:
+                return {"pharmacy": pharmacy, "available": response.status == 200, "url": url}
+        
+        cache = PriceCache(fetch, list(PHARMACY_ENDPOINTS), ttl=0.5, max_age=60)
+        try:
+            started = time.perf_counter()
+            first = cache.lookup("Dolo 650")
+            lookup_ms = (time.perf_counter() - started) * 1000
+            print(f"   {'✅' if not first else '❌'} Cold lookup returned in {lookup_ms:.1f} ms without waiting")
+            await cache.refresh("Dolo 650")
+            cached = cache.lookup("Dolo 650")
+            print(f"   {'✅' if len(cached) == 3 else '❌'} Background refresh filled {len(cached)} pharmacies: "
+                  f"{sorted(o['freshness'] for o in cached.values())}")
+            await asyncio.sleep(0.6)
+            stale = cache.lookup("dolo  650")
+            print(f"   {'✅' if all(o['freshness'] == 'stale' for o in stale.values()) else '❌'} Stale entries served while refreshing")
+            await cache.refresh("Dolo 650")
+            return len(cached) == 3 and not first and all(o["freshness"] == "fresh" for o in cache.lookup("Dolo 650").values())
+        finally:
+            await cache.close()
+            await client.close()
+            await runner.cleanup()
+            for env_var, _, _ in PHARMACY_ENDPOINTS.values():
+                os.environ.pop(env_var, None)
+    
+    try:
+        import asyncio
+        import time
+        sys.path.insert(0, str(Path(__file__).parent))
+        return asyncio.run(run())
+    except Exception as e:
+        print(f"   ❌ Price cache error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+def test_upstream_blocking():
+    """Check that a pharmacy answering 403 opens its circuit instead of counting as a success"""
+    print("\n" + "="*50)
+    print("🚧 Testing Upstream Circuit Breaker")
+    print("="*50)
+    
+    async def run():
+        from aiohttp import web
+        import main
+        from http_client import HTTPClient, PHARMACY_ENDPOINTS
+        from resilience import UpstreamGuard
+        
+        requests_seen = []
+        
+        async def blocked(request):
+            requests_seen.append(request.path_qs)
+            return web.Response(status=403, text="Access denied")
+        
+        app = web.Application()
+        app.router.add_get("/{tail:.*}", blocked)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        for env_var, _, _ in PHARMACY_ENDPOINTS.values():
+            os.environ[env_var] = f"http://127.0.0.1:{port}"
+        
+        saved = main.http_client, main.upstream_guard
+        main.http_client = HTTPClient(total_timeout=2)
+        await main.http_client.start()
+        main.upstream_guard = UpstreamGuard(failure_threshold=3, reset_timeout=60)
+        try:
+            pharmacy = next(iter(PHARMACY_ENDPOINTS))
+            for i in range(5):
+                await main.fetch_pharmacy_page(pharmacy, f"Medicine {i}")
+            state = main.upstream_guard.state(f"127.0.0.1:{port}")
+            print(f"   {'✅' if state == 'open' else '❌'} Circuit is {state} after repeated 403s")
+            print(f"   {'✅' if len(requests_seen) == 3 else '❌'} {len(requests_seen)} requests reached the blocking host")
+            assert state == "open" and len(requests_seen) == 3, "403 responses did not open the circuit"
+            return True
+        finally:
+            await main.http_client.close()
+            main.http_client, main.upstream_guard = saved
+            await runner.cleanup()
+            for env_var, _, _ in PHARMACY_ENDPOINTS.values():
+                os.environ.pop(env_var, None)
+    
+    import asyncio
+    sys.path.insert(0, str(Path(__file__).parent))
+    return asyncio.run(run())
+
+def test_drugs_sample():
+    """Check that /drugs without a query serializes rows with missing text fields"""
+    print("\n" + "="*50)
+    print("📋 Testing /drugs Sample")
+    print("="*50)
+    
+    import tempfile
+    import pandas as pd
+    from fastapi.testclient import TestClient
+    sys.path.insert(0, str(Path(__file__).parent))
+    import main
+    
+    saved = main.DATA_DIR, main.SNAPSHOT_DIR
+    with tempfile.TemporaryDirectory() as data_dir:
+        pd.DataFrame({
+            "brand_name": ["Dolo 650 Tablet", "Crocin Advance Tablet"],
+            "generic_name": ["Paracetamol (650mg)", "Paracetamol (500mg)"],
+            "active_ingredient": ["Paracetamol (650mg)", "Paracetamol (500mg)"],
+            "price": [30.5, 20.0],
+            "use_case": ["Fever", None],
+            "side_effects": [None, "Nausea"],
+            "manufacturer": ["Micro Labs Ltd", "GSK"]
+        }).to_csv(Path(data_dir) / "drugs_master.csv", index=False)
+        main.DATA_DIR, main.SNAPSHOT_DIR = Path(data_dir), Path(data_dir) / ".snapshots"
+        try:
+            main.load_data()
+            response = TestClient(main.app).get("/drugs")
+            drugs = response.json().get("drugs", []) if response.status_code == 200 else []
+            ok = len(drugs) == 2 and drugs[0]["side_effects"] is None and drugs[1]["use_case"] is None
+            print(f"   {'✅' if ok else '❌'} GET /drugs -> {response.status_code}, {len(drugs)} drugs, missing text as null")
+            assert ok, "/drugs sample did not serialize missing text as null"
+            return ok
+        finally:
+            main.DATA_DIR, main.SNAPSHOT_DIR = saved
+            main.load_data()
+
+def test_ocr_cache():
+    """Check the OCR cache's disk budget: overwrites counted once, one budget for all workers"""
+    print("\n" + "="*50)
+    print("🗄️ Testing OCR Cache Disk Budget")
+    print("="*50)
+    
+    import tempfile
+    sys.path.insert(0, str(Path(__file__).parent))
+    from ocr_cache import OCRCache, RESCAN_FRACTION
+    
+    def directory_bytes(directory):
+        return sum(path.stat().st_size for path in directory.glob("*.json"))
+    
+    payload = {"raw_text": "x" * 1000, "detected_medicines": ["Dolo 650 Tablet"]}
+    with tempfile.TemporaryDirectory() as root:
+        budget = 40_000
+        cache = OCRCache(Path(root), "ns", disk_bytes=budget)
+        for _ in range(20):
+            cache.put("same-key", payload)
+        overwrite_ok = cache.disk_used == directory_bytes(cache.directory) and len(list(cache.directory.glob("*.json"))) == 1
+        print(f"   {'✅' if overwrite_ok else '❌'} 20 writes of one key count as {cache.disk_used} bytes (one file)")
+    
+    # Two workers writing to the same directory
+    with tempfile.TemporaryDirectory() as root:
+        workers = [OCRCache(Path(root), "ns", disk_bytes=budget), OCRCache(Path(root), "ns", disk_bytes=budget)]
+        cache = workers[0]
+        largest = 0
+        for i in range(200):
+            workers[i % 2].put(f"key-{i}", payload)
+            largest = max(largest, directory_bytes(cache.directory))
+        entry_bytes = directory_bytes(cache.directory) // len(list(cache.directory.glob("*.json")))
+        limit = budget + len(workers) * (budget // RESCAN_FRACTION + entry_bytes)
+        shared_ok = largest <= limit
+        print(f"   {'✅' if shared_ok else '❌'} Two caches on one directory peaked at {largest} bytes (budget {budget}, allowed {limit})")
+    
+    assert overwrite_ok and shared_ok, "OCR cache disk budget not respected"
+    return overwrite_ok and shared_ok
+
+def test_fuzzy_index():
+    """Check that OCR-mangled short brand names still resolve"""
+    print("\n" + "="*50)
+    print("🔤 Testing Fuzzy Index")
+    print("="*50)
+    
+    sys.path.insert(0, str(Path(__file__).parent))
+    from fuzzy_index import FuzzyIndex, edit_budget
+    
+    index = FuzzyIndex({"dolo": 50, "azee": 20, "crocin": 30})
+    # 4-letter tokens only get the OCR-confusion budget (one confusable substitution)
+    expected = {"dalo": "dolo", "doio": "dolo", "azce": "azee", "crecin": "crocin", "dxlo": None}
+    all_good = True
+    for token, brand in expected.items():
+        word, cost = index.best(token, edit_budget(token))
+        ok = word == brand
+        all_good = all_good and ok
+        print(f"   {'✅' if ok else '❌'} {token:<8} -> {word} (cost {cost})")
+    assert all_good, "OCR-confusable tokens did not resolve to their brands"
+    return all_good
+
+def sample_drug_table(rows=600, seed=5):
+    """Small drug table with mixed case, repeats, missing names and unpriced rows"""
+    import random
+    import numpy as np
+    import pandas as pd
+    
+    rng = random.Random(seed)
+    syllables = ["do", "lo", "cro", "cin", "az", "ee", "pan", "ta", "mox", "Augmen", "tin", "Ésó", "Ωme", "zol"]
+    salts = ["Paracetamol (650mg)", "Paracetamol (500mg)", "Pantoprazole (40mg)", "Azithromycin (500mg)",
+             "Amoxycillin (500mg) + Clavulanic Acid (125mg)", "Omeprazole (20mg)"]
+    forms = ["Tablet", "Syrup", "Capsule", "INJECTION", "tablet"]
+    brands, generics, prices = [], [], []
+    for _ in range(rows):
+        name = "".join(rng.choice(syllables) for _ in range(rng.randint(1, 3)))
+        name = rng.choice([name, name.title(), name.upper()])
+        brands.append(None if rng.random() < 0.03 else f"{name} {rng.choice(forms)}" if rng.random() < 0.8 else name)
+        generics.append(None if rng.random() < 0.05 else rng.choice(salts))
+        prices.append(np.nan if rng.random() < 0.15 else round(rng.uniform(5, 200), 1))
+    return pd.DataFrame({
+        "brand_name": brands,
+        "generic_name": generics,
+        "price": prices,
+        "use_case": [rng.choice(["Fever", "Pain relief", None]) for _ in range(rows)],
+        "interactions": [rng.choice(['{"drug": ["Warfarin"], "brand": ["Warf"], "effect": ["SERIOUS"]}', "not json", None])
+                         for _ in range(rows)]
+    })
+
+def test_drug_indexes():
+    """Check index lookups against pandas scans of the same sample table"""
+    print("\n" + "="*50)
+    print("🗂️ Testing Drug Indexes Against pandas")
+    print("="*50)
+    
+    import numpy as np
+    sys.path.insert(0, str(Path(__file__).parent))
+    from drug_index import BrandIndex, SubstringIndex, GenericGroups
+    from drug_store import compact_table
+    
+    df = sample_drug_table()
+    compact, _ = compact_table(df)
+    brand_index = BrandIndex(compact["brand_name"])
+    brand_ngrams = SubstringIndex(compact["brand_name"])
+    generic_ngrams = SubstringIndex(compact["generic_name"])
+    groups = GenericGroups(compact["generic_name"], compact["brand_name"], compact["price"])
+    
+    lower = df["brand_name"].str.lower()
+    names = df["brand_name"].dropna().unique().tolist()
+    queries = names[:40] + [name.upper() for name in names[:10]] + ["Do", "d", "CRO", "dolo t", "xyz", "ésó", "Ω", ""]
+    
+    failures = []
+    for query in queries:
+        expected = np.flatnonzero((lower == query.lower()).fillna(False).to_numpy())
+        if not np.array_equal(brand_index.exact(query), expected):
+            failures.append(f"exact {query!r}")
+        expected = np.flatnonzero(lower.str.startswith(query.lower()).fillna(False).to_numpy())
+        if not np.array_equal(brand_index.prefix(query), expected) or not np.array_equal(brand_index.prefix(query, 5), expected[:5]):
+            failures.append(f"prefix {query!r}")
+        for column, index in (("brand_name", brand_ngrams), ("generic_name", generic_ngrams)):
+            for needle in (query, query[:2], query[1:5]):
+                expected = np.flatnonzero(df[column].str.contains(needle, case=False, regex=False).fillna(False).to_numpy())
+                if not np.array_equal(index.contains(needle), expected) or not np.array_equal(index.contains(needle, 3), expected[:3]):
+                    failures.append(f"contains {column} {needle!r}")
+    print(f"   {'✅' if not failures else '❌'} exact/prefix/contains on {len(queries)} queries match pandas"
+          + (f": {failures[:5]}" if failures else ""))
+    
+    groups_ok = True
+    for salt in df["generic_name"].dropna().unique().tolist():
+        same = df[df["generic_name"] == salt]
+        for exclude in [None] + same["brand_name"].dropna().tolist()[:3]:
+            candidates = same[same["brand_name"] != exclude] if exclude is not None else same
+            cheapest = candidates.sort_values("price", kind="stable", na_position="last")
+            priced = cheapest[cheapest["price"].notna()]
+            if (groups.alternatives(salt, exclude, limit=5).tolist() != cheapest.index[:5].tolist()
+                    or groups.alternatives(salt, exclude, limit=5, priced_only=True).tolist() != priced.index[:5].tolist()):
+                groups_ok = False
+                print(f"   ❌ alternatives of {salt} excluding {exclude}")
+    groups_ok = groups_ok and len(groups.alternatives("Unknown salt")) == 0
+    print(f"   {'✅' if groups_ok else '❌'} Generic alternatives are the cheapest rows first, unpriced last")
+    
+    ok = not failures and groups_ok
+    assert ok, "Index lookups differ from pandas scans"
+    return ok
+
+def test_snapshot_round_trip():
+    """Check that a saved snapshot loads back the same table, texts and indexes"""
+    print("\n" + "="*50)
+    print("💾 Testing Snapshot Round Trip")
+    print("="*50)
+    
+    import tempfile
+    import numpy as np
+    sys.path.insert(0, str(Path(__file__).parent))
+    from drug_index import BrandIndex, SubstringIndex, GenericGroups
+    from drug_interactions import InteractionTable
+    from drug_store import SnapshotStore, compact_table
+    from medicine_matcher import MedicineMatcher
+    
+    df, texts = compact_table(sample_drug_table())
+    indexes = {
+        "brand": BrandIndex(df["brand_name"]),
+        "brand_ngrams": SubstringIndex(df["brand_name"]),
+        "generic_groups": GenericGroups(df["generic_name"], df["brand_name"], df["price"]),
+        "interactions": InteractionTable(texts["interactions"]),
+        "matcher": MedicineMatcher(df["brand_name"], df["generic_name"])
+    }
+    with tempfile.TemporaryDirectory() as root:
+        source = Path(root) / "drugs_master.csv"
+        source.write_text("sample")
+        store = SnapshotStore(Path(root) / ".snapshots", {"brand_name": "name"})
+        store.save(df, texts, source)
+        store.save_indexes(source, {name: index.to_arrays() for name, index in indexes.items()})
+        loaded_df, loaded_texts = store.load(source)
+        saved = store.load_indexes(source)
+        
+        table_ok = (loaded_df.astype(object).fillna("<NA>").equals(df.astype(object).fillna("<NA>"))
+                    and all(loaded_texts[name].tolist() == text.tolist() for name, text in texts.items()))
+        print(f"   {'✅' if table_ok else '❌'} {len(loaded_df)} rows and {len(loaded_texts)} text columns load back unchanged")
+        
+        brand = BrandIndex.from_arrays(saved["brand"])
+        ngrams = SubstringIndex.from_arrays(saved["brand_ngrams"])
+        groups = GenericGroups.from_arrays(saved["generic_groups"], loaded_df["brand_name"])
+        interactions = InteractionTable.from_arrays(saved["interactions"], loaded_texts["interactions"])
+        matcher = MedicineMatcher.from_arrays(saved["matcher"])
+        text = " ".join(str(name) for name in df["brand_name"].tolist()[:30])
+        indexes_ok = (
+            all(np.array_equal(brand.prefix(q), indexes["brand"].prefix(q)) for q in ["d", "Cro", "pan", "x"])
+            and all(np.array_equal(ngrams.contains(q), indexes["brand_ngrams"].contains(q)) for q in ["o", "cin", "AZEE", "ésó"])
+            and all(np.array_equal(groups.alternatives(salt), indexes["generic_groups"].alternatives(salt))
+                    for salt in df["generic_name"].dropna().unique().tolist())
+            and [interactions.data(row) for row in range(len(df))] == [indexes["interactions"].data(row) for row in range(len(df))]
+            and matcher.match(text) == indexes["matcher"].match(text)
+            and isinstance(saved["brand"]["rows"], np.ndarray) and not saved["brand"]["rows"].flags.writeable
+        )
+        print(f"   {'✅' if indexes_ok else '❌'} {len(saved)} memory-mapped indexes answer like the built ones")
+    
+    ok = table_ok and indexes_ok
+    assert ok, "Snapshot did not load back what was saved"
+    return ok
+
 def main():
     """Run all tests"""
     print("\n")
@@ -152,7 +504,14 @@ def main():
         "Dependencies": test_dependencies(),
         "Tesseract OCR": test_tesseract(),
         "Database Loading": test_database_loading(),
-        "API Setup": test_api_endpoints()
+        "API Setup": test_api_endpoints(),
+        "Price Cache": test_price_cache(),
+        "Upstream Circuit Breaker": test_upstream_blocking(),
+        "Drugs Sample": test_drugs_sample(),
+        "OCR Cache": test_ocr_cache(),
+        "Fuzzy Index": test_fuzzy_index(),
+        "Drug Indexes": test_drug_indexes(),
+        "Snapshot Round Trip": test_snapshot_round_trip()
     }
     
     print("\n" + "="*50)
@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import re
 from pathlib import Path
@@ -218,6 +219,60 @@ def hindi_name_for(row):
     return HINDI_HINTS.get(ai, "")
 
 
+# Columnar versions of the row functions above, used by main(); each gives exactly
+# what df.apply(<row function>, axis=1) gives, with .str/.map/np.select instead of per-row Python
+
+def as_text(col: pd.Series) -> pd.Series:
+    # str() of every value, as the f-strings above see it ('nan' for missing)
+    return col.map(str)
+
+
+def active_key(df: pd.DataFrame) -> pd.Series:
+    return as_text(df["active_ingredient"]).str.strip()
+
+
+def strength_column(df: pd.DataFrame) -> pd.Series:
+    text = as_text(df["brand_name"]) + " " + as_text(df["generic_name"]) + " " + as_text(df["active_ingredient"])
+    s = text.str.extract(STRENGTH_PAT, expand=False).str.upper().str.replace(" ", "", regex=False)
+    s = s.where(~s.str.endswith("K", na=False), s.str[:-1] + ",000 IU")
+    # Fallbacks: a bare number (IU when the text mentions IU/K, else mg)
+    num = text.str.extract(r"\b(\d+\.\d+|\d+)(?:\s?mg)?\b", flags=re.I, expand=False)
+    nm = text.str.extract(NUM_PAT)
+    iu = nm[0] + np.where(nm[1].notna(), ",000 IU", " IU")
+    fallback = (num + " mg").where(~text.str.contains(r"IU|K", flags=re.I, regex=True), iu).where(num.notna())
+    return s.fillna(fallback).fillna("Unknown").astype(object)
+
+
+def dosage_form_column(df: pd.DataFrame) -> pd.Series:
+    text = (as_text(df["brand_name"]) + " " + as_text(df["use_case"])).str.lower()
+    conditions = [text.str.contains(key.lower(), regex=False) for key, _ in DOSAGE_FORMS]
+    return pd.Series(np.select(conditions, [form for _, form in DOSAGE_FORMS], "Tablet"), index=df.index, dtype=object)
+
+
+def schedule_column(df: pd.DataFrame) -> pd.Series:
+    ai = active_key(df)
+    return pd.Series(np.select([ai.isin(H1_ANTIBIOTICS), ~ai.isin(OTC_SET)], ["H1", "H"], "OTC"), index=df.index, dtype=object)
+
+
+def age_group_column(df: pd.DataFrame) -> pd.Series:
+    form = df["dosage_form"]
+    conditions = [form.isin(["Syrup", "Drops", "Suspension", "Sachet"]), form.isin(["Inhaler", "Nasal Spray"])]
+    return pd.Series(np.select(conditions, ["pediatric", "both"], "adult"), index=df.index, dtype=object)
+
+
+def class_column(df: pd.DataFrame) -> pd.Series:
+    # First matching rule wins, as in map_class; NaN where none matches
+    text = as_text(df["brand_name"]) + " " + as_text(df["generic_name"]) + " " + as_text(df["active_ingredient"])
+    conditions = [text.str.contains(rx, regex=True) for rx, _ in CLASS_RULES]
+    classes = pd.Series(np.select(conditions, [cname for _, cname in CLASS_RULES], ""), index=df.index, dtype=object)
+    return classes.where(np.logical_or.reduce(conditions))
+
+
+def advice_column(df: pd.DataFrame, by_active: dict, by_class: dict, default: str) -> pd.Series:
+    # interactions_for / contraindications_for: active ingredient override, else class text, else default
+    return active_key(df).map(by_active).fillna(df["drug_class"].map(by_class)).fillna(default).astype(object)
+
+
 def alt_brand_suggestions(df):
     # Precompute sorted alternatives by active_ingredient and price
     grouped = {}
@@ -338,17 +393,18 @@ def main():
     # Coerce price
     df["price"] = pd.to_numeric(df["price"], errors="coerce").fillna(0)
     # Normalize manufacturers
-    df["manufacturer"] = df["manufacturer"].apply(normalize_mfr)
-    # Infer new fields
-    df["strength"] = df.apply(infer_strength, axis=1)
-    df["dosage_form"] = df.apply(infer_dosage_form, axis=1)
-    df["is_otc"] = df.apply(is_otc, axis=1)
-    df["schedule"] = df.apply(schedule_flag, axis=1)
-    df["age_group"] = df.apply(age_group, axis=1)
-    df["drug_class"] = df.apply(map_class, axis=1)
-    df["interactions"] = df.apply(interactions_for, axis=1)
-    df["contraindications"] = df.apply(contraindications_for, axis=1)
-    df["hindi_name"] = df.apply(hindi_name_for, axis=1)
+    manufacturer = as_text(df["manufacturer"]).str.strip()
+    df["manufacturer"] = manufacturer.map(MANUFACTURER_NORMALIZE).fillna(manufacturer).astype(object)
+    # Infer new fields (columnar; same results as the row functions)
+    df["strength"] = strength_column(df)
+    df["dosage_form"] = dosage_form_column(df)
+    df["is_otc"] = active_key(df).isin(OTC_SET)
+    df["schedule"] = schedule_column(df)
+    df["age_group"] = age_group_column(df)
+    df["drug_class"] = class_column(df)
+    df["interactions"] = advice_column(df, ACTIVE_INTERACTIONS, INTERACTION_MAP, "Consult your doctor; check for interactions.")
+    df["contraindications"] = advice_column(df, ACTIVE_CONTRA, CONTRA_MAP, "Contraindications depend on patient condition; seek medical advice.")
+    df["hindi_name"] = active_key(df).map(HINDI_HINTS).fillna("").astype(object)
 
     # Synthesize generic/affordable options
     synth = synthesize_generics(df)
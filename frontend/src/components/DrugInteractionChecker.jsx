@@ -1,12 +1,15 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import { motion, AnimatePresence } from 'framer-motion'
 import { AlertTriangle, Info, CheckCircle, X, Plus, Trash2, Shield, AlertCircle } from 'lucide-react'
+import axios from 'axios'
+import { API_BASE_URL } from '../config'
 
 const DrugInteractionChecker = ({ currentMedicines = [] }) => {
   const [medicines, setMedicines] = useState(currentMedicines)
   const [newMedicine, setNewMedicine] = useState('')
   const [interactions, setInteractions] = useState([])
   const [showWarning, setShowWarning] = useState(false)
+  const latestCheck = useRef(0)  // Only the newest /interactions/check response may update the list
 
   // Enhanced interaction database with real-world drug interactions
   const interactionDatabase = {
@@ -162,7 +165,8 @@ const DrugInteractionChecker = ({ currentMedicines = [] }) => {
     checkInteractions()
   }, [medicines])
 
-  const checkInteractions = () => {
+  const checkInteractions = async () => {
+    const checkId = ++latestCheck.current
     const foundInteractions = []
     const normalizedMeds = medicines.map(m => m.toLowerCase().trim())
 
@@ -209,6 +213,22 @@ const DrugInteractionChecker = ({ currentMedicines = [] }) => {
 
     setInteractions(foundInteractions)
     setShowWarning(foundInteractions.some(int => int.severity === 'critical'))
+
+    // Add what the server-side checker finds for pairs the list above does not cover
+    if (medicines.length < 2) return
+    try {
+      const response = await axios.post(`${API_BASE_URL}/interactions/check`, { medicines })
+      if (checkId !== latestCheck.current || !response.data.success) return
+      const covered = new Set(foundInteractions.map(int => [...int.medicines].sort().join('|')))
+      const serverInteractions = response.data.interactions.filter(
+        int => !covered.has([...int.medicines].sort().join('|'))
+      )
+      const allInteractions = [...foundInteractions, ...serverInteractions]
+      setInteractions(allInteractions)
+      setShowWarning(allInteractions.some(int => int.severity === 'critical'))
+    } catch (error) {
+      console.error('Interaction check error:', error)
+    }
   }
 
   const addMedicine = () => {
@@ -60,18 +60,10 @@ const SearchSection = ({ onSearchResults, initialQuery = '', triggerSearch = fal
     const timer = setTimeout(async () => {
       try {
         const response = await axios.get(
-          `${API_BASE_URL}/search?query=${encodeURIComponent(query)}`
+          `${API_BASE_URL}/suggest?q=${encodeURIComponent(query)}&limit=5`
         )
-        if (response.data.success && response.data.results) {
-          // Get unique suggestions
-          const uniqueSuggestions = response.data.results
-            .slice(0, 5)
-            .map(med => ({
-              brand_name: med.brand_name,
-              generic_name: med.generic_name,
-              active_ingredient: med.active_ingredient
-            }))
-          setSuggestions(uniqueSuggestions)
+        if (response.data.success) {
+          setSuggestions(response.data.suggestions)
         }
       } catch (error) {
         console.error('Suggestion fetch error:', error)
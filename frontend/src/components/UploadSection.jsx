@@ -34,15 +34,12 @@ const UploadSection = ({ onUploadComplete, isLoading, setIsLoading }) => {
       if (response.data.success && response.data.detected_medicines && response.data.detected_medicines.length > 0) {
         console.log(`✅ Found ${response.data.detected_medicines.length} medicines`)
         
-        // Fetch detailed drug information
-        const medicinePromises = response.data.detected_medicines.map(med =>
-          axios.get(`${API_BASE_URL}/drugs?medicine_name=${encodeURIComponent(med)}`)
-        )
-        
-        const results = await Promise.all(medicinePromises)
-        const allResults = results
-          .filter(r => r.data.success)
-          .flatMap(r => r.data.results)
+        // Fetch detailed drug information for all medicines in one request
+        const resolved = await axios.post(`${API_BASE_URL}/drugs/batch`, {
+          medicine_names: response.data.detected_medicines,
+          include_prices: false  // Not shown here; each price lookup would hit the pharmacy sites
+        })
+        const allResults = resolved.data.success ? resolved.data.results : []
 
         console.log('📊 Detailed results:', allResults)
 